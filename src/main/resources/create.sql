@@ -2,15 +2,28 @@ CREATE TABLE Caregivers (
     Username varchar(255),
     Salt BINARY(16),
     Hash BINARY(16),
+    HashParams varchar(64),
     PRIMARY KEY (Username)
 );
 
+-- One row per open slot: the caregiver takes Capacity more appointments at SlotTime on that date.
+-- A slot at 00:00 with capacity 1 is the whole day. Rows are deleted when their capacity runs out.
 CREATE TABLE Availabilities (
     Time date,
     Username varchar(255) REFERENCES Caregivers,
-    PRIMARY KEY (Time, Username)
+    SlotTime time(0) NOT NULL DEFAULT '00:00',
+    Capacity smallint NOT NULL DEFAULT 1 CHECK (Capacity >= 0),
+    PRIMARY KEY (Time, Username, SlotTime)
 );
 
+-- A caregiver's day is either the whole day or time-of-day slots, never both (see migrations/007)
+EXEC('CREATE TRIGGER TR_Availabilities_OneKindOfSlot ON Availabilities AFTER INSERT AS
+      SET NOCOUNT ON;
+      IF EXISTS (SELECT 1 FROM Availabilities a JOIN inserted i ON a.Time = i.Time AND a.Username = i.Username
+                 WHERE CASE WHEN a.SlotTime = ''00:00'' THEN 1 ELSE 0 END
+                       <> CASE WHEN i.SlotTime = ''00:00'' THEN 1 ELSE 0 END)
+          THROW 50015, ''The whole day and time-of-day slots cannot be mixed'', 1;');
+
 CREATE TABLE Vaccines (
     Name varchar(255),
     Doses int,
@@ -21,6 +34,7 @@ CREATE TABLE Patients(
   Username varchar(255),
   Salt BINARY(16),
   Hash BINARY(16),
+  HashParams varchar(64),
   PRIMARY KEY (Username)
 );
 
@@ -30,5 +44,42 @@ CREATE TABLE Appointment(
   Cusername varchar(255) REFERENCES Caregivers(Username),
   Pusername varchar(255) REFERENCES Patients(Username),
   Vname varchar(255) REFERENCES Vaccines(Name),
+  SlotTime time(0),
   PRIMARY KEY (Id)
 );
+
+CREATE INDEX IX_Appointment_Pusername ON Appointment (Pusername, Id) INCLUDE (Time, SlotTime, Cusername, Vname);
+
+CREATE INDEX IX_Appointment_Cusername ON Appointment (Cusername, Id) INCLUDE (Time, SlotTime, Pusername, Vname);
+
+-- Idempotency keys of the journaled commands already applied, see service/CommandJournal.py
+CREATE TABLE AppliedCommands (
+    Id varchar(64),
+    AppliedAt datetime2 NOT NULL DEFAULT SYSUTCDATETIME(),
+    PRIMARY KEY (Id)
+);
+
+-- One row per scheduler process: the last time.time() it wrote, read back from the read replicas to
+-- tell how far they have caught up, see db/ReplicaRouter.py
+CREATE TABLE ReplicaHeartbeat (
+    Node varchar(64),
+    Beat float NOT NULL,
+    PRIMARY KEY (Node)
+);
+
+-- Appointments per vaccine and day, kept up to date incrementally for dose_report, see
+-- service/DoseForecast.py; LastId is the last Appointment Id summarized into it
+CREATE TABLE DailyDoseUsage (
+    Vname varchar(255),
+    Time date,
+    Booked int NOT NULL,
+    PRIMARY KEY (Vname, Time)
+);
+
+CREATE TABLE DoseUsageWatermark (
+    Id int CHECK (Id = 1),
+    LastId int NOT NULL,
+    PRIMARY KEY (Id)
+);
+
+INSERT INTO DoseUsageWatermark (Id, LastId) VALUES (1, 0);
@@ -0,0 +1,87 @@
+-- The schema of create.sql (with every migration applied) for the SQLite backend, see db/Backend.py.
+-- Run on every start, so each statement must be idempotent.
+CREATE TABLE IF NOT EXISTS Caregivers (
+    Username varchar(255),
+    Salt BLOB,
+    Hash BLOB,
+    HashParams varchar(64),
+    PRIMARY KEY (Username)
+);
+
+-- One row per open slot: the caregiver takes Capacity more appointments at SlotTime (HH:MM) on that date.
+-- A slot at 00:00 with capacity 1 is the whole day. Rows are deleted when their capacity runs out.
+CREATE TABLE IF NOT EXISTS Availabilities (
+    Time date,
+    Username varchar(255) REFERENCES Caregivers,
+    SlotTime time NOT NULL DEFAULT '00:00',
+    Capacity smallint NOT NULL DEFAULT 1 CHECK (Capacity >= 0),
+    PRIMARY KEY (Time, Username, SlotTime)
+) WITHOUT ROWID;
+
+-- A caregiver's day is either the whole day or time-of-day slots, never both
+CREATE TRIGGER IF NOT EXISTS TR_Availabilities_OneKindOfSlot BEFORE INSERT ON Availabilities
+WHEN EXISTS (SELECT 1 FROM Availabilities WHERE Time = NEW.Time AND Username = NEW.Username
+             AND (SlotTime = '00:00') <> (NEW.SlotTime = '00:00'))
+BEGIN
+    SELECT RAISE(ABORT, 'The whole day and time-of-day slots cannot be mixed');
+END;
+
+CREATE TABLE IF NOT EXISTS Vaccines (
+    Name varchar(255),
+    Doses int,
+    PRIMARY KEY (Name)
+);
+
+CREATE TABLE IF NOT EXISTS Patients (
+    Username varchar(255),
+    Salt BLOB,
+    Hash BLOB,
+    HashParams varchar(64),
+    PRIMARY KEY (Username)
+);
+
+-- AUTOINCREMENT so Ids are never reused, like an identity column
+CREATE TABLE IF NOT EXISTS Appointment (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Time date,
+    Cusername varchar(255) REFERENCES Caregivers(Username),
+    Pusername varchar(255) REFERENCES Patients(Username),
+    Vname varchar(255) REFERENCES Vaccines(Name),
+    SlotTime time
+);
+
+CREATE INDEX IF NOT EXISTS IX_Appointment_Pusername ON Appointment (Pusername, Id);
+
+CREATE INDEX IF NOT EXISTS IX_Appointment_Cusername ON Appointment (Cusername, Id);
+
+-- Idempotency keys of the journaled commands already applied, see service/CommandJournal.py
+CREATE TABLE IF NOT EXISTS AppliedCommands (
+    Id varchar(64),
+    AppliedAt datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (Id)
+) WITHOUT ROWID;
+
+-- One row per scheduler process: the last time.time() it wrote, read back from the read replicas to
+-- tell how far they have caught up, see db/ReplicaRouter.py
+CREATE TABLE IF NOT EXISTS ReplicaHeartbeat (
+    Node varchar(64),
+    Beat float NOT NULL,
+    PRIMARY KEY (Node)
+) WITHOUT ROWID;
+
+-- Appointments per vaccine and day, kept up to date incrementally for dose_report, see
+-- service/DoseForecast.py; LastId is the last Appointment Id summarized into it
+CREATE TABLE IF NOT EXISTS DailyDoseUsage (
+    Vname varchar(255),
+    Time date,
+    Booked int NOT NULL,
+    PRIMARY KEY (Vname, Time)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS DoseUsageWatermark (
+    Id int CHECK (Id = 1),
+    LastId int NOT NULL,
+    PRIMARY KEY (Id)
+);
+
+INSERT OR IGNORE INTO DoseUsageWatermark (Id, LastId) VALUES (1, 0);
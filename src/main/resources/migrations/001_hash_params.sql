@@ -0,0 +1,6 @@
+-- Per-record password hash parameters (see Util.hash_params); NULL means the original PBKDF2 settings.
+IF COL_LENGTH('Caregivers', 'HashParams') IS NULL
+    ALTER TABLE Caregivers ADD HashParams varchar(64);
+
+IF COL_LENGTH('Patients', 'HashParams') IS NULL
+    ALTER TABLE Patients ADD HashParams varchar(64);
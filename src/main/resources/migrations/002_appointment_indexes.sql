@@ -0,0 +1,10 @@
+-- Covering indexes for the per-user appointment lookups in show_appointments
+-- (WHERE Pusername / Cusername = ... AND Id > ... ORDER BY Id). Id is the clustered key and is carried
+-- in every nonclustered index, so (user, Id) gives an ordered seek without a sort.
+-- Availabilities needs no index: its (Time, Username) primary key already serves
+-- WHERE Time = ... ORDER BY Username and the per-date range scans.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Appointment_Pusername' AND object_id = OBJECT_ID('Appointment'))
+    CREATE INDEX IX_Appointment_Pusername ON Appointment (Pusername, Id) INCLUDE (Time, Cusername, Vname);
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Appointment_Cusername' AND object_id = OBJECT_ID('Appointment'))
+    CREATE INDEX IX_Appointment_Cusername ON Appointment (Cusername, Id) INCLUDE (Time, Pusername, Vname);
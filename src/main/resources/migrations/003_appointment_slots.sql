@@ -0,0 +1,39 @@
+-- Time-of-day slots with a remaining-capacity counter (see create.sql). Existing availability becomes
+-- the whole-day slot (00:00, capacity 1) and existing appointments keep a NULL SlotTime.
+-- Statements naming the new columns go through EXEC so the batch compiles before they exist.
+IF COL_LENGTH('Availabilities', 'SlotTime') IS NULL
+    ALTER TABLE Availabilities ADD
+        SlotTime time(0) NOT NULL CONSTRAINT DF_Availabilities_SlotTime DEFAULT '00:00',
+        Capacity smallint NOT NULL CONSTRAINT DF_Availabilities_Capacity DEFAULT 1;
+
+IF NOT EXISTS (SELECT 1 FROM sys.check_constraints WHERE parent_object_id = OBJECT_ID('Availabilities')
+               AND definition LIKE '%Capacity%')
+    EXEC('ALTER TABLE Availabilities ADD CONSTRAINT CK_Availabilities_Capacity CHECK (Capacity >= 0)');
+
+-- the primary key grows from (Time, Username) to (Time, Username, SlotTime)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes i
+               JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+               WHERE i.object_id = OBJECT_ID('Availabilities') AND i.is_primary_key = 1
+                 AND COL_NAME(ic.object_id, ic.column_id) = 'SlotTime')
+BEGIN
+    DECLARE @pk sysname = (SELECT name FROM sys.key_constraints
+                           WHERE parent_object_id = OBJECT_ID('Availabilities') AND type = 'PK');
+    EXEC('ALTER TABLE Availabilities DROP CONSTRAINT ' + @pk);
+    EXEC('ALTER TABLE Availabilities ADD PRIMARY KEY (Time, Username, SlotTime)');
+END
+
+IF COL_LENGTH('Appointment', 'SlotTime') IS NULL
+    ALTER TABLE Appointment ADD SlotTime time(0);
+
+-- keep the show_appointments indexes covering
+IF NOT EXISTS (SELECT 1 FROM sys.index_columns ic JOIN sys.indexes i ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+               WHERE i.name = 'IX_Appointment_Pusername' AND i.object_id = OBJECT_ID('Appointment')
+                 AND COL_NAME(ic.object_id, ic.column_id) = 'SlotTime')
+    EXEC('CREATE INDEX IX_Appointment_Pusername ON Appointment (Pusername, Id) INCLUDE (Time, SlotTime, Cusername, Vname)
+          WITH (DROP_EXISTING = ON)');
+
+IF NOT EXISTS (SELECT 1 FROM sys.index_columns ic JOIN sys.indexes i ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+               WHERE i.name = 'IX_Appointment_Cusername' AND i.object_id = OBJECT_ID('Appointment')
+                 AND COL_NAME(ic.object_id, ic.column_id) = 'SlotTime')
+    EXEC('CREATE INDEX IX_Appointment_Cusername ON Appointment (Cusername, Id) INCLUDE (Time, SlotTime, Pusername, Vname)
+          WITH (DROP_EXISTING = ON)');
@@ -0,0 +1,8 @@
+-- Idempotency keys of the journaled commands already applied (see service/CommandJournal.py), written
+-- in the same transaction as their effects so a replayed command is skipped.
+IF OBJECT_ID('AppliedCommands') IS NULL
+    CREATE TABLE AppliedCommands (
+        Id varchar(64),
+        AppliedAt datetime2 NOT NULL DEFAULT SYSUTCDATETIME(),
+        PRIMARY KEY (Id)
+    );
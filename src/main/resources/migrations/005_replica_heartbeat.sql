@@ -0,0 +1,8 @@
+-- Heartbeats the scheduler processes write to the primary and read back from the read replicas to
+-- tell how far they have caught up (see db/ReplicaRouter.py).
+IF OBJECT_ID('ReplicaHeartbeat') IS NULL
+    CREATE TABLE ReplicaHeartbeat (
+        Node varchar(64),
+        Beat float NOT NULL,
+        PRIMARY KEY (Node)
+    );
@@ -0,0 +1,20 @@
+-- Appointments per vaccine and day for dose_report (see service/DoseForecast.py), and the last
+-- Appointment Id summarized into them. The watermark starts at 0, so the first report summarizes
+-- the appointments booked before this migration.
+IF OBJECT_ID('DailyDoseUsage') IS NULL
+    CREATE TABLE DailyDoseUsage (
+        Vname varchar(255),
+        Time date,
+        Booked int NOT NULL,
+        PRIMARY KEY (Vname, Time)
+    );
+
+IF OBJECT_ID('DoseUsageWatermark') IS NULL
+    CREATE TABLE DoseUsageWatermark (
+        Id int CHECK (Id = 1),
+        LastId int NOT NULL,
+        PRIMARY KEY (Id)
+    );
+
+IF NOT EXISTS (SELECT 1 FROM DoseUsageWatermark WHERE Id = 1)
+    INSERT INTO DoseUsageWatermark (Id, LastId) VALUES (1, 0);
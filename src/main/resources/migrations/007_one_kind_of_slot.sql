@@ -0,0 +1,10 @@
+-- A caregiver's day is either the whole day (the 00:00 slot) or time-of-day slots, never both: an insert
+-- that would mix them is rolled back. Days that already mix them are left as they are.
+-- CREATE TRIGGER must start its batch, so it goes through EXEC.
+IF OBJECT_ID('TR_Availabilities_OneKindOfSlot') IS NULL
+    EXEC('CREATE TRIGGER TR_Availabilities_OneKindOfSlot ON Availabilities AFTER INSERT AS
+          SET NOCOUNT ON;
+          IF EXISTS (SELECT 1 FROM Availabilities a JOIN inserted i ON a.Time = i.Time AND a.Username = i.Username
+                     WHERE CASE WHEN a.SlotTime = ''00:00'' THEN 1 ELSE 0 END
+                           <> CASE WHEN i.SlotTime = ''00:00'' THEN 1 ELSE 0 END)
+              THROW 50015, ''The whole day and time-of-day slots cannot be mixed'', 1;');
@@ -0,0 +1,71 @@
+'''
+Throughput benchmark for the batch reservation solver (service/BatchAllocator.allocate).
+Generates synthetic requests for 10k, 100k and 1M patients (or the sizes given) against enough caregiver
+slots (8 hourly slots of 2 appointments per caregiver and day) over a 14-day window, times the in-memory assignment, and reports patients/sec plus how evenly
+the appointments were spread over caregivers. The solve does no I/O, so no database is needed.
+
+usage (from src/main/scheduler): python bench/AllocatorBench.py [patients ...] [--json]
+'''
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import datetime
+import json
+import random
+import time
+from collections import Counter
+
+from service.BatchAllocator import BatchAllocator
+
+
+DAYS = 14
+VACCINES = ["Pfizer", "Moderna", "Janssen"]
+SLOTS = 8
+CAPACITY = 2
+
+
+def synthetic(patients, seed=42):
+    rng = random.Random(seed)
+    first = datetime.date(2030, 1, 1)
+    dates = [first + datetime.timedelta(days=i) for i in range(DAYS)]
+    # about 10% more appointments than patients, so most requests can be met; each caregiver offers
+    # SLOTS slots a day taking CAPACITY appointments each
+    caregivers = max(1, patients * 11 // 10 // DAYS // (SLOTS * CAPACITY))
+    availability = {d: [("c" + str(i), "{:02d}:00".format(9 + s), CAPACITY)
+                        for i in range(caregivers) if rng.random() < 0.9 or i == 0 for s in range(SLOTS)]
+                    for d in dates}
+    doses = {v: patients // len(VACCINES) + 1 for v in VACCINES}
+    requests = [("p" + str(i), rng.choice(VACCINES), rng.sample(dates, 3)) for i in range(patients)]
+    return requests, availability, doses
+
+
+def measure(patients):
+    requests, availability, doses = synthetic(patients)
+    start = time.perf_counter()
+    assignments, rejected = BatchAllocator.allocate(requests, availability, doses)
+    elapsed = time.perf_counter() - start
+    load = Counter(caregiver for _, _, _, caregiver, _ in assignments)
+    return {
+        "patients": patients,
+        "seconds": round(elapsed, 3),
+        "patients_per_sec": round(patients / elapsed, 1),
+        "booked": len(assignments),
+        "rejected": len(rejected),
+        "caregivers": len({c for rows in availability.values() for c, _, _ in rows}),
+        "min_load": min(load.values()) if load else 0,
+        "max_load": max(load.values()) if load else 0,
+    }
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:] if a != "--json"] or [10000, 100000, 1000000]
+    results = [measure(n) for n in sizes]
+    if "--json" in sys.argv:
+        print(json.dumps(results))
+    else:
+        print("{:>10}{:>10}{:>14}{:>10}{:>10}{:>12}{:>10}".format(
+            "patients", "seconds", "patients/sec", "booked", "rejected", "caregivers", "load"))
+        for r in results:
+            print("{:>10}{:>10}{:>14}{:>10}{:>10}{:>12}{:>10}".format(
+                r["patients"], r["seconds"], r["patients_per_sec"], r["booked"], r["rejected"], r["caregivers"],
+                str(r["min_load"]) + "-" + str(r["max_load"])))
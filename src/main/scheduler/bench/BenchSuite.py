@@ -0,0 +1,211 @@
+'''
+Reproducible benchmark suite for the scheduler commands.
+Generates a dataset with bench/DataGen.py into a scratch SQLite database (a fresh file under the system
+temp directory, removed at exit, unless DBPath is set; DBBackend is always sqlite) and runs each workload as the same
+scripted sequence of commands through Commands.run_command: login, search, reserve, show_appointments
+and add_doses, <operations> commands each, spread over <threads> concurrent sessions.
+Reports per workload the throughput and latency percentiles; --json prints the report as JSON,
+--out <file> also writes it there, and --compare <file> checks it against an earlier report, exiting
+non-zero when a workload's p50 or throughput got worse by more than BenchTolerance percent (default 20).
+--scale <n> multiplies the dataset size.
+
+usage (from src/main/scheduler):
+    python bench/BenchSuite.py [operations] [threads] [--scale n] [--seed n] [--json] [--out file] [--compare file]
+'''
+import sys
+import os
+import atexit
+import shutil
+import tempfile
+# configured before the scheduler modules read their settings
+os.environ["DBBackend"] = "sqlite"
+if "DBPath" not in os.environ:
+    scratch = tempfile.mkdtemp(prefix="scheduler-bench-")
+    atexit.register(shutil.rmtree, scratch, True)
+    os.environ["DBPath"] = os.path.join(scratch, "bench.db")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+
+from service.Session import Session
+from service.Commands import run_command
+from bench.DataGen import generate, PASSWORD
+from bench.LoadGen import percentile
+
+
+WORKLOADS = ["login", "search", "reserve", "show_appointments", "add_doses"]
+
+
+# The scripted commands of a workload for one session: (setup commands, timed commands, expected output).
+# A timed command counts as failed if its output reports an error or doesn't start with an expected prefix.
+def script(workload, dataset, rng, operations):
+    dates = [d.strftime("%m-%d-%Y") for d in dataset.dates]
+    patient = rng.choice(dataset.patients)
+    caregiver = rng.choice(dataset.caregivers)
+    if workload == "login":
+        # logging out in between is part of the setup of the next login, so it is not timed
+        timed = []
+        for _ in range(operations):
+            timed.append(["login_patient", rng.choice(dataset.patients), PASSWORD])
+            timed.append(["logout"])
+        return [], timed, ("Logged in as", "Successfully logged out")
+    if workload == "search":
+        return ([["login_patient", patient, PASSWORD]],
+                [["search_caregiver_schedule", rng.choice(dates)] for _ in range(operations)],
+                ("Caregiver",))
+    if workload == "reserve":
+        return ([["login_patient", patient, PASSWORD]],
+                [["reserve", rng.choice(dates), rng.choice(dataset.vaccines)] for _ in range(operations)],
+                ("Appointment ID", "No Caregiver is available!"))
+    if workload == "show_appointments":
+        return ([["login_caregiver", caregiver, PASSWORD]],
+                [["show_appointments"] for _ in range(operations)],
+                ("",))
+    if workload == "add_doses":
+        return ([["login_caregiver", caregiver, PASSWORD]],
+                [["add_doses", rng.choice(dataset.vaccines), str(rng.randint(1, 100))] for _ in range(operations)],
+                ("Doses updated!",))
+    raise ValueError("Unknown workload: " + workload)
+
+
+def run_workload(workload, dataset, operations, threads, seed):
+    rng = random.Random(workload + str(seed))
+    per_session = [operations // threads + (1 if i < operations % threads else 0) for i in range(threads)]
+    scripts = [script(workload, dataset, rng, n) for n in per_session]
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def session_thread(setup, timed, expected):
+        session = Session(out=[])
+        for tokens in setup:
+            run_command(session, tokens)
+        session.drain()
+        samples = []
+        failed = 0
+        for tokens in timed:
+            start = time.perf_counter()
+            run_command(session, tokens)
+            elapsed = time.perf_counter() - start
+            if tokens[0] != "logout":
+                samples.append(elapsed)
+            output = session.drain()
+            if "Error" in output or not output.startswith(expected):
+                failed += 1
+        with lock:
+            latencies.extend(samples)
+            failures.append(failed)
+
+    workers = [threading.Thread(target=session_thread, args=s) for s in scripts]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "operations": len(latencies),
+        "seconds": round(elapsed, 3),
+        "ops_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "failed": sum(failures),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(operations, threads, scale, seed):
+    sizes = {"patients": 1000 * scale, "caregivers": 50 * scale, "days": 30, "vaccines": 5,
+             "appointments": 2000 * scale}
+    start = time.perf_counter()
+    dataset = generate(seed=seed, **sizes)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "backend": "sqlite",
+        "seed": seed,
+        "dataset": sizes,
+        "seed_seconds": round(time.perf_counter() - start, 3),
+        "operations": operations,
+        "threads": threads,
+        "workloads": {},
+    }
+    for workload in WORKLOADS:
+        report["workloads"][workload] = run_workload(workload, dataset, operations, threads, seed)
+    return report
+
+
+# Workloads of report that are worse than in baseline by more than tolerance percent, as messages
+def compare(report, baseline, tolerance):
+    regressions = []
+    for workload, stats in report["workloads"].items():
+        before = baseline.get("workloads", {}).get(workload)
+        if before is None:
+            continue
+        if before["p50_ms"] > 0 and stats["p50_ms"] > before["p50_ms"] * (1 + tolerance / 100):
+            regressions.append("{}: p50 {} ms -> {} ms".format(workload, before["p50_ms"], stats["p50_ms"]))
+        if stats["ops_per_sec"] < before["ops_per_sec"] * (1 - tolerance / 100):
+            regressions.append("{}: {} ops/s -> {} ops/s".format(workload, before["ops_per_sec"], stats["ops_per_sec"]))
+    return regressions
+
+
+def print_report(report):
+    print("commit {}, {} operations per workload on {} threads, dataset {}".format(
+        report["commit"], report["operations"], report["threads"], report["dataset"]))
+    print("{:<20}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}{:>8}".format(
+        "workload", "ops", "ops/s", "p50 ms", "p90 ms", "p99 ms", "max ms", "failed"))
+    for workload, stats in report["workloads"].items():
+        print("{:<20}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}{:>8}".format(
+            workload, stats["operations"], stats["ops_per_sec"], stats["p50_ms"], stats["p90_ms"], stats["p99_ms"],
+            stats["max_ms"], stats["failed"]))
+
+
+def option(name, default=None):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+if __name__ == "__main__":
+    args = []
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] in ("--scale", "--seed", "--out", "--compare"):
+            i += 2
+            continue
+        if sys.argv[i] != "--json":
+            args.append(int(sys.argv[i]))
+        i += 1
+    operations = args[0] if len(args) > 0 else 500
+    threads = args[1] if len(args) > 1 else 1
+
+    report = run(operations, threads, int(option("--scale", "1")), int(option("--seed", "0")))
+    if "--json" in sys.argv:
+        print(json.dumps(report))
+    else:
+        print_report(report)
+    if option("--out") is not None:
+        with open(option("--out"), "w") as out:
+            json.dump(report, out, indent=2)
+    if option("--compare") is not None:
+        with open(option("--compare")) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(report, baseline, float(os.getenv("BenchTolerance", "20")))
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,116 @@
+'''
+Contention benchmark for the caregiver selection strategies (model/CaregiverSelection.py).
+For each strategy, seeds <caregivers> caregivers free on each of <days> dates, then starts <reservers>
+concurrent reservations spread over those dates and reports throughput, deadlock retries, reservations
+that found no caregiver although slots were left, and how evenly bookings spread over caregivers.
+
+usage (from src/main/scheduler): python bench/ContentionBench.py [reservers] [caregivers] [days] [--json]
+'''
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import datetime
+import json
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+
+from db.ConnectionManager import ConnectionManager
+from model.Appointment import Appointment
+from model.CaregiverSelection import CaregiverSelection
+from bench.ReserveStress import cleanup
+
+
+STRATEGIES = ["first", "random", "least_booked", "round_robin", "capacity"]
+
+
+def seed(prefix, vaccine_name, dates, reservers, caregivers):
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+    dummy = bytes(16)
+    try:
+        cursor.executemany("INSERT INTO Caregivers (Username, Salt, Hash) VALUES (%s, %s, %s)",
+                           [(f"{prefix}_c{i:04d}", dummy, dummy) for i in range(caregivers)])
+        cursor.executemany("INSERT INTO Patients (Username, Salt, Hash) VALUES (%s, %s, %s)",
+                           [(f"{prefix}_p{i:04d}", dummy, dummy) for i in range(reservers)])
+        cursor.executemany("INSERT INTO Availabilities (Time, Username) VALUES (%s, %s)",
+                           [(d, f"{prefix}_c{i:04d}") for d in dates for i in range(caregivers)])
+        cursor.execute("INSERT INTO Vaccines VALUES (%s, %d)", (vaccine_name, reservers))
+        conn.commit()
+    finally:
+        cm.close_connection()
+
+
+def run_strategy(name, reservers, caregivers, days):
+    prefix = "cont_" + uuid.uuid4().hex[:8]
+    vaccine_name = prefix + "_vax"
+    dates = [datetime.datetime(2098, 1, 5) + datetime.timedelta(days=i) for i in range(days)]
+    seed(prefix, vaccine_name, dates, reservers, caregivers)
+
+    outcomes = Counter()
+    booked = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(reservers)
+    retries_before = Appointment.deadlock_retries
+
+    def reserver(i):
+        appointment = Appointment(dates[i % days], vaccine_name, f"{prefix}_p{i:04d}",
+                                  selection=CaregiverSelection.named(name))
+        barrier.wait()
+        try:
+            outcome = appointment.reserve()
+        except Exception as e:
+            outcome = "error: " + type(e).__name__
+        with lock:
+            outcomes[outcome] += 1
+            if outcome == Appointment.RESERVED:
+                booked[appointment.get_caregiver_username()] += 1
+
+    try:
+        threads = [threading.Thread(target=reserver, args=(i,)) for i in range(reservers)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        cleanup(prefix, vaccine_name)
+
+    loads = [booked.get(f"{prefix}_c{i:04d}", 0) for i in range(caregivers)]
+    # every reservation should succeed when there are at least as many slots per date as reservers on it
+    expected = min(reservers, caregivers * days)
+    return {
+        "strategy": name,
+        "seconds": round(elapsed, 3),
+        "reservations_per_sec": round(reservers / elapsed, 1),
+        "reserved": outcomes[Appointment.RESERVED],
+        "missed": expected - outcomes[Appointment.RESERVED],
+        "deadlock_retries": Appointment.deadlock_retries - retries_before,
+        "caregivers_used": sum(1 for n in loads if n > 0),
+        "load_stdev": round(statistics.pstdev(loads), 3),
+        "errors": sum(n for o, n in outcomes.items() if o.startswith("error")),
+    }
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:] if a != "--json"]
+    reservers = args[0] if len(args) > 0 else 200
+    caregivers = args[1] if len(args) > 1 else 100
+    days = args[2] if len(args) > 2 else 2
+    os.environ.setdefault("PoolMaxSize", str(min(reservers, 64)))
+    os.environ.setdefault("CaregiverCapacity", str(reservers))
+
+    results = [run_strategy(name, reservers, caregivers, days) for name in STRATEGIES]
+    if "--json" in sys.argv:
+        print(json.dumps(results))
+    else:
+        print("{:<14}{:>9}{:>10}{:>10}{:>8}{:>9}{:>8}{:>8}".format(
+            "strategy", "seconds", "res/sec", "reserved", "missed", "retries", "used", "stdev"))
+        for r in results:
+            print("{:<14}{:>9}{:>10}{:>10}{:>8}{:>9}{:>8}{:>8}".format(
+                r["strategy"], r["seconds"], r["reservations_per_sec"], r["reserved"], r["missed"],
+                r["deadlock_retries"], r["caregivers_used"], r["load_stdev"]))
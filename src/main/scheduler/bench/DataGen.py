@@ -0,0 +1,107 @@
+'''
+Synthetic data generator for benchmarks.
+Seeds the configured database (see db/Backend.py; bench/BenchSuite.py points it at a scratch SQLite file)
+with <patients> patients and <caregivers> caregivers, every caregiver offering SLOTS on each of <days>
+dates from tomorrow, <vaccines> vaccines and <appointments> appointments already booked into those slots.
+The same seed always generates the same data. Every user's password is PASSWORD; they all share one salt,
+so seeding hashes it only once.
+
+usage (from src/main/scheduler): python bench/DataGen.py [patients] [caregivers] [days] [vaccines] [appointments] [seed]
+'''
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import datetime
+import random
+import time
+
+from db.ConnectionManager import ConnectionManager
+from db.UnitOfWork import UnitOfWork
+from model.Caregiver import Caregiver
+from model.Vaccine import Vaccine
+from util.Util import Util
+
+
+PASSWORD = "DataGen#2022"
+# each caregiver's slots on each date: every half hour from 9 to 5, two appointments each
+SLOTS = "09:00-17:00/30x2"
+DOSES = 1000000
+# rows per executemany, to keep the transaction's statements in manageable batches
+CHUNK = 5000
+
+
+class Dataset:
+    # the usernames, dates and vaccine names a generated database holds, for scripting workloads
+
+    def __init__(self, prefix, patients, caregivers, dates, vaccines):
+        self.prefix = prefix
+        self.patients = patients
+        self.caregivers = caregivers
+        self.dates = dates
+        self.vaccines = vaccines
+
+
+def generate(patients=1000, caregivers=50, days=30, vaccines=5, appointments=2000, seed=0, prefix="dg"):
+    rng = random.Random(seed)
+    first = datetime.date.today() + datetime.timedelta(days=1)
+    dates = [first + datetime.timedelta(days=i) for i in range(days)]
+    dataset = Dataset(prefix,
+                      [f"{prefix}_p{i:06d}" for i in range(patients)],
+                      [f"{prefix}_c{i:05d}" for i in range(caregivers)],
+                      dates,
+                      [f"{prefix}_vax{i:02d}" for i in range(vaccines)])
+
+    salt = Util.generate_salt()
+    params = Util.hash_params()
+    hash = Util.hash_many([(PASSWORD, salt)], params)[0]
+
+    # (date, caregiver, slot) -> capacity left, in a fixed order so the sample below is reproducible
+    capacity = {}
+    for d in dates:
+        for caregiver in dataset.caregivers:
+            for slot, slot_capacity in Util.expand_slots(SLOTS):
+                capacity[(d, caregiver, Util.format_time(slot))] = slot_capacity
+    places = [key for key, slot_capacity in capacity.items() for _ in range(slot_capacity)]
+    if appointments > len(places):
+        raise ValueError("Not enough slots for " + str(appointments) + " appointments")
+    booked = []
+    for d, caregiver, slot in rng.sample(places, appointments):
+        capacity[(d, caregiver, slot)] -= 1
+        booked.append((d, slot, caregiver, rng.choice(dataset.patients), rng.choice(dataset.vaccines)))
+    booked.sort()
+
+    with UnitOfWork() as work:
+        cursor = work.cursor()
+        if ConnectionManager.backend().name == "sqlite":
+            work.begin()
+        insert_chunked(cursor, "INSERT INTO Patients (Username, Salt, Hash, HashParams) VALUES (%s, %s, %s, %s)",
+                       [(username, salt, hash, params) for username in dataset.patients])
+        insert_chunked(cursor, "INSERT INTO Caregivers (Username, Salt, Hash, HashParams) VALUES (%s, %s, %s, %s)",
+                       [(username, salt, hash, params) for username in dataset.caregivers])
+        insert_chunked(cursor, "INSERT INTO Vaccines (Name, Doses) VALUES (%s, %d)",
+                       [(name, DOSES) for name in dataset.vaccines])
+        insert_chunked(cursor, "INSERT INTO Availabilities (Time, Username, SlotTime, Capacity) VALUES (%s, %s, %s, %d)",
+                       [key + (left,) for key, left in capacity.items() if left > 0])
+        insert_chunked(cursor, "INSERT INTO Appointment (Time, SlotTime, Cusername, Pusername, Vname) VALUES (%s, %s, %s, %s, %s)",
+                       booked)
+        work.commit()
+
+    Vaccine.cache.clear()
+    for d in dates:
+        Caregiver.invalidate_availability(d)
+    return dataset
+
+
+def insert_chunked(cursor, sql, rows):
+    for i in range(0, len(rows), CHUNK):
+        cursor.executemany(sql, rows[i:i + CHUNK])
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    names = ["patients", "caregivers", "days", "vaccines", "appointments", "seed"]
+    start = time.perf_counter()
+    dataset = generate(**dict(zip(names, args)))
+    print("Generated {} patients, {} caregivers, {} days, {} vaccines in {:.2f}s".format(
+        len(dataset.patients), len(dataset.caregivers), len(dataset.dates), len(dataset.vaccines),
+        time.perf_counter() - start))
@@ -0,0 +1,48 @@
+'''
+Password hashing microbenchmark.
+Runs Util.generate_hash on the shared hash pool with 1, 2, 4, ... workers up to the core count and
+reports hashes/sec overall and per core, for the configured parameters or the ones given.
+
+usage (from src/main/scheduler): python bench/HashBench.py [hash params, e.g. pbkdf2_sha256$100000 scrypt$16384$8$1]
+'''
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import time
+
+from util.Util import Util
+
+
+def measure(params, workers, hashes):
+    os.environ["HashWorkers"] = str(workers)
+    Util._executor = None
+    salt = Util.generate_salt()
+    # warm the pool up so worker start-up isn't timed
+    Util.hash_many([("Warmup1!", salt)] * workers, params)
+
+    start = time.perf_counter()
+    Util.hash_many([("Password1!", salt)] * hashes, params)
+    elapsed = time.perf_counter() - start
+    Util.hash_executor().shutdown()
+    return hashes / elapsed
+
+
+def run(param_sets):
+    cores = os.cpu_count() or 1
+    worker_counts = []
+    n = 1
+    while n < cores:
+        worker_counts.append(n)
+        n *= 2
+    worker_counts.append(cores)
+
+    print("executor: " + os.getenv("HashExecutor", "thread") + ", cores: " + str(cores))
+    print("{:<24}{:>8}{:>14}{:>16}".format("params", "workers", "hashes/sec", "hashes/sec/core"))
+    for params in param_sets:
+        for workers in worker_counts:
+            rate = measure(params, workers, hashes=max(8, workers * 8))
+            print("{:<24}{:>8}{:>14.1f}{:>16.1f}".format(params, workers, rate, rate / workers))
+
+
+if __name__ == "__main__":
+    run(sys.argv[1:] or [Util.hash_params()])
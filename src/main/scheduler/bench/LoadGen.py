@@ -0,0 +1,128 @@
+'''
+Load generator for the scheduler server (server/SchedulerServer.py).
+Sets up caregivers with availability and a vaccine with doses, then runs <clients> concurrent patient
+sessions, each replaying a weighted mix of search / reserve / show_appointments / re-login requests
+for <seconds>. Reports p50/p99 latency per operation and overall requests per second.
+
+usage (from src/main/scheduler):
+    python bench/LoadGen.py [host:port] [clients] [seconds] [--json]
+'''
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import asyncio
+import datetime
+import json
+import random
+import time
+import uuid
+
+from server.SchedulerClient import SchedulerClient, parse_address
+
+
+# relative weight of each operation in the replayed workload
+WORKLOAD = [("search", 70), ("reserve", 10), ("show_appointments", 10), ("relogin", 10)]
+PASSWORD = "LoadGen#2022"
+CAREGIVERS = 20
+DAYS = 30
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def setup(host, port, run_id, vaccine, dates):
+    client = SchedulerClient(host, port)
+    await client.connect()
+    try:
+        for i in range(CAREGIVERS):
+            username = "lg_" + run_id + "_c" + str(i)
+            await client.request("create_caregiver " + username + " " + PASSWORD)
+            await client.request("login_caregiver " + username + " " + PASSWORD)
+            await client.request("upload_availability " + dates[0] + " " + dates[-1])
+            if i == 0:
+                await client.request("add_doses " + vaccine + " 1000000")
+            await client.request("logout")
+    finally:
+        await client.close()
+
+
+async def patient(host, port, username, vaccine, dates, deadline, latencies):
+    client = SchedulerClient(host, port)
+    await client.connect()
+    operations = [name for name, _ in WORKLOAD]
+    weights = [weight for _, weight in WORKLOAD]
+
+    async def timed(operation, command):
+        start = time.perf_counter()
+        await client.request(command)
+        latencies.setdefault(operation, []).append(time.perf_counter() - start)
+
+    try:
+        await timed("create", "create_patient " + username + " " + PASSWORD)
+        await timed("login", "login_patient " + username + " " + PASSWORD)
+        while time.monotonic() < deadline:
+            operation = random.choices(operations, weights)[0]
+            if operation == "search":
+                await timed(operation, "search_caregiver_schedule " + random.choice(dates))
+            elif operation == "reserve":
+                await timed(operation, "reserve " + random.choice(dates) + " " + vaccine)
+            elif operation == "show_appointments":
+                await timed(operation, "show_appointments")
+            else:
+                await timed("logout", "logout")
+                await timed("login", "login_patient " + username + " " + PASSWORD)
+    finally:
+        await client.close()
+
+
+async def run(host, port, clients, seconds):
+    run_id = uuid.uuid4().hex[:6]
+    vaccine = "lg_" + run_id + "_vax"
+    first = datetime.date.today() + datetime.timedelta(days=1)
+    dates = [(first + datetime.timedelta(days=i)).strftime("%m-%d-%Y") for i in range(DAYS)]
+    await setup(host, port, run_id, vaccine, dates)
+
+    latencies = {}
+    deadline = time.monotonic() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*[patient(host, port, "lg_" + run_id + "_p" + str(i), vaccine, dates, deadline, latencies)
+                           for i in range(clients)])
+    elapsed = time.perf_counter() - start
+
+    report = {"clients": clients, "seconds": round(elapsed, 3), "operations": {}}
+    total = 0
+    for operation, samples in sorted(latencies.items()):
+        samples.sort()
+        total += len(samples)
+        report["operations"][operation] = {
+            "count": len(samples),
+            "p50_ms": round(percentile(samples, 50) * 1000, 3),
+            "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        }
+    report["requests"] = total
+    report["requests_per_sec"] = round(total / elapsed, 1)
+    return report
+
+
+def print_report(report):
+    print("{} clients, {} requests in {}s: {} req/s".format(report["clients"], report["requests"], report["seconds"],
+                                                           report["requests_per_sec"]))
+    print("{:<20}{:>10}{:>12}{:>12}".format("operation", "count", "p50 ms", "p99 ms"))
+    for operation, stats in report["operations"].items():
+        print("{:<20}{:>10}{:>12}{:>12}".format(operation, stats["count"], stats["p50_ms"], stats["p99_ms"]))
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if a != "--json"]
+    host, port = parse_address(args[0] if len(args) > 0 else "127.0.0.1:8765")
+    clients = int(args[1]) if len(args) > 1 else 50
+    seconds = float(args[2]) if len(args) > 2 else 30
+    report = asyncio.run(run(host, port, clients, seconds))
+    if "--json" in sys.argv:
+        print(json.dumps(report))
+    else:
+        print_report(report)
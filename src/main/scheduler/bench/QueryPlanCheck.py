@@ -0,0 +1,125 @@
+'''
+Query-plan and latency check for the hot read paths.
+Seeds a throwaway dataset (caregivers, patients, availability and appointments under a random prefix),
+then for each hot query captures the estimated plan with SHOWPLAN_XML and times it. A query fails
+the check if its plan scans Appointment instead of seeking. Run db/Migrations.py first.
+Exits non-zero on any failure.
+
+usage (from src/main/scheduler): python bench/QueryPlanCheck.py [appointments] [runs]
+'''
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import datetime
+import re
+import time
+import uuid
+
+from db.ConnectionManager import ConnectionManager
+
+
+CAREGIVERS = 200
+PATIENTS = 5000
+
+# numbers 1..n generated server-side so seeding is a handful of set-based statements
+NUMBERS = "WITH n AS (SELECT TOP (%d) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS i " \
+          "FROM sys.all_objects a CROSS JOIN sys.all_objects b) "
+
+
+def seed(cursor, prefix, appointments):
+    cursor.execute(NUMBERS + "INSERT INTO Caregivers (Username) SELECT %s + CAST(i AS varchar(12)) FROM n",
+                   (CAREGIVERS, prefix + "_c"))
+    cursor.execute(NUMBERS + "INSERT INTO Patients (Username) SELECT %s + CAST(i AS varchar(12)) FROM n",
+                   (PATIENTS, prefix + "_p"))
+    cursor.execute("INSERT INTO Vaccines VALUES (%s, %d)", (prefix + "_vax", 1000000))
+    # a year of availability with every caregiver free every day
+    cursor.execute(NUMBERS + "INSERT INTO Availabilities (Time, Username) SELECT DATEADD(day, i / %d, '2090-01-01'), "
+                   "%s + CAST(i %% %d + 1 AS varchar(12)) FROM n",
+                   (CAREGIVERS * 365, CAREGIVERS, prefix + "_c", CAREGIVERS))
+    cursor.execute(NUMBERS + "INSERT INTO Appointment (Time, Cusername, Pusername, Vname) "
+                   "SELECT DATEADD(day, i %% 3650, '2080-01-01'), %s + CAST(i %% %d + 1 AS varchar(12)), "
+                   "%s + CAST(i %% %d + 1 AS varchar(12)), %s FROM n",
+                   (appointments, prefix + "_c", CAREGIVERS, prefix + "_p", PATIENTS, prefix + "_vax"))
+
+
+def cleanup(cursor, prefix):
+    pattern = prefix + "_%"
+    cursor.execute("DELETE FROM Appointment WHERE Vname = %s", prefix + "_vax")
+    cursor.execute("DELETE FROM DailyDoseUsage WHERE Vname = %s", prefix + "_vax")
+    cursor.execute("DELETE FROM Availabilities WHERE Username LIKE %s", pattern)
+    cursor.execute("DELETE FROM Vaccines WHERE Name = %s", prefix + "_vax")
+    cursor.execute("DELETE FROM Patients WHERE Username LIKE %s", pattern)
+    cursor.execute("DELETE FROM Caregivers WHERE Username LIKE %s", pattern)
+
+
+def hot_queries(prefix):
+    # the statements Appointment.iter_for_user and Caregiver.get_available issue
+    return [
+        ("show_appointments (patient)",
+         "SELECT TOP (500) Id, Vname, Time, SlotTime, Cusername, Pusername FROM Appointment "
+         "WHERE Pusername = %s AND Id > %d ORDER BY Id", (prefix + "_p42", 0), "Appointment"),
+        ("show_appointments (caregiver)",
+         "SELECT TOP (500) Id, Vname, Time, SlotTime, Cusername, Pusername FROM Appointment "
+         "WHERE Cusername = %s AND Id > %d ORDER BY Id", (prefix + "_c7", 0), "Appointment"),
+        ("search_caregiver_schedule",
+         "SELECT Username, SlotTime, Capacity FROM Availabilities WHERE Time = %s AND Capacity > 0 "
+         "ORDER BY Username, SlotTime",
+         (datetime.date(2090, 1, 2),), "Availabilities"),
+    ]
+
+
+def scanned_tables(plan_xml):
+    # tables read by a scan operator rather than a seek
+    scans = set()
+    for match in re.finditer(r'PhysicalOp="(Table Scan|Index Scan|Clustered Index Scan)"(?:(?!<RelOp).)*?Table="\[(\w+)\]"',
+                             plan_xml, re.S):
+        scans.add(match.group(2))
+    return scans
+
+
+def run(appointments=200000, runs=20):
+    prefix = "plan_" + uuid.uuid4().hex[:8]
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+    failures = []
+    try:
+        seed(cursor, prefix, appointments)
+        conn.commit()
+        cursor.execute("UPDATE STATISTICS Appointment")
+        cursor.execute("UPDATE STATISTICS Availabilities")
+        conn.commit()
+
+        print("{:<32}{:>10}{:>10}  {}".format("query", "avg ms", "rows", "plan"))
+        for name, sql, params, table in hot_queries(prefix):
+            cursor.execute("SET SHOWPLAN_XML ON")
+            cursor.execute(sql, params)
+            plan_xml = cursor.fetchone()[0]
+            cursor.execute("SET SHOWPLAN_XML OFF")
+
+            start = time.perf_counter()
+            for _ in range(runs):
+                cursor.execute(sql, params)
+                rows = len(cursor.fetchall())
+            avg_ms = (time.perf_counter() - start) / runs * 1000
+
+            ok = table not in scanned_tables(plan_xml)
+            print("{:<32}{:>10.2f}{:>10}  {}".format(name, avg_ms, rows, "seek" if ok else "SCAN"))
+            if not ok:
+                failures.append(name + " scans " + table)
+    finally:
+        conn.rollback()
+        cleanup(cursor, prefix)
+        conn.commit()
+        cm.close_connection()
+
+    for failure in failures:
+        print("FAIL:", failure)
+    if not failures:
+        print("OK: every hot query seeks")
+    return not failures
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    sys.exit(0 if run(*args) else 1)
@@ -0,0 +1,136 @@
+'''
+Concurrent reservation stress check.
+Starts <reservers> patients at once against <slots> caregiver slots and <doses> doses for a single
+date and vaccine, then verifies that no dose was oversold and no caregiver was booked twice.
+Exits non-zero if an invariant is broken.
+
+usage (from src/main/scheduler): python bench/ReserveStress.py [reservers] [slots] [doses]
+'''
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import datetime
+import threading
+import time
+import uuid
+from collections import Counter
+
+from db.ConnectionManager import ConnectionManager
+from model.Appointment import Appointment
+
+
+def seed(prefix, d, vaccine_name, reservers, slots, doses):
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+    dummy = bytes(16)
+    try:
+        cursor.executemany("INSERT INTO Caregivers (Username, Salt, Hash) VALUES (%s, %s, %s)",
+                           [(f"{prefix}_c{i:04d}", dummy, dummy) for i in range(slots)])
+        cursor.executemany("INSERT INTO Patients (Username, Salt, Hash) VALUES (%s, %s, %s)",
+                           [(f"{prefix}_p{i:04d}", dummy, dummy) for i in range(reservers)])
+        cursor.executemany("INSERT INTO Availabilities (Time, Username) VALUES (%s, %s)",
+                           [(d, f"{prefix}_c{i:04d}") for i in range(slots)])
+        cursor.execute("INSERT INTO Vaccines VALUES (%s, %d)", (vaccine_name, doses))
+        conn.commit()
+    finally:
+        cm.close_connection()
+
+
+def cleanup(prefix, vaccine_name):
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+    pattern = prefix + "_%"
+    try:
+        cursor.execute("DELETE FROM Appointment WHERE Vname = %s", vaccine_name)
+        cursor.execute("DELETE FROM DailyDoseUsage WHERE Vname = %s", vaccine_name)
+        cursor.execute("DELETE FROM Availabilities WHERE Username LIKE %s", pattern)
+        cursor.execute("DELETE FROM Vaccines WHERE Name = %s", vaccine_name)
+        cursor.execute("DELETE FROM Patients WHERE Username LIKE %s", pattern)
+        cursor.execute("DELETE FROM Caregivers WHERE Username LIKE %s", pattern)
+        conn.commit()
+    finally:
+        cm.close_connection()
+
+
+def collect(prefix, d, vaccine_name):
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT Cusername FROM Appointment WHERE Vname = %s", vaccine_name)
+        booked = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT Doses FROM Vaccines WHERE Name = %s", vaccine_name)
+        remaining_doses = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM Availabilities WHERE Time = %s AND Username LIKE %s",
+                       (d, prefix + "_%"))
+        remaining_slots = cursor.fetchone()[0]
+    finally:
+        cm.close_connection()
+    return booked, remaining_doses, remaining_slots
+
+
+def run(reservers=200, slots=120, doses=100):
+    os.environ.setdefault("PoolMaxSize", str(min(reservers, 64)))
+    prefix = "stress_" + uuid.uuid4().hex[:8]
+    vaccine_name = prefix + "_vax"
+    d = datetime.datetime(2099, 1, 1)
+
+    seed(prefix, d, vaccine_name, reservers, slots, doses)
+    results = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(reservers)
+
+    def reserver(i):
+        barrier.wait()
+        try:
+            outcome = Appointment(d, vaccine_name, f"{prefix}_p{i:04d}").reserve()
+        except Exception as e:
+            outcome = "error: " + type(e).__name__
+        with lock:
+            results[outcome] += 1
+
+    try:
+        threads = [threading.Thread(target=reserver, args=(i,)) for i in range(reservers)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        booked, remaining_doses, remaining_slots = collect(prefix, d, vaccine_name)
+    finally:
+        cleanup(prefix, vaccine_name)
+
+    expected = min(reservers, slots, doses)
+    failures = []
+    if len(booked) != expected:
+        failures.append(f"expected {expected} appointments, found {len(booked)}")
+    if remaining_doses != doses - len(booked):
+        failures.append(f"doses out of sync: {remaining_doses} left after {len(booked)} bookings of {doses}")
+    if remaining_doses < 0:
+        failures.append(f"oversold: Doses = {remaining_doses}")
+    if remaining_slots != slots - len(booked):
+        failures.append(f"slots out of sync: {remaining_slots} left after {len(booked)} bookings of {slots}")
+    doubled = [c for c, n in Counter(booked).items() if n > 1]
+    if doubled:
+        failures.append(f"double-booked caregivers: {doubled}")
+    if results[Appointment.RESERVED] != len(booked):
+        failures.append(f"{results[Appointment.RESERVED]} reservations reported, {len(booked)} stored")
+
+    print(f"{reservers} reservers, {slots} slots, {doses} doses in {elapsed:.2f}s")
+    for outcome, count in sorted(results.items()):
+        print(f"  {outcome:<14}{count}")
+    print("  pool", ConnectionManager.pool_stats())
+    for failure in failures:
+        print("FAIL:", failure)
+    if not failures:
+        print("OK: no oversell, no double booking")
+    return not failures
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:4]]
+    sys.exit(0 if run(*args) else 1)
@@ -0,0 +1,381 @@
+import datetime
+import functools
+import os
+import re
+import sqlite3
+import threading
+import urllib.parse
+from util.Metrics import Metrics
+
+
+class DatabaseError(Exception):
+    '''
+    A database error from either backend. The args are the driver's: for SQL Server the error number
+    comes first (e.g. 1205 for a deadlock victim), for SQLite the extended result code.
+    '''
+    pass
+
+
+class DatabaseUnavailable(DatabaseError):
+    '''
+    The database can't be reached: connecting failed and retrying didn't help in time, or the circuit
+    breaker (see db/CircuitBreaker.py) is refusing calls until it comes back.
+    '''
+    pass
+
+
+class Backend:
+    '''
+    A storage engine the scheduler can run against, selected with the DBBackend environment variable
+    (mssql, the default, or sqlite). connect() returns a connection with the pymssql interface the models
+    are written against: cursor(as_dict=...), pyformat parameters (%s, %d, %(name)s) and errors raised as
+    DatabaseError. Statements that are specific to one engine check Backend.name.
+    DBReplicas lists read replicas of the database, comma-separated, which connect(target) opens
+    instead of the primary (see db/ReplicaRouter.py).
+    '''
+
+    name = None
+    # the driver's base exception class, translated to DatabaseError
+    driver_error = Exception
+    _configured = None
+    _configured_lock = threading.Lock()
+
+    # a connection to the primary, or to the read replica target (one of replicas())
+    def connect(self, target=None):
+        raise NotImplementedError
+
+    def replicas(self):
+        return [target.strip() for target in os.getenv("DBReplicas", "").split(",") if target.strip()]
+
+    def raw_cursor(self, conn, as_dict):
+        raise NotImplementedError
+
+    # rewrites pyformat SQL into the driver's parameter style
+    def translate(self, sql):
+        raise NotImplementedError
+
+    # Takes the write lock for the transaction on conn up front, unless it already holds it.
+    # Returns whether a statement was sent.
+    def begin(self, conn):
+        return False
+
+    # whether err means the transaction lost a lock conflict and can simply be run again
+    def is_deadlock(self, err):
+        return False
+
+    # whether running the transaction again may well succeed: deadlocks, dropped connections, throttling
+    def is_transient(self, err):
+        return self.is_deadlock(err)
+
+    # SQL fragments for the few expressions the engines spell differently
+    def random_order(self):
+        raise NotImplementedError
+
+    def add_days(self, expr, days):
+        raise NotImplementedError
+
+    def week_of(self, expr):
+        raise NotImplementedError
+
+    @staticmethod
+    def configured():
+        with Backend._configured_lock:
+            if Backend._configured is None:
+                Backend._configured = Backend.named(os.getenv("DBBackend", "mssql"))
+            return Backend._configured
+
+    @staticmethod
+    def named(name):
+        backends = {
+            "mssql": MssqlBackend,
+            "sqlite": SqliteBackend,
+        }
+        if name not in backends:
+            raise ValueError("Unknown database backend: " + name)
+        return backends[name]()
+
+
+class MssqlBackend(Backend):
+    # Azure SQL Database, configured with Server, DBName, UserID and Password; replicas are named like
+    # Server (e.g. a geo-replica's server) and share the other settings
+    name = "mssql"
+
+    # SQL Server error number for "Transaction was deadlocked ... and has been chosen as the deadlock victim"
+    DEADLOCK_ERROR = 1205
+    # errors worth retrying besides deadlocks: lock timeouts, DB-Library connection failures (20003 timeout,
+    # 20004/20006 read/write to server failed, 20009 unable to connect, 20047 connection dead), socket
+    # resets, and Azure SQL failovers and throttling (4060, 4221, 10928, 10929, 40197, 40501, 40613,
+    # 49918-49920)
+    TRANSIENT_ERRORS = {1222, 20003, 20004, 20006, 20009, 20047, 233, 64, 10053, 10054, 10060,
+                        4060, 4221, 10928, 10929, 40197, 40501, 40613, 49918, 49919, 49920}
+
+    def __init__(self):
+        self.server_name = str(os.getenv("Server")) + ".database.windows.net"
+        self.db_name = os.getenv("DBName")
+        self.user = os.getenv("UserID")
+        self.password = os.getenv("Password")
+
+    def connect(self, target=None):
+        # imported here so the SQLite backend runs without the SQL Server driver installed
+        import pymssql
+        server_name = self.server_name if target is None else target + ".database.windows.net"
+        try:
+            conn = pymssql.connect(server=server_name, user=self.user, password=self.password,
+                                   database=self.db_name)
+        except pymssql.Error as e:
+            raise DatabaseError(*e.args) from e
+        self.driver_error = pymssql.Error
+        return Connection(conn, self)
+
+    def raw_cursor(self, conn, as_dict):
+        return conn.cursor(as_dict=as_dict)
+
+    def translate(self, sql):
+        return sql
+
+    def is_deadlock(self, err):
+        return len(err.args) > 0 and err.args[0] == MssqlBackend.DEADLOCK_ERROR
+
+    def is_transient(self, err):
+        return self.is_deadlock(err) or (len(err.args) > 0 and err.args[0] in MssqlBackend.TRANSIENT_ERRORS)
+
+    def random_order(self):
+        return "NEWID()"
+
+    def add_days(self, expr, days):
+        return "DATEADD(day, {}, {})".format(days, expr)
+
+    def week_of(self, expr):
+        return "DATEPART(week, {})".format(expr)
+
+
+class SqliteBackend(Backend):
+    '''
+    An embedded SQLite database file (DBPath, scheduler.db by default) for local runs, benchmarks and
+    single-node deployments. The schema is created from create_sqlite.sql on first use. Connections run
+    in WAL mode, so readers never block the writer, and write transactions begin IMMEDIATE so two writers
+    can't deadlock upgrading their locks; a writer that has to wait longer than DBBusyTimeout ms gets a
+    retryable error. Parsed statements are cached per connection (DBStatementCache), so the repeated
+    statements of the hot paths are prepared once.
+    Replicas are paths of copies of the file kept up to date by something else (e.g. Litestream); they
+    are opened read-only.
+    '''
+
+    name = "sqlite"
+
+    SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "resources", "create_sqlite.sql")
+    # result codes for "database is locked" / "database table is locked"
+    BUSY_CODES = (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+    driver_error = sqlite3.Error
+
+    def __init__(self):
+        self.path = os.getenv("DBPath", "scheduler.db")
+        self.busy_timeout = int(os.getenv("DBBusyTimeout", "5000"))
+        self.statement_cache = int(os.getenv("DBStatementCache", "256"))
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def connect(self, target=None):
+        if target is not None:
+            return self.connect_replica(target)
+        try:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000, isolation_level="IMMEDIATE",
+                                   detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                                   cached_statements=self.statement_cache, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA foreign_keys = ON")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    with open(SqliteBackend.SCHEMA) as script:
+                        conn.executescript(script.read())
+                    self._schema_ready = True
+        except sqlite3.Error as e:
+            raise DatabaseError(*driver_args(e)) from e
+        return Connection(conn, self)
+
+    def connect_replica(self, path):
+        try:
+            conn = sqlite3.connect("file:" + urllib.parse.quote(os.path.abspath(path)) + "?mode=ro", uri=True,
+                                   timeout=self.busy_timeout / 1000,
+                                   detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                                   cached_statements=self.statement_cache, check_same_thread=False)
+        except sqlite3.Error as e:
+            raise DatabaseError(*driver_args(e)) from e
+        return Connection(conn, self)
+
+    def raw_cursor(self, conn, as_dict):
+        cursor = conn.cursor()
+        if as_dict:
+            cursor.row_factory = dict_row
+        return cursor
+
+    def translate(self, sql):
+        return to_qmark(sql)
+
+    def begin(self, conn):
+        # the driver only begins a transaction at the first write, so reads before it could see an older snapshot
+        if conn.in_transaction:
+            return False
+        conn.execute("BEGIN IMMEDIATE")
+        return True
+
+    def is_deadlock(self, err):
+        # the primary result code is the low byte of the extended one
+        return len(err.args) > 0 and err.args[0] is not None and err.args[0] & 0xff in SqliteBackend.BUSY_CODES
+
+    def random_order(self):
+        return "RANDOM()"
+
+    def add_days(self, expr, days):
+        return "date({}, '{:+d} days')".format(expr, days)
+
+    def week_of(self, expr):
+        # Sunday-based weeks, as DATEPART(week) with SQL Server's default DATEFIRST
+        return "strftime('%%U', {})".format(expr)
+
+
+class Connection:
+    # a driver connection whose cursors take pyformat parameters and raise DatabaseError
+
+    def __init__(self, conn, backend):
+        self.conn = conn
+        self.backend = backend
+        self.driver_error = backend.driver_error
+
+    def cursor(self, as_dict=False):
+        try:
+            return Cursor(self.backend.raw_cursor(self.conn, as_dict), self)
+        except self.driver_error as e:
+            raise DatabaseError(*driver_args(e)) from e
+
+    def commit(self):
+        try:
+            with Metrics.phase("query"):
+                self.conn.commit()
+        except self.driver_error as e:
+            raise DatabaseError(*driver_args(e)) from e
+
+    def begin(self):
+        try:
+            return self.backend.begin(self.conn)
+        except self.driver_error as e:
+            raise DatabaseError(*driver_args(e)) from e
+
+    def rollback(self):
+        try:
+            with Metrics.phase("query"):
+                self.conn.rollback()
+        except self.driver_error as e:
+            raise DatabaseError(*driver_args(e)) from e
+
+    def close(self):
+        self.conn.close()
+
+
+class Cursor:
+    # execution and fetches are timed as the "query" phase of the current command, see util/Metrics.py
+
+    def __init__(self, cursor, connection):
+        self.cursor = cursor
+        self.connection = connection
+
+    def execute(self, sql, params=None):
+        try:
+            with Metrics.phase("query"):
+                # as with pymssql, a statement without parameters is sent as it is
+                if params is None:
+                    self.cursor.execute(sql)
+                else:
+                    self.cursor.execute(self.connection.backend.translate(sql), as_params(params))
+        except self.connection.driver_error as e:
+            raise DatabaseError(*driver_args(e)) from e
+
+    def executemany(self, sql, seq_of_params):
+        try:
+            with Metrics.phase("query"):
+                self.cursor.executemany(self.connection.backend.translate(sql), [as_params(p) for p in seq_of_params])
+        except self.connection.driver_error as e:
+            raise DatabaseError(*driver_args(e)) from e
+
+    def fetchone(self):
+        with Metrics.phase("query"):
+            row = self.cursor.fetchone()
+        if row is not None:
+            Metrics.add_rows(1)
+        return row
+
+    def fetchall(self):
+        with Metrics.phase("query"):
+            rows = self.cursor.fetchall()
+        Metrics.add_rows(len(rows))
+        return rows
+
+    def nextset(self):
+        # SQLite runs one statement per execute, so there is never a second result set
+        if hasattr(self.cursor, "nextset"):
+            return self.cursor.nextset()
+        return None
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    def __iter__(self):
+        for row in self.cursor:
+            Metrics.add_rows(1)
+            yield row
+
+
+_PARAMETER = re.compile(r"%\((\w+)\)[sd]|%[sd]|%%")
+
+
+# pyformat (%s, %d, %(name)s, %% for a literal %) to SQLite's ? and :name placeholders; the hot
+# statements are constant strings, so each is only rewritten once
+@functools.lru_cache(maxsize=1024)
+def to_qmark(sql):
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%"
+        if match.group(1) is not None:
+            return ":" + match.group(1)
+        return "?"
+    return _PARAMETER.sub(replace, sql)
+
+
+def as_params(params):
+    # pymssql accepts a lone value for a single parameter
+    if isinstance(params, (tuple, list, dict)):
+        return params
+    return (params,)
+
+
+def dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def driver_args(e):
+    # SQLite errors carry their result code separately; put it first like SQL Server's error number
+    if isinstance(e, sqlite3.Error):
+        return (getattr(e, "sqlite_errorcode", None),) + e.args
+    return e.args
+
+
+# dates are stored as ISO text. Times of day are stored as HH:MM, the form the models write them in.
+# Dates are often passed as midnight datetimes, which are stored as plain dates so they compare equal.
+def adapt_datetime(value):
+    if value.time() == datetime.time(0, 0):
+        return value.date().isoformat()
+    return value.isoformat(" ")
+
+
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime.datetime, adapt_datetime)
+sqlite3.register_adapter(datetime.time, lambda value: value.strftime("%H:%M"))
+sqlite3.register_converter("date", lambda value: datetime.date.fromisoformat(value.decode()[:10]))
+sqlite3.register_converter("time", lambda value: datetime.time.fromisoformat(value.decode()))
@@ -0,0 +1,35 @@
+class BulkSql:
+    '''
+    Set-based statements over many values, split into as few chunks as SQL Server's limits allow:
+    at most 1000 rows per VALUES list and 2100 parameters per statement (SQLite's limits are higher).
+    '''
+
+    MAX_ROWS = 1000
+    MAX_PARAMS = 2000
+
+    # rows of prefix + "(value, ...)" for every value, e.g. "SELECT Username FROM Patients WHERE Username IN "
+    @staticmethod
+    def select_in(cursor, prefix, values):
+        values = list(values)
+        rows = []
+        for i in range(0, len(values), BulkSql.MAX_PARAMS):
+            chunk = values[i:i + BulkSql.MAX_PARAMS]
+            cursor.execute(prefix + "(" + ", ".join(["%s"] * len(chunk)) + ")", tuple(chunk))
+            rows.extend(cursor.fetchall())
+        return rows
+
+    # multi-row INSERTs of rows (tuples of the same width) into table, which may name its columns,
+    # e.g. "Patients (Username, Salt, Hash, HashParams)"
+    @staticmethod
+    def insert_rows(cursor, table, rows):
+        if len(rows) == 0:
+            return
+        width = len(rows[0])
+        chunk_size = min(BulkSql.MAX_ROWS, BulkSql.MAX_PARAMS // width)
+        placeholder = "(" + ", ".join(["%s"] * width) + ")"
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            params = []
+            for row in chunk:
+                params.extend(row)
+            cursor.execute("INSERT INTO " + table + " VALUES " + ", ".join([placeholder] * len(chunk)), tuple(params))
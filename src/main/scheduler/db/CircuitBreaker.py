@@ -0,0 +1,76 @@
+import threading
+import time
+from db.Backend import DatabaseUnavailable
+
+
+class CircuitBreaker:
+    '''
+    Fails database calls fast while the database is down, instead of every command waiting out its
+    own connection attempts.
+    Closed, it lets every call through and counts consecutive failures; after `threshold` of them it
+    opens and refuses calls with DatabaseUnavailable for `cooldown` seconds. Then it is half-open: one
+    call is let through as a trial, and closes the breaker if it succeeds or opens it again if it fails.
+    '''
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold=5, cooldown=10):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CircuitBreaker.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    # Raises DatabaseUnavailable unless a call may go ahead now; a caller let through must report
+    # how it went with success(), failure() or release()
+    def check(self):
+        with self._lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return
+            if self.state == CircuitBreaker.OPEN:
+                remaining = self._opened_at + self.cooldown - time.monotonic()
+                if remaining > 0:
+                    self.rejected += 1
+                    raise DatabaseUnavailable("Database unavailable, retrying in {:.0f}s".format(remaining))
+                self.state = CircuitBreaker.HALF_OPEN
+                self._trial = False
+            if self._trial:
+                self.rejected += 1
+                raise DatabaseUnavailable("Database unavailable, checking whether it is back")
+            self._trial = True
+
+    def success(self):
+        with self._lock:
+            self.state = CircuitBreaker.CLOSED
+            self._failures = 0
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or self._failures >= self.threshold:
+                if self.state != CircuitBreaker.OPEN:
+                    self.opened += 1
+                self.state = CircuitBreaker.OPEN
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+    # for a call let through that ended without showing whether the database is up
+    def release(self):
+        with self._lock:
+            self._trial = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
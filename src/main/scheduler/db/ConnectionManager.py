@@ -1,29 +1,129 @@
-import pymssql
 import os
+import atexit
+import threading
+import time
+from db.Backend import Backend, DatabaseError, DatabaseUnavailable
+from db.ConnectionPool import ConnectionPool, PoolTimeout
+from db.CircuitBreaker import CircuitBreaker
+from db.RetryPolicy import RetryPolicy, remaining
+from util.Metrics import Metrics
 
 
 class ConnectionManager:
+    '''
+    Checks connections out of the process's pool. A connection attempt that fails with a transient
+    error is retried (see RetryPolicy) until the caller's deadline; every failed attempt counts
+    against the circuit breaker (BreakerThreshold failures in a row open it for BreakerCooldown
+    seconds), and while it is open checkouts fail straight away. Failures are raised as
+    DatabaseUnavailable, for the command to report; nothing here ends the process.
+    '''
+
+    # one pool and one circuit breaker per database (target None is the primary, others are read
+    # replicas, see ReplicaRouter), shared by every ConnectionManager; created on first use
+    _pools = {}
+    _pool_lock = threading.Lock()
+    _breakers = {}
+    # run at exit before the pools close, latest first (see shutdown)
+    _shutdown_hooks = []
 
     def __init__(self):
-        self.server_name = os.getenv("Server") + ".database.windows.net"
-        self.db_name = os.getenv("DBName")
-        self.user = os.getenv("UserID")
-        self.password = os.getenv("Password")
         self.conn = None
+        self.target = None
+
+    # the configured storage backend (DBBackend), see db/Backend.py
+    @staticmethod
+    def backend():
+        return Backend.configured()
+
+    def connect(self, target=None):
+        return ConnectionManager.backend().connect(target)
+
+    def pool(self, target=None):
+        with ConnectionManager._pool_lock:
+            pool = ConnectionManager._pools.get(target)
+            if pool is None:
+                pool = ConnectionPool(
+                    lambda: self.connect(target),
+                    max_size=int(os.getenv("PoolMaxSize", "10")),
+                    max_idle=float(os.getenv("PoolMaxIdle", "300")),
+                    health_check_after=float(os.getenv("PoolHealthCheckAfter", "30")),
+                    checkout_timeout=float(os.getenv("PoolCheckoutTimeout", "30")),
+                )
+                ConnectionManager._pools[target] = pool
+            return pool
+
+    @staticmethod
+    def breaker(target=None):
+        with ConnectionManager._pool_lock:
+            breaker = ConnectionManager._breakers.get(target)
+            if breaker is None:
+                breaker = CircuitBreaker(int(os.getenv("BreakerThreshold", "5")),
+                                         float(os.getenv("BreakerCooldown", "10")))
+                ConnectionManager._breakers[target] = breaker
+            return breaker
+
+    # deadline is the time.monotonic() by which the caller gives up, e.g. the end of its command;
+    # target names a read replica to connect to instead of the primary
+    def create_connection(self, deadline=None, target=None):
+        self.target = target
+        breaker = ConnectionManager.breaker(target)
+        policy = RetryPolicy.configured()
+        attempt = 1
+        while True:
+            breaker.check()
+            try:
+                with Metrics.phase("connect"):
+                    self.conn = self.pool(target).checkout(remaining(deadline))
+                breaker.success()
+                return self.conn
+            except PoolTimeout as e:
+                # every connection is busy, which says nothing about the database itself
+                breaker.release()
+                raise DatabaseUnavailable(str(e)) from e
+            except DatabaseError as e:
+                breaker.failure()
+                delay = policy.backoff(attempt, deadline) if ConnectionManager.backend().is_transient(e) else None
+                if delay is None:
+                    raise DatabaseUnavailable("Could not connect to the database: " + str(e)) from e
+            time.sleep(delay)
+            attempt += 1
+
+    # hands the connection back to the pool, closing it instead if discard (e.g. it is broken);
+    # safe to call more than once
+    def close_connection(self, discard=False):
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        self.pool(self.target).checkin(conn, discard)
+
+    # Run fn at exit while the database can still be reached, e.g. to finish writes still queued
+    @staticmethod
+    def on_shutdown(fn):
+        with ConnectionManager._pool_lock:
+            ConnectionManager._shutdown_hooks.append(fn)
+
+    # the one exit hook for the database: runs the on_shutdown callbacks, then closes every pool
+    @staticmethod
+    def shutdown():
+        with ConnectionManager._pool_lock:
+            hooks = list(reversed(ConnectionManager._shutdown_hooks))
+            ConnectionManager._shutdown_hooks = []
+        for fn in hooks:
+            fn()
+        with ConnectionManager._pool_lock:
+            pools = list(ConnectionManager._pools.values())
+        for pool in pools:
+            pool.close_all()
+
+    @staticmethod
+    def pool_stats(target=None):
+        if target not in ConnectionManager._pools:
+            return {}
+        return ConnectionManager._pools[target].stats()
+
+    @staticmethod
+    def breaker_stats(target=None):
+        return ConnectionManager.breaker(target).stats()
+
 
-    def create_connection(self):
-        try:
-            self.conn = pymssql.connect(server=self.server_name, user=self.user, password=self.password, database=self.db_name)
-        except pymssql.Error as db_err:
-            print("Database Programming Error in SQL connection processing! ")
-            print(db_err)
-            quit()
-        return self.conn
-
-    def close_connection(self):
-        try:
-            self.conn.close()
-        except pymssql.Error as db_err:
-            print("Database Programming Error in SQL connection processing! ")
-            print(db_err)
-            quit()
+atexit.register(ConnectionManager.shutdown)
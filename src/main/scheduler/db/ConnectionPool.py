@@ -0,0 +1,147 @@
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    '''
+    Bounded, thread-safe pool of DB-API connections.
+    Connections are handed out with checkout() and must be given back with checkin();
+    idle connections are health-checked before reuse and evicted after max_idle seconds.
+    '''
+
+    def __init__(self, connect, max_size=10, max_idle=300, health_check_after=30, checkout_timeout=30):
+        self.connect = connect
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self.checkout_timeout = checkout_timeout
+
+        # idle connections as (conn, last_used) pairs, most recently used last
+        self._idle = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self.failed_health_checks = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+
+    # waits up to checkout_timeout seconds for a free connection, or timeout if that is shorter
+    def checkout(self, timeout=None):
+        if timeout is None or timeout > self.checkout_timeout:
+            timeout = self.checkout_timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                self._evict_idle()
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._in_use < self.max_size:
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout("Timed out waiting for a database connection")
+                self.waits += 1
+                self._cond.wait(remaining)
+            self._in_use += 1
+            self.checkouts += 1
+
+        # connecting and health checks happen outside the lock so they don't block other threads
+        unhealthy = False
+        try:
+            if conn is not None and time.monotonic() - last_used > self.health_check_after \
+                    and not self._is_healthy(conn):
+                unhealthy = True
+                self._close_quietly(conn)
+                conn = None
+            reused = conn is not None
+            if conn is None:
+                conn = self.connect()
+        except BaseException:
+            with self._cond:
+                self._in_use -= 1
+                self.failed_health_checks += unhealthy
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.failed_health_checks += unhealthy
+            if reused:
+                self.reused += 1
+            else:
+                self.created += 1
+        return conn
+
+    def checkin(self, conn, discard=False):
+        if not discard:
+            # never hand a half-finished transaction to the next borrower
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "created": self.created,
+                "reused": self.reused,
+                "evicted": self.evicted,
+                "failed_health_checks": self.failed_health_checks,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+            }
+
+    # must be called with self._cond held
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.max_idle
+        # the list is ordered by last use, so stale connections are at the front
+        while self._idle and self._idle[0][1] < cutoff:
+            conn, _ = self._idle.pop(0)
+            self._close_quietly(conn)
+            self.evicted += 1
+
+    def _is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,116 @@
+'''
+Versioned schema migrations.
+Migrations are the NNN_<name>.sql files in resources/migrations, applied in version order. Each file is
+one T-SQL batch and is written to be idempotent (guarded with IF NOT EXISTS / COL_LENGTH checks), so it
+is safe on a database created from the current create.sql as well as on older ones. Applied versions are
+recorded in the SchemaMigrations table; each migration runs in its own transaction together with its
+bookkeeping row, under an application lock so concurrent runners can't apply the same version twice.
+Migrations are for SQL Server; a SQLite database is created from create_sqlite.sql, which always has the
+current schema, so there is never anything to apply to it.
+
+usage (from src/main/scheduler): python db/Migrations.py [--status]
+'''
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import re
+
+from db.ConnectionManager import ConnectionManager
+from db.Backend import DatabaseError
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "resources", "migrations")
+
+
+class MigrationRunner:
+
+    create_bookkeeping = """
+        IF OBJECT_ID('SchemaMigrations') IS NULL
+            CREATE TABLE SchemaMigrations (
+                Version int,
+                Name varchar(255),
+                AppliedAt datetime2 DEFAULT SYSUTCDATETIME(),
+                PRIMARY KEY (Version)
+            );
+    """
+
+    def __init__(self, directory=MIGRATIONS_DIR):
+        self.directory = directory
+
+    # (version, name, path) for every migration file, in version order
+    def migrations(self):
+        found = []
+        for filename in os.listdir(self.directory):
+            match = re.match(r"^(\d+)_(\w+)\.sql$", filename)
+            if match:
+                found.append((int(match.group(1)), match.group(2), os.path.join(self.directory, filename)))
+        found.sort()
+        versions = [version for version, _, _ in found]
+        if len(versions) != len(set(versions)):
+            raise ValueError("Duplicate migration version in " + self.directory)
+        return found
+
+    def applied_versions(self, cursor):
+        cursor.execute(MigrationRunner.create_bookkeeping)
+        cursor.execute("SELECT Version FROM SchemaMigrations")
+        return {row[0] for row in cursor.fetchall()}
+
+    def pending(self):
+        if ConnectionManager.backend().name != "mssql":
+            return []
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+        try:
+            applied = self.applied_versions(cursor)
+            conn.commit()
+        finally:
+            cm.close_connection()
+        return [m for m in self.migrations() if m[0] not in applied]
+
+    # Apply every pending migration in order; returns the (version, name) pairs applied
+    def apply(self):
+        done = []
+        if ConnectionManager.backend().name != "mssql":
+            return done
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+        try:
+            self.applied_versions(cursor)
+            conn.commit()
+            for version, name, path in self.migrations():
+                with open(path) as script:
+                    sql = script.read()
+                # the lock is held until commit/rollback; re-check under it in case another runner got here first
+                cursor.execute("EXEC sp_getapplock @Resource = 'SchemaMigrations', @LockMode = 'Exclusive', "
+                               "@LockOwner = 'Transaction', @LockTimeout = 60000")
+                cursor.execute("SELECT 1 FROM SchemaMigrations WHERE Version = %d", version)
+                if cursor.fetchone() is not None:
+                    conn.rollback()
+                    continue
+                try:
+                    cursor.execute(sql)
+                    cursor.execute("INSERT INTO SchemaMigrations (Version, Name) VALUES (%d, %s)", (version, name))
+                    conn.commit()
+                except DatabaseError:
+                    conn.rollback()
+                    raise
+                done.append((version, name))
+        finally:
+            cm.close_connection()
+        return done
+
+
+if __name__ == "__main__":
+    runner = MigrationRunner()
+    if len(sys.argv) > 1 and sys.argv[1] == "--status":
+        pending = runner.pending()
+        for version, name, _ in runner.migrations():
+            state = "pending" if any(version == p[0] for p in pending) else "applied"
+            print("{:03d} {:<40} {}".format(version, name, state))
+    else:
+        applied = runner.apply()
+        for version, name in applied:
+            print("Applied {:03d} {}".format(version, name))
+        print("Schema is up to date" if applied else "Nothing to apply")
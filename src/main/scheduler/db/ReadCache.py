@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ReadCache:
+    '''
+    Thread-safe read-through cache with a time-to-live and LRU eviction past max_size entries.
+    Write paths call invalidate()/clear() so readers in this process never see their own stale data;
+    ttl bounds how stale an entry can get when another process writes.
+    '''
+
+    def __init__(self, ttl=5.0, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        # key -> (value, expires_at); least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # Returns the cached value for key, or calls load() and caches what it returns
+    def get(self, key, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self.invalidations
+
+        value = load()
+        with self._lock:
+            # skip caching if a writer invalidated while we were loading; the value may predate the write
+            if generation == self.invalidations:
+                self._entries[key] = (value, time.monotonic() + self.ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
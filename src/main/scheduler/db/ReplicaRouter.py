@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+import uuid
+from db.ConnectionManager import ConnectionManager
+from db.Backend import DatabaseError
+
+
+class ReplicaRouter:
+    '''
+    Sends the reads of read-only commands to the read replicas listed in DBReplicas, when they are
+    recent enough; writes always go to the primary.
+    How far each replica has caught up is measured with heartbeats: every ReplicaHeartbeatInterval
+    seconds this process writes the current time to its own row of ReplicaHeartbeat on the primary and
+    reads the row back from every replica. A replica returning beat T holds everything this process
+    committed before T. A read may go to a replica whose beat is at most ReplicaMaxStaleness seconds
+    old and, so a session reads its own writes, no older than the session's last commit; otherwise it
+    goes to the primary, as do all reads until the first poll. A replica that can't be reached is left
+    out until it answers a poll again.
+    '''
+
+    _configured = None
+    _configured_lock = threading.Lock()
+
+    def __init__(self, replicas, max_staleness=None, interval=None):
+        self.replicas = list(replicas)
+        self.max_staleness = max_staleness or float(os.getenv("ReplicaMaxStaleness", "5"))
+        self.interval = interval or float(os.getenv("ReplicaHeartbeatInterval", "1"))
+        # heartbeats are compared with this process's own clock only, so clock skew between
+        # processes doesn't matter
+        self.node = uuid.uuid4().hex
+        # replica -> the latest beat it returned, 0 when it couldn't be reached
+        self._positions = dict.fromkeys(self.replicas, 0.0)
+        self._lock = threading.Lock()
+        self._next = 0
+        self._pruned = False
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self._thread = threading.Thread(target=self._run, name="replica-heartbeat", daemon=True)
+        self._thread.start()
+
+    # the router of this process, or None when DBReplicas is unset
+    @staticmethod
+    def configured():
+        with ReplicaRouter._configured_lock:
+            if ReplicaRouter._configured is None:
+                replicas = ConnectionManager.backend().replicas()
+                if not replicas:
+                    return None
+                ReplicaRouter._configured = ReplicaRouter(replicas)
+            return ReplicaRouter._configured
+
+    # The replica to read from for a session whose last commit returned at read_after (a time.time()
+    # value, 0 for none), round robin among those recent enough; None for the primary
+    def choose(self, read_after=0.0):
+        floor = max(read_after, time.time() - self.max_staleness)
+        with self._lock:
+            fresh = [target for target in self.replicas if self._positions[target] >= floor]
+            if not fresh:
+                self.primary_reads += 1
+                return None
+            self._next += 1
+            self.replica_reads += 1
+            return fresh[self._next % len(fresh)]
+
+    # leave target out until it answers a poll again
+    def mark_down(self, target):
+        with self._lock:
+            self._positions[target] = 0.0
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            return {
+                "replica_reads": self.replica_reads,
+                "primary_reads": self.primary_reads,
+                "lag": {target: round(now - beat, 3) if beat > 0 else None for target, beat in self._positions.items()},
+            }
+
+    def _run(self):
+        while True:
+            try:
+                self.beat()
+            except DatabaseError:
+                # the primary is down; the replicas keep the position they had
+                pass
+            for target in self.replicas:
+                self.poll(target)
+            time.sleep(self.interval)
+
+    def beat(self):
+        if ConnectionManager.backend().name == "sqlite":
+            upsert_beat = """
+                INSERT INTO ReplicaHeartbeat (Node, Beat) VALUES (%(node)s, %(beat)s)
+                ON CONFLICT (Node) DO UPDATE SET Beat = excluded.Beat
+            """
+        else:
+            upsert_beat = """
+                UPDATE ReplicaHeartbeat SET Beat = %(beat)s WHERE Node = %(node)s;
+                IF @@ROWCOUNT = 0
+                    INSERT INTO ReplicaHeartbeat (Node, Beat) VALUES (%(node)s, %(beat)s);
+            """
+        cm = ConnectionManager()
+        try:
+            conn = cm.create_connection()
+            cursor = conn.cursor()
+            if not self._pruned:
+                # rows of processes that stopped a day ago
+                cursor.execute("DELETE FROM ReplicaHeartbeat WHERE Beat < %s", time.time() - 86400)
+                self._pruned = True
+            # taken after every commit this beat has to cover returned
+            cursor.execute(upsert_beat, {"node": self.node, "beat": time.time()})
+            conn.commit()
+        finally:
+            cm.close_connection()
+
+    def poll(self, target):
+        cm = ConnectionManager()
+        try:
+            conn = cm.create_connection(target=target)
+            cursor = conn.cursor()
+            cursor.execute("SELECT Beat FROM ReplicaHeartbeat WHERE Node = %s", self.node)
+            row = cursor.fetchone()
+            position = row[0] if row is not None else 0.0
+        except DatabaseError:
+            position = 0.0
+        finally:
+            cm.close_connection()
+        with self._lock:
+            self._positions[target] = position
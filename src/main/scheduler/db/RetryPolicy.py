@@ -0,0 +1,48 @@
+import os
+import random
+import threading
+import time
+
+
+class RetryPolicy:
+    '''
+    How often, and after how long, a failed database call is tried again: up to DBRetryAttempts
+    attempts in all, sleeping a random time between zero and DBRetryBaseDelay * 2^attempt seconds (at
+    most DBRetryMaxDelay) in between, so callers that failed together don't collide again. No retry
+    is started that would sleep past the caller's deadline. Which errors are worth retrying is the
+    backend's call, see Backend.is_transient.
+    '''
+
+    _configured = None
+    _configured_lock = threading.Lock()
+
+    def __init__(self, attempts=5, base_delay=0.05, max_delay=2.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def configured():
+        with RetryPolicy._configured_lock:
+            if RetryPolicy._configured is None:
+                RetryPolicy._configured = RetryPolicy(int(os.getenv("DBRetryAttempts", "5")),
+                                                      float(os.getenv("DBRetryBaseDelay", "0.05")),
+                                                      float(os.getenv("DBRetryMaxDelay", "2")))
+            return RetryPolicy._configured
+
+    # Seconds to sleep after attempt (counting from 1) failed, or None if there should be no other attempt:
+    # the attempts are used up, or the sleep would end past deadline (a time.monotonic() value)
+    def backoff(self, attempt, deadline=None):
+        if attempt >= self.attempts:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+
+# seconds left until deadline (a time.monotonic() value), or None without one
+def remaining(deadline):
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
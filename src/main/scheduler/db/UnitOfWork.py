@@ -0,0 +1,300 @@
+from db.ConnectionManager import ConnectionManager
+from db.Backend import DatabaseError, DatabaseUnavailable
+from db.RetryPolicy import RetryPolicy
+from db.ReplicaRouter import ReplicaRouter
+from util.Metrics import Metrics
+import contextlib
+import functools
+import re
+import threading
+import time
+
+
+class UnitOfWork:
+    '''
+    One connection and one transaction for everything a command reads and writes.
+    Model methods take an optional unit of work: given one, they run their statements on its connection
+    and leave the commit to whoever opened it, so a command that saves, reads and updates commits once;
+    without one, they open a unit of their own for the call (see join). Cache invalidations registered
+    with on_commit run only after the commit succeeded. The connection is checked out on first use and
+    handed back by close(), which also rolls back anything left uncommitted.
+    Round trips to the database (statements, commits, rollbacks) are counted per unit and, for units
+    opened with a label, totalled per label in UnitOfWork.stats().
+    A unit may have a deadline (a time.monotonic() value, e.g. the end of its command's time budget):
+    waiting for a connection and retrying transient errors (see retry) stop there. The first statement
+    of a transaction is retried on its own, since nothing is lost by sending it again: after a failover
+    every pooled connection is dead, and the next statement on each one reconnects instead of failing
+    its command (see CountingCursor.send).
+    A unit opened with read_after (the time its session last wrote, see last_write) only reads: it is
+    routed to a read replica that has caught up with that time, if there is one (see ReplicaRouter),
+    and refuses to write there.
+    '''
+
+    # label -> {"units", "round_trips", "max_round_trips"}
+    _totals = {}
+    _totals_lock = threading.Lock()
+
+    def __init__(self, label=None, deadline=None, read_after=None):
+        self.label = label
+        self.deadline = deadline
+        self.read_after = read_after
+        self.cm = ConnectionManager()
+        self.conn = None
+        # the replica the unit reads from, None for the primary
+        self.target = None
+        # whether statements since the last commit wrote, and the time.time() the last such commit returned
+        self.wrote = False
+        self.last_write = None
+        # whether a statement was sent since the last commit or rollback
+        self.in_transaction = False
+        self.round_trips = 0
+        self._on_commit = []
+
+    def cursor(self, as_dict=False):
+        self.connection()
+        return CountingCursor(self, as_dict)
+
+    def connection(self):
+        if self.conn is None:
+            self.connect()
+        return self.conn
+
+    def connect(self):
+        router = ReplicaRouter.configured() if self.read_after is not None else None
+        self.target = router.choose(self.read_after) if router is not None else None
+        if self.target is not None:
+            try:
+                self.conn = self.cm.create_connection(self.deadline, self.target)
+                return
+            except DatabaseUnavailable:
+                router.mark_down(self.target)
+                self.target = None
+        self.conn = self.cm.create_connection(self.deadline)
+
+    # Takes the write lock now rather than at the first write (see Backend.begin), so rows read
+    # afterwards stay as read until commit. A no-op when the unit already holds it.
+    def begin(self):
+        if self.connection().begin():
+            self.round_trips += 1
+        self.in_transaction = True
+
+    # run fn once the current transaction commits; dropped if it rolls back
+    def on_commit(self, fn):
+        self._on_commit.append(fn)
+
+    # whether writes in this unit registered on_commit callbacks that haven't run yet. Reads through
+    # it may then see uncommitted rows, so the read caches load them directly instead of caching them.
+    def uncommitted(self):
+        return len(self._on_commit) > 0
+
+    # Whether the process-wide read caches may serve this unit and be filled through it. Not with
+    # uncommitted writes, nor when it reads (or, not connected yet, may read) from a replica: a replica
+    # may not have caught up with the write that last invalidated an entry, and a session that wrote
+    # must find its own write there. Units on the primary fill the caches with what is committed.
+    def cacheable(self):
+        if self.uncommitted():
+            return False
+        if self.conn is not None:
+            return self.target is None
+        return self.read_after is None or ReplicaRouter.configured() is None
+
+    def commit(self):
+        self.in_transaction = False
+        if self.conn is not None:
+            self.conn.commit()
+            self.round_trips += 1
+            if self.wrote:
+                self.last_write = time.time()
+                self.wrote = False
+        callbacks, self._on_commit = self._on_commit, []
+        for fn in callbacks:
+            fn()
+
+    # undoes everything since the last commit, whichever model method wrote it. A connection that
+    # can't even roll back is broken: it is discarded (taking the transaction with it) and the next
+    # cursor() checks out another.
+    def rollback(self):
+        self.wrote = False
+        self.in_transaction = False
+        if self.conn is not None:
+            try:
+                self.conn.rollback()
+                self.round_trips += 1
+            except DatabaseError:
+                self.cm.close_connection(discard=True)
+                self.conn = None
+        self._on_commit = []
+
+    # Get ready to send the first statement of a transaction again after it failed with the transient
+    # error err. A deadlock victim's connection is fine and is only rolled back; any other connection
+    # is taken to be dropped: it is discarded, counting against the circuit breaker, and the next
+    # statement checks out another.
+    def restart(self, err):
+        self.in_transaction = False
+        if ConnectionManager.backend().is_deadlock(err):
+            try:
+                self.conn.rollback()
+                self.round_trips += 1
+                return
+            except DatabaseError:
+                pass
+        else:
+            ConnectionManager.breaker(self.target).failure()
+        self.cm.close_connection(discard=True)
+        self.conn = None
+
+    def close(self):
+        self._on_commit = []
+        self.in_transaction = False
+        self.cm.close_connection()
+        self.conn = None
+        Metrics.add_round_trips(self.round_trips)
+        if self.label is not None:
+            with UnitOfWork._totals_lock:
+                totals = UnitOfWork._totals.setdefault(self.label, {"units": 0, "round_trips": 0,
+                                                                    "max_round_trips": 0})
+                totals["units"] += 1
+                totals["round_trips"] += self.round_trips
+                totals["max_round_trips"] = max(totals["max_round_trips"], self.round_trips)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    # The unit a model method runs in: work itself when the caller passed one, otherwise a unit of its own
+    # that commits when the block completes (unless commit=False, for reads) and is closed either way.
+    @staticmethod
+    @contextlib.contextmanager
+    def join(work, commit=True):
+        if work is not None:
+            yield work
+            return
+        work = UnitOfWork()
+        try:
+            yield work
+            if commit:
+                work.commit()
+        finally:
+            work.close()
+
+    # Run fn(unit) in a unit of work, retrying it while it fails with a transient error (see
+    # Backend.is_transient), as RetryPolicy allows and until the unit's deadline. Without a unit, each
+    # attempt runs and commits in one of its own; a given unit is rolled back before the next attempt,
+    # which undoes everything it did so far. on_retry, if given, is called before each retry.
+    @staticmethod
+    def retry(fn, work=None, on_retry=None):
+        policy = RetryPolicy.configured()
+        attempt = 1
+        while True:
+            try:
+                with UnitOfWork.join(work) as unit:
+                    return fn(unit)
+            except DatabaseUnavailable:
+                # connecting was retried already
+                raise
+            except DatabaseError as e:
+                delay = None
+                if ConnectionManager.backend().is_transient(e):
+                    delay = policy.backoff(attempt, work.deadline if work is not None else None)
+                if delay is None:
+                    raise
+                if work is not None:
+                    work.rollback()
+            if on_retry is not None:
+                on_retry()
+            time.sleep(delay)
+            attempt += 1
+
+    # per label: units run, round trips in total and the most in a single unit
+    @staticmethod
+    def stats():
+        with UnitOfWork._totals_lock:
+            return {label: dict(totals) for label, totals in UnitOfWork._totals.items()}
+
+
+class CountingCursor:
+    # a cursor that counts the statements it sends against its unit of work
+
+    def __init__(self, work, as_dict=False):
+        self.work = work
+        self.as_dict = as_dict
+        # the driver cursor, made by the first statement on the unit's connection at that time
+        self.cursor = None
+        self.conn = None
+
+    def execute(self, sql, params=None):
+        self.check_write(sql)
+        self.send(lambda cursor: cursor.execute(sql, params), 1)
+
+    def executemany(self, sql, seq_of_params):
+        self.check_write(sql)
+        # the drivers send one statement per row
+        seq_of_params = list(seq_of_params)
+        self.send(lambda cursor: cursor.executemany(sql, seq_of_params), len(seq_of_params))
+
+    # Run fn(driver cursor), which sends round_trips statements. The first statement of a transaction
+    # is sent again while it fails with a transient error, as RetryPolicy allows and until the unit's
+    # deadline, on a new connection if the old one was dropped (see UnitOfWork.restart); a later one
+    # raises, and the whole transaction is for UnitOfWork.retry to run again.
+    def send(self, fn, round_trips):
+        policy = RetryPolicy.configured()
+        attempt = 1
+        while True:
+            first = not self.work.in_transaction
+            try:
+                if self.conn is not self.work.conn or self.cursor is None:
+                    # first use, or the unit reconnected since
+                    self.cursor = self.work.connection().cursor(as_dict=self.as_dict)
+                    self.conn = self.work.conn
+                self.work.in_transaction = True
+                self.work.round_trips += round_trips
+                return fn(self.cursor)
+            except DatabaseUnavailable:
+                raise
+            except DatabaseError as e:
+                delay = None
+                if first and ConnectionManager.backend().is_transient(e):
+                    delay = policy.backoff(attempt, self.work.deadline)
+                if delay is None:
+                    raise
+                self.work.restart(e)
+            time.sleep(delay)
+            attempt += 1
+
+    def check_write(self, sql):
+        if is_write(sql):
+            if self.work.target is not None:
+                raise DatabaseError("Writes go to the primary, not to replica " + self.work.target)
+            self.work.wrote = True
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def nextset(self):
+        return self.cursor.nextset()
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+# whether sql may change data; checked for every statement, which are mostly the same few strings
+@functools.lru_cache(maxsize=1024)
+def is_write(sql):
+    return _WRITE.search(sql) is not None
+
+
+_WRITE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|CREATE|DROP|ALTER|TRUNCATE)\b", re.IGNORECASE)
@@ -0,0 +1,355 @@
+import sys
+sys.path.append("../db/*")
+from db.ConnectionManager import ConnectionManager
+from db.UnitOfWork import UnitOfWork
+from model.Caregiver import Caregiver
+from model.Vaccine import Vaccine
+from model.CaregiverSelection import CaregiverSelection
+from util.Util import Util
+import datetime
+import threading
+
+
+_retry_lock = threading.Lock()
+
+
+class Appointment:
+
+    RESERVED = "reserved"
+    NO_CAREGIVER = "no_caregiver"
+    NO_DOSES = "no_doses"
+
+    # caregivers ranked at a time per reservation; the next ones are tried when a concurrent reservation
+    # wins a row, and the next CANDIDATES ranked once all of them were won
+    CANDIDATES = 32
+    # reservations and cancellations retried by this process after a transient error (mostly deadlock
+    # victims), for benchmarks and monitoring
+    deadlock_retries = 0
+    PAGE_SIZE = 500
+
+    # Claims a caregiver slot, decrements the dose count and books the appointment in one batch.
+    # The CaregiverSelection strategy fills in how the candidate slots are ranked (earliest slot first
+    # for the same caregiver); the batch then takes one unit of capacity from them one at a time by primary
+    # key with READPAST, so a slot another reservation is claiming is skipped instead of waited on, and
+    # only the claimed slot stays locked. A slot whose capacity runs out is deleted in the same transaction,
+    # so Availabilities only holds open slots. The conditional decrements mean neither Capacity nor Doses
+    # can go below zero. With %(slot)s set, only slots at that time of day are considered.
+    reserve_batch = """
+        SET NOCOUNT ON;
+        DECLARE @claimed TABLE (Username varchar(255), SlotTime time(0));
+        DECLARE @booked TABLE (Id int);
+        DECLARE @candidates TABLE (Rank int IDENTITY(1, 1) PRIMARY KEY, Username varchar(255), SlotTime time(0));
+        DECLARE @rank int = 0;
+        DECLARE @candidate varchar(255);
+        DECLARE @slot time(0);
+
+        WHILE NOT EXISTS (SELECT 1 FROM @claimed)
+        BEGIN
+            SELECT TOP (1) @rank = Rank, @candidate = Username, @slot = SlotTime FROM @candidates
+            WHERE Rank > @rank ORDER BY Rank;
+            IF @@ROWCOUNT = 0
+            BEGIN
+                -- every candidate so far went to concurrent reservations: rank the next ones, leaving out
+                -- those already tried, until no open slot is left
+                INSERT INTO @candidates (Username, SlotTime)
+                SELECT TOP (%(candidates)d) a.Username, a.SlotTime FROM Availabilities a WITH (READPAST)
+                WHERE a.Time = %(time)s AND a.Capacity > 0 AND (%(slot)s IS NULL OR a.SlotTime = %(slot)s){condition}
+                    AND NOT EXISTS (SELECT 1 FROM @candidates t WHERE t.Username = a.Username AND t.SlotTime = a.SlotTime)
+                ORDER BY {order_by}, a.SlotTime;
+                IF @@ROWCOUNT = 0
+                    BREAK;
+                CONTINUE;
+            END
+            UPDATE Availabilities WITH (ROWLOCK, READPAST) SET Capacity = Capacity - 1
+            OUTPUT inserted.Username, inserted.SlotTime INTO @claimed
+            WHERE Time = %(time)s AND Username = @candidate AND SlotTime = @slot AND Capacity > 0;
+        END
+
+        IF NOT EXISTS (SELECT 1 FROM @claimed)
+            SELECT 'no_caregiver' AS Status, NULL AS Id, NULL AS Cusername, NULL AS SlotTime;
+        ELSE
+        BEGIN
+            DELETE FROM Availabilities
+            WHERE Time = %(time)s AND Username = @candidate AND SlotTime = @slot AND Capacity = 0;
+
+            UPDATE Vaccines SET Doses = Doses - 1 WHERE Name = %(vaccine)s AND Doses > 0;
+            IF @@ROWCOUNT = 0
+                SELECT 'no_doses' AS Status, NULL AS Id, NULL AS Cusername, NULL AS SlotTime;
+            ELSE
+            BEGIN
+                INSERT INTO Appointment (Time, SlotTime, Cusername, Pusername, Vname)
+                OUTPUT inserted.Id INTO @booked
+                SELECT %(time)s, SlotTime, Username, %(patient)s, %(vaccine)s FROM @claimed;
+
+                SELECT 'reserved' AS Status, b.Id, c.Username AS Cusername, c.SlotTime
+                FROM @booked b CROSS JOIN @claimed c;
+            END
+        END
+    """
+
+    def __init__(self, time, vaccine_name, patient_username, caregiver_username=None, appointment_id=None,
+                 selection=None, slot_time=None):
+        self.time = time
+        # the time of day, or None for any slot when reserving
+        self.slot_time = slot_time
+        self.vaccine_name = vaccine_name
+        self.patient_username = patient_username
+        self.caregiver_username = caregiver_username
+        self.appointment_id = appointment_id
+        self.selection = selection
+
+    def get_id(self):
+        return self.appointment_id
+
+    def get_caregiver_username(self):
+        return self.caregiver_username
+
+    def get_slot_time(self):
+        return self.slot_time
+
+    # Book this appointment atomically; returns RESERVED, NO_CAREGIVER or NO_DOSES.
+    # Nothing is written unless the whole reservation succeeds: otherwise the unit of work is rolled back.
+    def reserve(self, work=None):
+        return retry_transient(self._try_reserve, work)
+
+    def _try_reserve(self, work):
+        cursor = work.cursor(as_dict=True)
+
+        selection = self.selection or CaregiverSelection.configured()
+        slot = Util.format_time(self.slot_time) if self.slot_time is not None else None
+        params = dict(selection.params(), time=self.time, slot=slot, vaccine=self.vaccine_name,
+                      patient=self.patient_username, candidates=Appointment.CANDIDATES)
+        if ConnectionManager.backend().name == "sqlite":
+            # take the write lock before reading, so the candidates read are still open when claimed
+            work.begin()
+            row = Appointment._reserve_sqlite(cursor, selection, params)
+        else:
+            cursor.execute(Appointment.reserve_batch.format(order_by=selection.order_by(),
+                                                            condition=selection.condition()), params)
+            row = cursor.fetchone()
+        if row is None or row["Status"] != Appointment.RESERVED:
+            work.rollback()
+            return row["Status"] if row is not None else Appointment.NO_CAREGIVER
+        work.on_commit(lambda: Caregiver.invalidate_availability(self.time))
+        work.on_commit(Vaccine.cache.clear)
+        self.appointment_id = row["Id"]
+        self.caregiver_username = row["Cusername"]
+        self.slot_time = row["SlotTime"]
+        selection.chosen(self.caregiver_username)
+        return Appointment.RESERVED
+
+    # The same steps as reserve_batch, one statement at a time, in a transaction that already holds the
+    # write lock: SQLite has a single writer, so no other reservation can take a candidate between the
+    # read and the claim. Returns the status row reserve_batch would.
+    @staticmethod
+    def _reserve_sqlite(cursor, selection, params):
+        get_candidates = """
+            SELECT a.Username, a.SlotTime FROM Availabilities a
+            WHERE a.Time = %(time)s AND a.Capacity > 0 AND (%(slot)s IS NULL OR a.SlotTime = %(slot)s){condition}
+            ORDER BY {order_by}, a.SlotTime
+            LIMIT %(candidates)d
+        """.format(order_by=selection.order_by(), condition=selection.condition())
+        cursor.execute(get_candidates, params)
+        claimed = None
+        for candidate in cursor.fetchall():
+            cursor.execute("UPDATE Availabilities SET Capacity = Capacity - 1"
+                           " WHERE Time = %s AND Username = %s AND SlotTime = %s AND Capacity > 0",
+                           (params["time"], candidate["Username"], candidate["SlotTime"]))
+            if cursor.rowcount == 1:
+                claimed = candidate
+                break
+        if claimed is None:
+            return {"Status": Appointment.NO_CAREGIVER, "Id": None, "Cusername": None, "SlotTime": None}
+
+        cursor.execute("DELETE FROM Availabilities WHERE Time = %s AND Username = %s AND SlotTime = %s AND Capacity = 0",
+                       (params["time"], claimed["Username"], claimed["SlotTime"]))
+        cursor.execute("UPDATE Vaccines SET Doses = Doses - 1 WHERE Name = %(vaccine)s AND Doses > 0", params)
+        if cursor.rowcount == 0:
+            return {"Status": Appointment.NO_DOSES, "Id": None, "Cusername": None, "SlotTime": None}
+        cursor.execute("INSERT INTO Appointment (Time, SlotTime, Cusername, Pusername, Vname) VALUES (%s, %s, %s, %s, %s)",
+                       (params["time"], claimed["SlotTime"], claimed["Username"], params["patient"], params["vaccine"]))
+        return {"Status": Appointment.RESERVED, "Id": cursor.lastrowid, "Cusername": claimed["Username"],
+                "SlotTime": claimed["SlotTime"]}
+
+    # Cancel one appointment owned by username (as patient or caregiver). The appointment is deleted, its
+    # place given back to the caregiver's slot and the dose returned to Vaccines in one transaction.
+    # Returns the cancelled appointment, or None if there is no such appointment for this user.
+    @staticmethod
+    def cancel(appointment_id, username, work=None):
+        cancelled = retry_transient(lambda work: Appointment._cancel_where(
+            work, "Id = %(id)d AND (Pusername = %(user)s OR Cusername = %(user)s)",
+            {"id": appointment_id, "user": username}, restore_availability=True), work)
+        return cancelled[0] if cancelled else None
+
+    # Cancel every appointment of a caregiver (role "caregiver") or patient (role "patient") between start
+    # and end (inclusive) with set-based statements in one transaction. Doses always go back to Vaccines;
+    # slot capacity is restored for patient cancellations only, since a caregiver cancelling a day is not free
+    # that day. Returns the cancelled appointments.
+    @staticmethod
+    def cancel_for_user(role, username, start, end, work=None):
+        column = {"caregiver": "Cusername", "patient": "Pusername"}[role]
+        return retry_transient(lambda work: Appointment._cancel_where(
+            work, column + " = %(user)s AND Time BETWEEN %(start)s AND %(end)s",
+            {"user": username, "start": start, "end": end}, restore_availability=(role == "patient")), work)
+
+    @staticmethod
+    def _cancel_where(work, condition, params, restore_availability):
+        cursor = work.cursor(as_dict=True)
+
+        cancel_batch = """
+            SET NOCOUNT ON;
+            DECLARE @cancelled TABLE (Id int, Time date, SlotTime time(0), Cusername varchar(255),
+                                      Pusername varchar(255), Vname varchar(255));
+            DECLARE @freed TABLE (Time date, Username varchar(255), SlotTime time(0), Freed int);
+
+            -- held to the end, so the dose usage summary isn't refreshed in between (see service/DoseForecast.py)
+            DECLARE @summarized int = (SELECT LastId FROM DoseUsageWatermark WITH (HOLDLOCK) WHERE Id = 1);
+
+            DELETE FROM Appointment
+            OUTPUT deleted.Id, deleted.Time, deleted.SlotTime, deleted.Cusername, deleted.Pusername, deleted.Vname
+            INTO @cancelled
+            WHERE """ + condition + """;
+
+            -- appointments booked before slots existed hold the whole day
+            IF %(restore)d = 1
+            BEGIN
+                INSERT INTO @freed
+                SELECT Time, Cusername, ISNULL(SlotTime, '00:00'), COUNT(*) FROM @cancelled
+                GROUP BY Time, Cusername, ISNULL(SlotTime, '00:00');
+
+                UPDATE a SET Capacity = a.Capacity + f.Freed
+                FROM Availabilities a JOIN @freed f
+                    ON a.Time = f.Time AND a.Username = f.Username AND a.SlotTime = f.SlotTime;
+
+                INSERT INTO Availabilities (Time, Username, SlotTime, Capacity)
+                SELECT f.Time, f.Username, f.SlotTime, f.Freed FROM @freed f
+                WHERE NOT EXISTS (SELECT 1 FROM Availabilities WITH (UPDLOCK, HOLDLOCK)
+                                  WHERE Time = f.Time AND Username = f.Username AND SlotTime = f.SlotTime);
+            END
+
+            UPDATE v SET Doses = v.Doses + c.Cancelled
+            FROM Vaccines v JOIN (SELECT Vname, COUNT(*) AS Cancelled FROM @cancelled GROUP BY Vname) c
+                ON v.Name = c.Vname;
+
+            UPDATE d SET Booked = d.Booked - c.Cancelled
+            FROM DailyDoseUsage d JOIN (SELECT Vname, Time, COUNT(*) AS Cancelled FROM @cancelled
+                                        WHERE Id <= @summarized GROUP BY Vname, Time) c
+                ON d.Vname = c.Vname AND d.Time = c.Time;
+
+            SELECT Id, Time, SlotTime, Cusername, Pusername, Vname FROM @cancelled ORDER BY Id;
+        """
+        params = dict(params, restore=1 if restore_availability else 0)
+        if ConnectionManager.backend().name == "sqlite":
+            # take the write lock before reading, so the rows read are the rows deleted
+            work.begin()
+            rows = Appointment._cancel_sqlite(cursor, condition, params)
+        else:
+            cursor.execute(cancel_batch, params)
+            rows = cursor.fetchall()
+
+        if rows:
+            work.on_commit(Vaccine.cache.clear)
+            for row in rows:
+                work.on_commit(lambda d=row["Time"]: Caregiver.invalidate_availability(d))
+        return [Appointment(row["Time"], row["Vname"], row["Pusername"], row["Cusername"], row["Id"],
+                            slot_time=row["SlotTime"]) for row in rows]
+
+    # The same steps as the cancel batch, one statement at a time; returns the cancelled rows
+    @staticmethod
+    def _cancel_sqlite(cursor, condition, params):
+        cursor.execute("SELECT Id, Time, SlotTime, Cusername, Pusername, Vname FROM Appointment WHERE "
+                       + condition + " ORDER BY Id", params)
+        rows = cursor.fetchall()
+        if len(rows) == 0:
+            return rows
+        cursor.execute("DELETE FROM Appointment WHERE " + condition, params)
+
+        if params["restore"] == 1:
+            freed = {}
+            for row in rows:
+                # appointments booked before slots existed hold the whole day
+                key = (row["Time"], row["Cusername"], Util.format_time(row["SlotTime"] or Util.ALL_DAY))
+                freed[key] = freed.get(key, 0) + 1
+            cursor.executemany("INSERT INTO Availabilities (Time, Username, SlotTime, Capacity) VALUES (%s, %s, %s, %d)"
+                               " ON CONFLICT (Time, Username, SlotTime) DO UPDATE SET Capacity = Capacity + excluded.Capacity",
+                               [key + (count,) for key, count in freed.items()])
+
+        returned = {}
+        for row in rows:
+            returned[row["Vname"]] = returned.get(row["Vname"], 0) + 1
+        cursor.executemany("UPDATE Vaccines SET Doses = Doses + %d WHERE Name = %s",
+                           [(count, name) for name, count in returned.items()])
+
+        # only the appointments already counted in the dose usage summary are taken out of it
+        cursor.execute("SELECT LastId FROM DoseUsageWatermark WHERE Id = 1")
+        summarized = cursor.fetchone()["LastId"]
+        unbooked = {}
+        for row in rows:
+            if row["Id"] <= summarized:
+                key = (row["Vname"], row["Time"])
+                unbooked[key] = unbooked.get(key, 0) + 1
+        cursor.executemany("UPDATE DailyDoseUsage SET Booked = Booked - %d WHERE Vname = %s AND Time = %s",
+                           [(count,) + key for key, count in unbooked.items()])
+        return rows
+
+    # Stream the appointments of a caregiver (role "caregiver") or patient (role "patient") in Id order.
+    # Rows are fetched page_size at a time with keyset pagination (Id > last seen Id), so memory stays
+    # constant however many rows there are. Without a unit of work, the connection is returned to the pool
+    # between pages.
+    # Optional filters: start/end dates (inclusive), a vaccine name, or upcoming only (from today on).
+    @staticmethod
+    def iter_for_user(role, username, start=None, end=None, vaccine=None, upcoming=False, page_size=None,
+                      work=None):
+        column = {"caregiver": "Cusername", "patient": "Pusername"}[role]
+        page_size = page_size or Appointment.PAGE_SIZE
+        if upcoming:
+            today = datetime.date.today()
+            start = today if start is None else max(start, today)
+
+        filters = ""
+        filter_params = []
+        if start is not None:
+            filters += " AND Time >= %s"
+            filter_params.append(start)
+        if end is not None:
+            filters += " AND Time <= %s"
+            filter_params.append(end)
+        if vaccine is not None:
+            filters += " AND Vname = %s"
+            filter_params.append(vaccine)
+        if ConnectionManager.backend().name == "sqlite":
+            get_page = ("SELECT Id, Vname, Time, SlotTime, Cusername, Pusername FROM Appointment"
+                        " WHERE " + column + " = %s AND Id > %d" + filters + " ORDER BY Id LIMIT %d")
+        else:
+            get_page = ("SELECT TOP (%d) Id, Vname, Time, SlotTime, Cusername, Pusername FROM Appointment"
+                        " WHERE " + column + " = %s AND Id > %d" + filters + " ORDER BY Id")
+
+        last_id = 0
+        while True:
+            with UnitOfWork.join(work, commit=False) as unit:
+                cursor = unit.cursor(as_dict=True)
+                if ConnectionManager.backend().name == "sqlite":
+                    cursor.execute(get_page, tuple([username, last_id] + filter_params + [page_size]))
+                else:
+                    cursor.execute(get_page, tuple([page_size, username, last_id] + filter_params))
+                rows = cursor.fetchall()
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]["Id"]
+
+    def __str__(self):
+        return (f"Appointment ID: {self.appointment_id}, Caregiver username: {self.caregiver_username}, "
+                f"Time: {Util.format_slot(self.slot_time)}")
+
+
+def count_retry():
+    with _retry_lock:
+        Appointment.deadlock_retries += 1
+
+
+# Run fn(work) in a unit of work, retrying it while it fails with a transient error such as a deadlock,
+# see UnitOfWork.retry
+def retry_transient(fn, work=None):
+    return UnitOfWork.retry(fn, work, count_retry)
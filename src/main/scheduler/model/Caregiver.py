@@ -3,43 +3,162 @@ sys.path.append("../util/*")
 sys.path.append("../db/*")
 from util.Util import Util
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db.UnitOfWork import UnitOfWork
+from db.ReadCache import ReadCache
+from util.Metrics import Metrics
+import datetime
+import os
 
 
 class Caregiver:
-    def __init__(self, username, password=None, salt=None, hash=None):
+
+    # rows per multi-row INSERT into Availabilities: four parameters a row, at most 2100 per statement
+    INSERT_CHUNK = 500
+    SEARCH_PAGE_SIZE = 31
+
+    # date -> open slots per caregiver that day (see get_available); invalidated by uploads and reservations
+    availability_cache = ReadCache(ttl=float(os.getenv("CacheTTL", "5")),
+                                   max_size=int(os.getenv("CacheMaxDates", "1024")))
+
+    def __init__(self, username, password=None, salt=None, hash=None, hash_params=None):
         self.username = username
         self.password = password
         self.salt = salt
         self.hash = hash
+        self.hash_params = hash_params
 
     # getters
-    def get(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
-
-        get_caregiver_details = "SELECT Salt, Hash FROM Caregivers WHERE Username = %s"
-        try:
+    def get(self, work=None):
+        get_caregiver_details = "SELECT Salt, Hash, HashParams FROM Caregivers WHERE Username = %s"
+        with UnitOfWork.join(work, commit=False) as unit:
+            cursor = unit.cursor(as_dict=True)
             cursor.execute(get_caregiver_details, self.username)
-            for row in cursor:
-                curr_salt = row['Salt']
-                curr_hash = row['Hash']
-                calculated_hash = Util.generate_hash(self.password, curr_salt)
-                if not curr_hash == calculated_hash:
-                    # print("Incorrect password")
-                    cm.close_connection()
-                    return None
-                else:
-                    self.salt = curr_salt
-                    self.hash = calculated_hash
-                    cm.close_connection()
-                    return self
-        except pymssql.Error as e:
-            raise e
-        finally:
-            cm.close_connection()
-        return None
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        curr_salt = row['Salt']
+        curr_hash = row['Hash']
+        curr_params = row['HashParams']
+        if not Util.verify_hash(self.password, curr_salt, curr_hash, curr_params):
+            # print("Incorrect password")
+            return None
+        self.salt = curr_salt
+        self.hash = curr_hash
+        self.hash_params = curr_params
+        # the stored hash uses outdated parameters: upgrade it now that we know the password
+        if Util.needs_rehash(curr_params):
+            self.rehash(work)
+        return self
+
+    # Re-hash the password with the configured parameters (requires the plaintext password from get())
+    def rehash(self, work=None):
+        params = Util.hash_params()
+        with Metrics.phase("hash"):
+            new_hash = Util.submit_hash(self.password, self.salt, params).result()
+
+        update_hash = "UPDATE Caregivers SET Hash = %s, HashParams = %s WHERE Username = %s"
+        with UnitOfWork.join(work) as work:
+            cursor = work.cursor()
+            cursor.execute(update_hash, (new_hash, params, self.username))
+            self.hash = new_hash
+            self.hash_params = params
+
+    # The caregivers with open slots on date d, in alphabetical order, served from the read cache.
+    # Returns (username, ((slot time, remaining capacity), ...)) pairs, slots in time order.
+    @staticmethod
+    def get_available(d, work=None):
+        d = as_date(d)
+        if work is not None and not work.cacheable():
+            return Caregiver._load_available(d, work)
+        return Caregiver.availability_cache.get(d, lambda: Caregiver._load_available(d, work))
+
+    @staticmethod
+    def _load_available(d, work=None):
+        search_caregiver = ("SELECT Username, SlotTime, Capacity FROM Availabilities"
+                            " WHERE Time = %s AND Capacity > 0 ORDER BY Username, SlotTime")
+        with UnitOfWork.join(work, commit=False) as work:
+            cursor = work.cursor()
+            cursor.execute(search_caregiver, d)
+            available = []
+            for username, slot, capacity in cursor.fetchall():
+                if len(available) == 0 or available[-1][0] != username:
+                    available.append((username, []))
+                available[-1][1].append((slot, capacity))
+            return tuple((username, tuple(slots)) for username, slots in available)
+
+    # the two result sets of search_availability for SQLite, which runs one statement per execute.
+    # group_concat joins in the order of the subquery; "Time [date]" has the driver parse the column.
+    search_range_sqlite = (
+        """
+            SELECT Name, Doses FROM Vaccines
+            WHERE Doses > 0 AND (%(vaccine)s IS NULL OR Name = %(vaccine)s)
+            ORDER BY Name
+        """,
+        """
+            SELECT c.Time AS "Time [date]", SUM(c.Capacity) AS Available, MIN(c.FirstSlot) AS FirstSlot,
+                   group_concat(c.Username, ',') AS Caregivers
+            FROM (SELECT a.Time, a.Username, SUM(a.Capacity) AS Capacity, MIN(a.SlotTime) AS FirstSlot
+                  FROM Availabilities a
+                  WHERE a.Time BETWEEN %(start)s AND %(end)s AND a.Capacity > 0
+                  GROUP BY a.Time, a.Username
+                  ORDER BY a.Time, a.Username) c
+            WHERE EXISTS (SELECT 1 FROM Vaccines WHERE Doses > 0 AND (%(vaccine)s IS NULL OR Name = %(vaccine)s))
+            GROUP BY c.Time
+            ORDER BY c.Time
+            LIMIT %(limit)d OFFSET %(offset)d
+        """,
+    )
+
+    # Availability between start and end (inclusive) aggregated per date, in one round trip on SQL Server.
+    # Only dates are returned when a vaccine (the given one, or any when vaccine is None) has doses left.
+    # Returns (vaccines, dates, has_more): vaccines as {"Name", "Doses"} rows with Doses > 0, and one
+    # {"Time", "Available", "FirstSlot", "Caregivers"} row per date for the requested page, where Available
+    # is the number of appointments left over all slots and Caregivers is comma-separated.
+    @staticmethod
+    def search_availability(start, end, vaccine=None, page=1, page_size=None, work=None):
+        if end < start:
+            raise ValueError("End date is before start date")
+        if page < 1:
+            raise ValueError("Page numbers start at 1")
+        page_size = page_size or Caregiver.SEARCH_PAGE_SIZE
+
+        search_range = """
+            SET NOCOUNT ON;
+            SELECT Name, Doses FROM Vaccines
+            WHERE Doses > 0 AND (%(vaccine)s IS NULL OR Name = %(vaccine)s)
+            ORDER BY Name;
+
+            SELECT c.Time, SUM(c.Capacity) AS Available, MIN(c.FirstSlot) AS FirstSlot,
+                   STRING_AGG(CAST(c.Username AS varchar(max)), ',') WITHIN GROUP (ORDER BY c.Username) AS Caregivers
+            FROM (SELECT a.Time, a.Username, SUM(a.Capacity) AS Capacity, MIN(a.SlotTime) AS FirstSlot
+                  FROM Availabilities a
+                  WHERE a.Time BETWEEN %(start)s AND %(end)s AND a.Capacity > 0
+                  GROUP BY a.Time, a.Username) c
+            WHERE EXISTS (SELECT 1 FROM Vaccines WHERE Doses > 0 AND (%(vaccine)s IS NULL OR Name = %(vaccine)s))
+            GROUP BY c.Time
+            ORDER BY c.Time
+            OFFSET %(offset)d ROWS FETCH NEXT %(limit)d ROWS ONLY;
+        """
+        params = {"vaccine": vaccine, "start": start, "end": end,
+                  "offset": (page - 1) * page_size, "limit": page_size + 1}
+        with UnitOfWork.join(work, commit=False) as work:
+            cursor = work.cursor(as_dict=True)
+            if ConnectionManager.backend().name == "sqlite":
+                search_vaccines, search_dates = Caregiver.search_range_sqlite
+                cursor.execute(search_vaccines, params)
+                vaccines = cursor.fetchall()
+                cursor.execute(search_dates, params)
+                dates = cursor.fetchall()
+            else:
+                cursor.execute(search_range, params)
+                vaccines = cursor.fetchall()
+                dates = cursor.fetchall() if cursor.nextset() else []
+        # one extra row was fetched to tell whether another page follows
+        return vaccines, dates[:page_size], len(dates) > page_size
+
+    @staticmethod
+    def invalidate_availability(d):
+        Caregiver.availability_cache.invalidate(as_date(d))
 
     def get_username(self):
         return self.username
@@ -50,34 +169,77 @@ class Caregiver:
     def get_hash(self):
         return self.hash
 
-    def save_to_db(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
-
-        add_caregivers = "INSERT INTO Caregivers VALUES (%s, %s, %s)"
-        try:
-            cursor.execute(add_caregivers, (self.username, self.salt, self.hash))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error:
-            raise
-        finally:
-            cm.close_connection()
-
-    # Insert availability with parameter date d
-    def upload_availability(self, d):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
-
-        add_availability = "INSERT INTO Availabilities VALUES (%s , %s)"
-        try:
-            cursor.execute(add_availability, (d, self.username))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error:
-            # print("Error occurred when updating caregiver availability")
-            raise
-        finally:
-            cm.close_connection()
+    def save_to_db(self, work=None):
+        if self.hash_params is None:
+            self.hash_params = Util.hash_params()
+
+        add_caregivers = "INSERT INTO Caregivers (Username, Salt, Hash, HashParams) VALUES (%s, %s, %s, %s)"
+        with UnitOfWork.join(work) as work:
+            cursor = work.cursor()
+            cursor.execute(add_caregivers, (self.username, self.salt, self.hash, self.hash_params))
+
+    # Insert availability with parameter date d, as (time, capacity) slots; the whole day by default.
+    # Slots that are already uploaded are skipped, as by upload_availabilities; returns whether any was new.
+    def upload_availability(self, d, slots=None, work=None):
+        return len(self.upload_availabilities([d], slots, work)) > 0
+
+    # Insert the same (time, capacity) slots (the whole day by default) on many dates in one transaction;
+    # slots that are already uploaded are skipped. Returns the set of dates that got at least one new slot.
+    # A caregiver's day is either the whole day or time-of-day slots: a date that already has open or
+    # booked slots of the other kind raises ValueError, and nothing is uploaded.
+    def upload_availabilities(self, dates, slots=None, work=None):
+        slots = slots or Util.DEFAULT_SLOTS
+        whole_day = {slot == Util.ALL_DAY for slot, _ in slots}
+        if len(whole_day) > 1:
+            raise ValueError("The whole day (00:00) cannot be combined with other slots")
+        pending = {(d, slot): capacity for d in set(dates) for slot, capacity in slots}
+        if len(pending) == 0:
+            return set()
+
+        first = min(d for d, _ in pending)
+        last = max(d for d, _ in pending)
+        # appointments booked before slots existed have no SlotTime, and hold the whole day
+        get_existing = ("SELECT Time, SlotTime, 1 FROM Availabilities WHERE Username = %s AND Time BETWEEN %s AND %s"
+                        " UNION ALL"
+                        " SELECT Time, SlotTime, 0 FROM Appointment WHERE Cusername = %s AND Time BETWEEN %s AND %s")
+        with UnitOfWork.join(work) as work:
+            cursor = work.cursor()
+            cursor.execute(get_existing, (self.username, first, last) * 2)
+            mixed = set()
+            for d, slot, is_open in cursor.fetchall():
+                slot = Util.parse_time(Util.format_time(slot)) if slot is not None else Util.ALL_DAY
+                if (slot == Util.ALL_DAY) not in whole_day:
+                    mixed.add(d)
+                elif is_open:
+                    pending.pop((d, slot), None)
+            if mixed:
+                raise ValueError(("Time-of-day slots are" if whole_day == {True} else "The whole day is")
+                                 + " already offered on " + ", ".join(d.strftime("%m-%d-%Y") for d in sorted(mixed)))
+
+            # multi-row VALUES keeps it to one round trip per chunk, within SQL Server's limits of 1000 rows
+            # per VALUES and 2100 parameters per statement
+            rows = sorted(pending.items())
+            for i in range(0, len(rows), Caregiver.INSERT_CHUNK):
+                chunk = rows[i:i + Caregiver.INSERT_CHUNK]
+                add_availability = ("INSERT INTO Availabilities (Time, Username, SlotTime, Capacity) VALUES "
+                                    + ", ".join(["(%s, %s, %s, %d)"] * len(chunk)))
+                params = []
+                for (d, slot), capacity in chunk:
+                    params.extend((d, self.username, Util.format_time(slot), capacity))
+                cursor.execute(add_availability, tuple(params))
+            inserted = {d for d, _ in pending}
+            for d in inserted:
+                work.on_commit(lambda d=d: Caregiver.invalidate_availability(d))
+        return inserted
+
+    # Insert availability for every date from start to end (inclusive) matching the recurrence pattern,
+    # see Util.expand_dates, with the given slots. Returns the set of dates that got at least one new slot.
+    def upload_availability_range(self, start, end, pattern="daily", slots=None, work=None):
+        return self.upload_availabilities(Util.expand_dates(start, end, pattern), slots, work)
+
+
+def as_date(d):
+    # cache keys are plain dates; callers pass both datetime and date objects
+    if isinstance(d, datetime.datetime):
+        return d.date()
+    return d
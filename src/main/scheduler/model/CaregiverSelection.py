@@ -0,0 +1,110 @@
+from db.ConnectionManager import ConnectionManager
+import os
+import threading
+
+
+class CaregiverSelection:
+    '''
+    Decides which free caregiver a reservation claims on a date.
+    A strategy contributes the ORDER BY (and optionally an extra WHERE condition) that ranks the free
+    Availabilities rows for date %(time)s; reserve then claims the best-ranked row no concurrent
+    reservation holds. Strategies that don't send every reserver to the same first row contend less.
+    Engine-specific expressions come from the configured backend (db/Backend.py).
+    The strategy used by reserve is chosen with the CaregiverSelection environment variable.
+    '''
+
+    name = "first"
+
+    # alphabetically first free caregiver (the original behaviour)
+    def order_by(self):
+        return "a.Username"
+
+    def condition(self):
+        return ""
+
+    def params(self):
+        return {}
+
+    # called with the caregiver a reservation ended up with
+    def chosen(self, username):
+        pass
+
+    @staticmethod
+    def configured():
+        return CaregiverSelection.named(os.getenv("CaregiverSelection", "first"))
+
+    @staticmethod
+    def named(name):
+        strategies = {
+            "first": CaregiverSelection,
+            "random": RandomSelection,
+            "least_booked": LeastBookedSelection,
+            "round_robin": RoundRobinSelection,
+            "capacity": CapacitySelection,
+        }
+        if name not in strategies:
+            raise ValueError("Unknown caregiver selection strategy: " + name)
+        return strategies[name]()
+
+
+class RandomSelection(CaregiverSelection):
+    # any free caregiver; concurrent reservers start on different rows
+    name = "random"
+
+    def order_by(self):
+        return ConnectionManager.backend().random_order()
+
+
+class LeastBookedSelection(CaregiverSelection):
+    # the caregiver with the fewest appointments in the 30 days up to the date, ties broken randomly
+    name = "least_booked"
+
+    def order_by(self):
+        backend = ConnectionManager.backend()
+        return ("(SELECT COUNT(*) FROM Appointment ap WHERE ap.Cusername = a.Username"
+                " AND ap.Time BETWEEN " + backend.add_days("%(time)s", -30) + " AND %(time)s), "
+                + backend.random_order())
+
+
+class RoundRobinSelection(CaregiverSelection):
+    # the next caregiver alphabetically after the one this process booked last, wrapping around
+    name = "round_robin"
+
+    # shared by every reservation in the process
+    _last = ""
+    _lock = threading.Lock()
+
+    def order_by(self):
+        return "CASE WHEN a.Username > %(last_caregiver)s THEN 0 ELSE 1 END, a.Username"
+
+    def params(self):
+        with RoundRobinSelection._lock:
+            return {"last_caregiver": RoundRobinSelection._last}
+
+    def chosen(self, username):
+        with RoundRobinSelection._lock:
+            RoundRobinSelection._last = username
+
+
+class CapacitySelection(CaregiverSelection):
+    # least booked among caregivers with fewer than CaregiverCapacity appointments in the date's week
+    name = "capacity"
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity or int(os.getenv("CaregiverCapacity", "5"))
+
+    @staticmethod
+    def week_bookings():
+        backend = ConnectionManager.backend()
+        return ("(SELECT COUNT(*) FROM Appointment ap WHERE ap.Cusername = a.Username"
+                " AND ap.Time BETWEEN " + backend.add_days("%(time)s", -6) + " AND " + backend.add_days("%(time)s", 6)
+                + " AND " + backend.week_of("ap.Time") + " = " + backend.week_of("%(time)s") + ")")
+
+    def order_by(self):
+        return CapacitySelection.week_bookings() + ", " + ConnectionManager.backend().random_order()
+
+    def condition(self):
+        return " AND " + CapacitySelection.week_bookings() + " < %(capacity)d"
+
+    def params(self):
+        return {"capacity": self.capacity}
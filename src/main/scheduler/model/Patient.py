@@ -2,43 +2,52 @@ import sys
 sys.path.append("../util/*")
 sys.path.append("../db/*")
 from util.Util import Util
-from db.ConnectionManager import ConnectionManager
-import pymssql
+from db.UnitOfWork import UnitOfWork
+from util.Metrics import Metrics
 
 class Patient:
-    def __init__(self, username, password=None, salt=None, hash=None):
+    def __init__(self, username, password=None, salt=None, hash=None, hash_params=None):
         self.username = username
         self.password = password
         self.salt = salt
         self.hash = hash
+        self.hash_params = hash_params
 
     # getters
-    def get(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
-
-        get_patient_details = "SELECT Salt, Hash FROM Patients WHERE Username = %s"
-        try:
+    def get(self, work=None):
+        get_patient_details = "SELECT Salt, Hash, HashParams FROM Patients WHERE Username = %s"
+        with UnitOfWork.join(work, commit=False) as unit:
+            cursor = unit.cursor(as_dict=True)
             cursor.execute(get_patient_details, self.username)
-            for row in cursor:
-                curr_salt = row['Salt']
-                curr_hash = row['Hash']
-                calculated_hash = Util.generate_hash(self.password, curr_salt)
-                if not curr_hash == calculated_hash:
-                    # print("Incorrect password")
-                    cm.close_connection()
-                    return None
-                else:
-                    self.salt = curr_salt
-                    self.hash = calculated_hash
-                    cm.close_connection()
-                    return self
-        except pymssql.Error as e:
-            raise e
-        finally:
-            cm.close_connection()
-        return None
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        curr_salt = row['Salt']
+        curr_hash = row['Hash']
+        curr_params = row['HashParams']
+        if not Util.verify_hash(self.password, curr_salt, curr_hash, curr_params):
+            # print("Incorrect password")
+            return None
+        self.salt = curr_salt
+        self.hash = curr_hash
+        self.hash_params = curr_params
+        # the stored hash uses outdated parameters: upgrade it now that we know the password
+        if Util.needs_rehash(curr_params):
+            self.rehash(work)
+        return self
+
+    # Re-hash the password with the configured parameters (requires the plaintext password from get())
+    def rehash(self, work=None):
+        params = Util.hash_params()
+        with Metrics.phase("hash"):
+            new_hash = Util.submit_hash(self.password, self.salt, params).result()
+
+        update_hash = "UPDATE Patients SET Hash = %s, HashParams = %s WHERE Username = %s"
+        with UnitOfWork.join(work) as work:
+            cursor = work.cursor()
+            cursor.execute(update_hash, (new_hash, params, self.username))
+            self.hash = new_hash
+            self.hash_params = params
 
     def get_username(self):
         return self.username
@@ -49,17 +58,11 @@ class Patient:
     def get_hash(self):
         return self.hash
 
-    def save_to_db(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
+    def save_to_db(self, work=None):
+        if self.hash_params is None:
+            self.hash_params = Util.hash_params()
 
-        add_patients = "INSERT INTO Patients VALUES (%s, %s, %s)"
-        try:
-            cursor.execute(add_patients, (self.username, self.salt, self.hash))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error:
-            raise
-        finally:
-            cm.close_connection()
+        add_patients = "INSERT INTO Patients (Username, Salt, Hash, HashParams) VALUES (%s, %s, %s, %s)"
+        with UnitOfWork.join(work) as work:
+            cursor = work.cursor()
+            cursor.execute(add_patients, (self.username, self.salt, self.hash, self.hash_params))
@@ -1,99 +1,116 @@
 import sys
 sys.path.append("../db/*")
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db.UnitOfWork import UnitOfWork
+from db.ReadCache import ReadCache
+import os
 
 
 class Vaccine:
+
+    # every vaccine with its dose count, under the single key "all"; cleared when a write below commits
+    cache = ReadCache(ttl=float(os.getenv("CacheTTL", "5")), max_size=1)
+
     def __init__(self, vaccine_name, available_doses):
         self.vaccine_name = vaccine_name
         self.available_doses = available_doses
 
     # getters
-    def get(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
-
+    def get(self, work=None):
         get_vaccine = "SELECT Name, Doses FROM Vaccines WHERE Name = %s"
-        try:
+        with UnitOfWork.join(work, commit=False) as work:
+            cursor = work.cursor()
             cursor.execute(get_vaccine, self.vaccine_name)
             for row in cursor:
                 self.available_doses = row[1]
                 return self
-        except pymssql.Error:
-            # print("Error occurred when getting Vaccine")
-            raise
-        finally:
-            cm.close_connection()
         return None
 
+    # Every vaccine as {"Name", "Doses"} rows ordered by name, served from the read cache
+    @staticmethod
+    def get_all(work=None):
+        if work is not None and not work.cacheable():
+            return Vaccine._load_all(work)
+        return Vaccine.cache.get("all", lambda: Vaccine._load_all(work))
+
+    @staticmethod
+    def _load_all(work=None):
+        get_vaccines = "SELECT Name, Doses FROM Vaccines ORDER BY Name"
+        with UnitOfWork.join(work, commit=False) as work:
+            cursor = work.cursor(as_dict=True)
+            cursor.execute(get_vaccines)
+            return tuple(cursor.fetchall())
+
     def get_vaccine_name(self):
         return self.vaccine_name
 
     def get_available_doses(self):
         return self.available_doses
 
-    def save_to_db(self):
+    def save_to_db(self, work=None):
         if self.available_doses is None or self.available_doses <= 0:
             raise ValueError("Argument cannot be negative!")
 
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
-
         add_doses = "INSERT INTO VACCINES VALUES (%s, %d)"
-        try:
+        with UnitOfWork.join(work) as work:
+            cursor = work.cursor()
             cursor.execute(add_doses, (self.vaccine_name, self.available_doses))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error:
-            # print("Error occurred when insert Vaccines")
-            raise
-        finally:
-            cm.close_connection()
+            work.on_commit(Vaccine.cache.clear)
 
     # Increment the available doses
-    def increase_available_doses(self, num):
+    def increase_available_doses(self, num, work=None):
         if num <= 0:
             raise ValueError("Argument cannot be negative!")
         self.available_doses += num
 
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
-
-        update_vaccine_availability = "UPDATE vaccines SET Doses = %d WHERE name = %s"
-        try:
-            cursor.execute(update_vaccine_availability, (self.available_doses, self.vaccine_name))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error:
-            # print("Error occurred when updating vaccine availability")
-            raise
-        finally:
-            cm.close_connection()
+        # relative update so concurrent writers can't overwrite each other's counts
+        update_vaccine_availability = "UPDATE vaccines SET Doses = Doses + %d WHERE name = %s"
+        with UnitOfWork.join(work) as work:
+            cursor = work.cursor()
+            cursor.execute(update_vaccine_availability, (num, self.vaccine_name))
+            work.on_commit(Vaccine.cache.clear)
 
     # Decrement the available doses
-    def decrease_available_doses(self, num):
+    def decrease_available_doses(self, num, work=None):
         if self.available_doses - num < 0:
-            ValueError("Not enough available doses!")
-        self.available_doses -= num
-
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor()
-
-        update_vaccine_availability = "UPDATE vaccines SET Doses = %d WHERE name = %s"
-        try:
-            cursor.execute(update_vaccine_availability, (self.available_doses, self.vaccine_name))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error:
-            # print("Error occurred when updating vaccine availability")
-            raise
-        finally:
-            cm.close_connection()
+            raise ValueError("Not enough available doses!")
+
+        # conditional decrement: the row is only touched if there are still enough doses left
+        update_vaccine_availability = "UPDATE vaccines SET Doses = Doses - %d WHERE name = %s AND Doses >= %d"
+        with UnitOfWork.join(work) as work:
+            cursor = work.cursor()
+            cursor.execute(update_vaccine_availability, (num, self.vaccine_name, num))
+            if cursor.rowcount == 0:
+                raise ValueError("Not enough available doses!")
+            work.on_commit(Vaccine.cache.clear)
+            self.available_doses -= num
+
+    # Add doses to many vaccines in one transaction; doses_by_name maps vaccine name -> doses to add.
+    # Vaccines that don't exist yet are created.
+    @staticmethod
+    def add_doses_bulk(doses_by_name, work=None):
+        for num in doses_by_name.values():
+            if num <= 0:
+                raise ValueError("Argument cannot be negative!")
+        if len(doses_by_name) == 0:
+            return
+
+        if ConnectionManager.backend().name == "sqlite":
+            upsert_doses = """
+                INSERT INTO Vaccines (Name, Doses) VALUES (%(name)s, %(doses)d)
+                ON CONFLICT (Name) DO UPDATE SET Doses = Doses + excluded.Doses
+            """
+        else:
+            upsert_doses = """
+                UPDATE Vaccines SET Doses = Doses + %(doses)d WHERE Name = %(name)s;
+                IF @@ROWCOUNT = 0
+                    INSERT INTO Vaccines VALUES (%(name)s, %(doses)d);
+            """
+        with UnitOfWork.join(work) as work:
+            cursor = work.cursor()
+            for name, num in doses_by_name.items():
+                cursor.execute(upsert_doses, {"name": name, "doses": num})
+            work.on_commit(Vaccine.cache.clear)
 
     def __str__(self):
         return f"(Vaccine Name: {self.vaccine_name}, Available Doses: {self.available_doses})"
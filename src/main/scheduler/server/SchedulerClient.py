@@ -0,0 +1,39 @@
+import asyncio
+import json
+
+
+class SchedulerClient:
+    '''
+    Minimal asyncio client for server/SchedulerServer.py; keeps the session token between requests.
+    '''
+
+    def __init__(self, host="127.0.0.1", port=8765):
+        self.host = host
+        self.port = port
+        self.token = None
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, command):
+        self.writer.write((json.dumps({"session": self.token, "command": command}) + "\n").encode("utf-8"))
+        await self.writer.drain()
+        response = json.loads(await self.reader.readline())
+        # a failed command still answers with its session, which may be a new one, so keep the token first
+        if "session" in response:
+            self.token = None if response.get("closed") else response["session"]
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["output"]
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
@@ -0,0 +1,114 @@
+'''
+Multi-session network front-end for the scheduler.
+
+Line protocol over TCP, one JSON object per line in each direction:
+    request:  {"session": <token or null>, "command": "reserve 01-02-2022 Pfizer"}
+    response: {"session": <token>, "output": "<what the command printed>", "closed": false}
+A request without a session token opens a new session and the response carries its token; the token
+identifies the session on later requests, from any connection, until it is closed with "quit" or
+expires after SessionIdleTimeout seconds without use. Errors come back as {"error": "..."}.
+'''
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import asyncio
+import json
+import secrets
+import time
+from collections import OrderedDict
+
+from service.AsyncScheduler import AsyncScheduler
+from server.SchedulerClient import parse_address
+
+
+class SchedulerServer:
+
+    def __init__(self, service=None, idle_timeout=None, max_sessions=None):
+        self.service = service or AsyncScheduler()
+        self.idle_timeout = idle_timeout or float(os.getenv("SessionIdleTimeout", "1800"))
+        self.max_sessions = max_sessions or int(os.getenv("MaxSessions", "10000"))
+        # token -> (session, last_used); least recently used first
+        self.sessions = OrderedDict()
+
+    def open_session(self):
+        self.expire_sessions()
+        while len(self.sessions) >= self.max_sessions:
+            self.sessions.popitem(last=False)
+        token = secrets.token_urlsafe(24)
+        session = self.service.new_session()
+        self.sessions[token] = (session, time.monotonic())
+        return token, session
+
+    def lookup(self, token):
+        entry = self.sessions.get(token)
+        if entry is None:
+            return None
+        session, last_used = entry
+        if time.monotonic() - last_used > self.idle_timeout:
+            del self.sessions[token]
+            return None
+        self.sessions[token] = (session, time.monotonic())
+        self.sessions.move_to_end(token)
+        return session
+
+    def expire_sessions(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        while self.sessions:
+            token, (session, last_used) = next(iter(self.sessions.items()))
+            if last_used >= cutoff:
+                break
+            del self.sessions[token]
+
+    async def dispatch(self, request):
+        token = request.get("session")
+        command = request.get("command")
+        if not isinstance(command, str):
+            return {"error": "missing command"}
+        if token is None:
+            token, session = self.open_session()
+        else:
+            session = self.lookup(token)
+            if session is None:
+                return {"error": "unknown or expired session"}
+
+        try:
+            output = await self.service.execute_line(session, command)
+        except Exception as e:
+            # the session stays open, and the connection up, for the next command
+            return {"session": token, "error": "command failed: " + str(e)}
+        if session.closed:
+            self.sessions.pop(token, None)
+        return {"session": token, "output": output, "closed": session.closed}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                except ValueError as e:
+                    response = {"error": "bad request: " + str(e)}
+                else:
+                    response = await self.dispatch(request)
+                writer.write((json.dumps(response) + "\n").encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print("Scheduler server listening on " + host + ":" + str(port))
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    # usage (from src/main/scheduler): python server/SchedulerServer.py [host:port]
+    host, port = parse_address(sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1:8765")
+    asyncio.run(SchedulerServer().serve(host, port))
@@ -0,0 +1,100 @@
+import asyncio
+import concurrent.futures
+import os
+from service.Session import Session
+from service import Commands
+
+
+class AsyncScheduler:
+    '''
+    asyncio front-end for the scheduler commands.
+    Each operation is a coroutine taking an explicit Session; the blocking handlers in Commands run on
+    a worker pool so one event loop can serve many sessions at once. Commands of the same session run
+    one at a time, in the order they were issued.
+    '''
+
+    def __init__(self, executor=None):
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=int(os.getenv("ServiceWorkers", "32")),
+                                                             thread_name_prefix="scheduler")
+        self.executor = executor
+
+    # a session whose output is collected and returned by each call
+    def new_session(self):
+        return Session(out=[])
+
+    # Run one tokenized command for session; returns the output it produced. A command that raises
+    # leaves no output behind for the session's next call.
+    async def execute(self, session, tokens):
+        if len(tokens) == 0:
+            return ""
+        async with session.lock:
+            loop = asyncio.get_running_loop()
+            try:
+                stop = await loop.run_in_executor(self.executor, Commands.run_command, session, tokens)
+            except Exception:
+                session.drain()
+                raise
+            if stop:
+                session.closed = True
+            return session.drain()
+
+    async def execute_line(self, session, line):
+        return await self.execute(session, line.split())
+
+    async def run_batch(self, session, stream):
+        async with session.lock:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, Commands.run_batch, session, stream)
+            return session.drain()
+
+    async def create_patient(self, session, username, password):
+        return await self.execute(session, ["create_patient", username, password])
+
+    async def create_caregiver(self, session, username, password):
+        return await self.execute(session, ["create_caregiver", username, password])
+
+    async def login_patient(self, session, username, password):
+        return await self.execute(session, ["login_patient", username, password])
+
+    async def login_caregiver(self, session, username, password):
+        return await self.execute(session, ["login_caregiver", username, password])
+
+    async def login_token(self, session, token):
+        return await self.execute(session, ["login_token", token])
+
+    async def revoke_token(self, session, token):
+        return await self.execute(session, ["revoke_token", token])
+
+    async def search_caregiver_schedule(self, session, *args):
+        return await self.execute(session, ["search_caregiver_schedule", *args])
+
+    async def reserve(self, session, date, vaccine, *slot_time):
+        return await self.execute(session, ["reserve", date, vaccine, *slot_time])
+
+    async def reserve_batch(self, session, path):
+        return await self.execute(session, ["reserve_batch", path])
+
+    async def provision_users(self, session, role, path):
+        return await self.execute(session, ["provision_users", role, path])
+
+    async def upload_availability(self, session, *args):
+        return await self.execute(session, ["upload_availability", *args])
+
+    async def cancel(self, session, *args):
+        return await self.execute(session, ["cancel", *args])
+
+    async def add_doses(self, session, vaccine, number):
+        return await self.execute(session, ["add_doses", vaccine, str(number)])
+
+    async def show_appointments(self, session, *args):
+        return await self.execute(session, ["show_appointments", *args])
+
+    async def dose_report(self, session, *vaccine):
+        return await self.execute(session, ["dose_report", *vaccine])
+
+    async def logout(self, session):
+        return await self.execute(session, ["logout"])
+
+    def close(self):
+        self.executor.shutdown(wait=True)
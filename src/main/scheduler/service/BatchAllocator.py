@@ -0,0 +1,213 @@
+from db.ConnectionManager import ConnectionManager
+from db.UnitOfWork import UnitOfWork
+from db.BulkSql import BulkSql
+from model.Caregiver import Caregiver
+from model.Vaccine import Vaccine
+from util.Util import Util
+import csv
+import heapq
+
+
+class BatchAllocator:
+    '''
+    Books many pre-registered patients at once, e.g. for a mass-vaccination event.
+    The requests are read in full, the free caregiver slots and dose counts for the requested dates are
+    read (and locked) in one transaction, the assignment is solved in memory, and the appointments,
+    availability deletions and dose decrements are written back with set-based statements in that same
+    transaction. Caregivers are balanced by giving each appointment to the available caregiver with the
+    fewest appointments in this batch, in their earliest slot with capacity left.
+    '''
+
+    NO_PATIENT = "unknown patient"
+    NO_DOSES = "not enough available doses"
+    NO_CAREGIVER = "no caregiver available on the preferred dates"
+
+    def __init__(self, requests):
+        # [(patient username, vaccine name, [preferred dates in order])]
+        self.requests = requests
+
+    # Read requests from CSV lines "patient,vaccine,mm-dd-yyyy;mm-dd-yyyy;...".
+    # Returns (requests, errors) where errors are (line number, message) for malformed lines.
+    @staticmethod
+    def read_requests(stream):
+        requests = []
+        errors = []
+        for line_no, row in enumerate(csv.reader(stream), start=1):
+            if len(row) == 0 or row[0].startswith("#"):
+                continue
+            try:
+                if len(row) != 3:
+                    raise ValueError("expected patient,vaccine,dates")
+                dates = [Util.parse_date(d.strip()) for d in row[2].split(";") if d.strip()]
+                if len(dates) == 0:
+                    raise ValueError("no preferred dates")
+                requests.append((row[0].strip(), row[1].strip(), dates))
+            except ValueError as e:
+                errors.append((line_no, str(e)))
+        return requests, errors
+
+    # Solve the assignment in memory.
+    # availability maps date -> (caregiver username, slot time, capacity) for the open slots that day,
+    # doses maps vaccine name -> doses left.
+    # Patients are served in request order, each on the first preferred date with a free caregiver, in
+    # that caregiver's earliest slot with capacity left.
+    # Returns (assignments, rejected): assignments as (patient, vaccine, date, caregiver, slot time) and
+    # rejected as (patient, vaccine, reason).
+    @staticmethod
+    def allocate(requests, availability, doses, known_patients=None):
+        doses = dict(doses)
+        booked = {}
+        # per date and caregiver, the open slots as [slot time, capacity left] in time order
+        slots = {}
+        for d, rows in availability.items():
+            for caregiver, slot, capacity in rows:
+                slots.setdefault(d, {}).setdefault(caregiver, []).append([slot, capacity])
+        for by_caregiver in slots.values():
+            for caregiver_slots in by_caregiver.values():
+                caregiver_slots.sort()
+                caregiver_slots.reverse()
+        # per date, a heap of (appointments in this batch when pushed, caregiver); entries go stale as
+        # caregivers get booked on other dates and are re-pushed with the current count when popped
+        free = {d: [(0, c) for c in by_caregiver] for d, by_caregiver in slots.items()}
+        for heap in free.values():
+            heapq.heapify(heap)
+
+        assignments = []
+        rejected = []
+        for patient, vaccine, dates in requests:
+            if known_patients is not None and patient not in known_patients:
+                rejected.append((patient, vaccine, BatchAllocator.NO_PATIENT))
+                continue
+            if doses.get(vaccine, 0) <= 0:
+                rejected.append((patient, vaccine, BatchAllocator.NO_DOSES))
+                continue
+            caregiver = None
+            for d in dates:
+                heap = free.get(d)
+                while heap:
+                    count, candidate = heapq.heappop(heap)
+                    current = booked.get(candidate, 0)
+                    if count == current:
+                        caregiver = candidate
+                        break
+                    heapq.heappush(heap, (current, candidate))
+                if caregiver is not None:
+                    # slots are kept latest first, so the earliest open one is at the end
+                    caregiver_slots = slots[d][caregiver]
+                    slot = caregiver_slots[-1]
+                    slot[1] -= 1
+                    if slot[1] == 0:
+                        caregiver_slots.pop()
+                    booked[caregiver] = booked.get(caregiver, 0) + 1
+                    if caregiver_slots:
+                        heapq.heappush(heap, (booked[caregiver], caregiver))
+                    assignments.append((patient, vaccine, d, caregiver, slot[0]))
+                    doses[vaccine] -= 1
+                    break
+            if caregiver is None:
+                rejected.append((patient, vaccine, BatchAllocator.NO_CAREGIVER))
+        return assignments, rejected
+
+    # Allocate and write the whole batch in one transaction, committed here unless it runs in the given
+    # unit of work; returns (assignments, rejected)
+    def run(self, work=None):
+        if len(self.requests) == 0:
+            return [], []
+        dates = sorted({d for _, _, ds in self.requests for d in ds})
+        vaccines = sorted({v for _, v, _ in self.requests})
+        patients = sorted({p for p, _, _ in self.requests})
+
+        with UnitOfWork.join(work) as work:
+            cursor = work.cursor()
+            if ConnectionManager.backend().name == "sqlite":
+                # the database's single write lock keeps online reservations out until commit
+                work.begin()
+                assignments, rejected = self._run_sqlite(cursor, dates, vaccines, patients)
+            else:
+                assignments, rejected = self._run_mssql(cursor, dates, vaccines, patients)
+            work.on_commit(Vaccine.cache.clear)
+            for d in dates:
+                work.on_commit(lambda d=d: Caregiver.invalidate_availability(d))
+        return assignments, rejected
+
+    def _run_mssql(self, cursor, dates, vaccines, patients):
+        # temp tables live as long as the pooled connection, so clear out any left by an earlier batch
+        cursor.execute("DROP TABLE IF EXISTS #BatchPatients; DROP TABLE IF EXISTS #BatchDates; "
+                       "DROP TABLE IF EXISTS #BatchAppointments")
+        cursor.execute("CREATE TABLE #BatchPatients (Username varchar(255) PRIMARY KEY)")
+        cursor.execute("CREATE TABLE #BatchDates (Time date PRIMARY KEY)")
+        BulkSql.insert_rows(cursor, "#BatchPatients", [(p,) for p in patients])
+        BulkSql.insert_rows(cursor, "#BatchDates", [(d,) for d in dates])
+
+        cursor.execute("SELECT p.Username FROM Patients p JOIN #BatchPatients b ON p.Username = b.Username")
+        known_patients = {row[0] for row in cursor.fetchall()}
+
+        # lock the inputs of the solve so no online reservation can take them before we write
+        cursor.execute("SELECT a.Time, a.Username, a.SlotTime, a.Capacity FROM Availabilities a WITH (UPDLOCK, HOLDLOCK) "
+                       "JOIN #BatchDates b ON a.Time = b.Time WHERE a.Capacity > 0 "
+                       "ORDER BY a.Time, a.Username, a.SlotTime")
+        availability = {}
+        for time, username, slot, capacity in cursor.fetchall():
+            availability.setdefault(time, []).append((username, Util.format_time(slot), capacity))
+        cursor.execute("SELECT Name, Doses FROM Vaccines WITH (UPDLOCK, HOLDLOCK) WHERE Name IN ("
+                       + ", ".join(["%s"] * len(vaccines)) + ")", tuple(vaccines))
+        doses = {name: count for name, count in cursor.fetchall()}
+
+        assignments, rejected = BatchAllocator.allocate(self.requests, availability, doses, known_patients)
+
+        if assignments:
+            cursor.execute("CREATE TABLE #BatchAppointments (Seq int PRIMARY KEY, Time date, SlotTime time(0), "
+                           "Cusername varchar(255), Pusername varchar(255), Vname varchar(255))")
+            BulkSql.insert_rows(cursor, "#BatchAppointments",
+                              [(i, d, slot, c, p, v) for i, (p, v, d, c, slot) in enumerate(assignments)])
+            cursor.execute("""
+                UPDATE a SET Capacity = a.Capacity - b.Booked
+                FROM Availabilities a JOIN (SELECT Time, Cusername, SlotTime, COUNT(*) AS Booked
+                                            FROM #BatchAppointments GROUP BY Time, Cusername, SlotTime) b
+                    ON a.Time = b.Time AND a.Username = b.Cusername AND a.SlotTime = b.SlotTime;
+
+                DELETE a FROM Availabilities a
+                JOIN #BatchAppointments b ON a.Time = b.Time AND a.Username = b.Cusername AND a.SlotTime = b.SlotTime
+                WHERE a.Capacity = 0;
+
+                UPDATE v SET Doses = v.Doses - b.Booked
+                FROM Vaccines v JOIN (SELECT Vname, COUNT(*) AS Booked FROM #BatchAppointments GROUP BY Vname) b
+                    ON v.Name = b.Vname;
+
+                INSERT INTO Appointment (Time, SlotTime, Cusername, Pusername, Vname)
+                SELECT Time, SlotTime, Cusername, Pusername, Vname FROM #BatchAppointments ORDER BY Seq;
+            """)
+        return assignments, rejected
+
+    # The same steps on SQLite. run() has taken the database's single write lock, which keeps online
+    # reservations out until commit, so no lock hints or staging tables are needed; the writes are
+    # prepared once and run per row with executemany.
+    def _run_sqlite(self, cursor, dates, vaccines, patients):
+        known_patients = {row[0] for row in BulkSql.select_in(cursor, "SELECT Username FROM Patients WHERE Username IN ",
+                                                              patients)}
+        availability = {}
+        for time, username, slot, capacity in BulkSql.select_in(
+                cursor, "SELECT Time, Username, SlotTime, Capacity FROM Availabilities WHERE Capacity > 0 AND Time IN ",
+                dates):
+            availability.setdefault(time, []).append((username, Util.format_time(slot), capacity))
+        for slots in availability.values():
+            slots.sort()
+        doses = {name: count for name, count in BulkSql.select_in(cursor, "SELECT Name, Doses FROM Vaccines WHERE Name IN ",
+                                                                   vaccines)}
+
+        assignments, rejected = BatchAllocator.allocate(self.requests, availability, doses, known_patients)
+
+        booked_slots = {}
+        booked_doses = {}
+        for _, vaccine, d, caregiver, slot in assignments:
+            booked_slots[(d, caregiver, slot)] = booked_slots.get((d, caregiver, slot), 0) + 1
+            booked_doses[vaccine] = booked_doses.get(vaccine, 0) + 1
+        cursor.executemany("UPDATE Availabilities SET Capacity = Capacity - %d WHERE Time = %s AND Username = %s AND SlotTime = %s",
+                           [(count,) + key for key, count in booked_slots.items()])
+        cursor.executemany("DELETE FROM Availabilities WHERE Time = %s AND Username = %s AND SlotTime = %s AND Capacity = 0",
+                           list(booked_slots))
+        cursor.executemany("UPDATE Vaccines SET Doses = Doses - %d WHERE Name = %s",
+                           [(count, vaccine) for vaccine, count in booked_doses.items()])
+        cursor.executemany("INSERT INTO Appointment (Time, SlotTime, Cusername, Pusername, Vname) VALUES (%s, %s, %s, %s, %s)",
+                           [(d, slot, caregiver, patient, vaccine) for patient, vaccine, d, caregiver, slot in assignments])
+        return assignments, rejected
@@ -0,0 +1,250 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from db.ConnectionManager import ConnectionManager
+from db.UnitOfWork import UnitOfWork
+from db.BulkSql import BulkSql
+from db.Backend import DatabaseError, DatabaseUnavailable
+from model.Caregiver import Caregiver
+from model.Vaccine import Vaccine
+from util.Util import Util
+
+
+class CommandJournal:
+    '''
+    Write-ahead journal for the commands whose effect doesn't depend on what the database holds:
+    add_doses and upload_availability. Enabled by setting JournalFile.
+    A journaled command is appended to the file (and fsynced) as an intent with a fresh idempotency key
+    and acknowledged right away; a background thread applies the intents to the database in group
+    commits of up to JournalGroupSize, waiting JournalGroupDelay seconds for more to arrive. The keys
+    of an applied group are inserted into AppliedCommands in the same transaction as its effects, so an
+    intent is applied exactly once even if it is replayed: on start every intent the file doesn't mark
+    as applied is queued again, and the ones AppliedCommands already holds are only marked.
+    While the database is unreachable the intents wait in the file, retried with exponential backoff up
+    to JournalMaxBackoff seconds. A group the database refuses is retried one intent at a time, and an
+    intent refused on its own is marked failed and written to stderr in full.
+    Commands that answer from the database (reserve, cancel, ...) are not journaled, and a journaled
+    write becomes visible to them only once applied; wait() blocks until everything queued is.
+    Batch files journal their add_doses and upload_availability lines too (see Commands.run_batch),
+    and at exit the queue is drained before the connection pools close.
+    '''
+
+    COMMANDS = ("add_doses", "upload_availability")
+
+    _configured = None
+    _configured_lock = threading.Lock()
+
+    def __init__(self, path, group_size=None, group_delay=None, max_backoff=None):
+        self.path = path
+        self.group_size = group_size or int(os.getenv("JournalGroupSize", "100"))
+        self.group_delay = group_delay if group_delay is not None else float(os.getenv("JournalGroupDelay", "0.005"))
+        self.max_backoff = max_backoff or float(os.getenv("JournalMaxBackoff", "30"))
+        # intents not applied yet, oldest first
+        self._pending = []
+        self._cond = threading.Condition()
+        self._applying = 0
+        self._closed = False
+        self.appended = 0
+        self.applied = 0
+        self.failed = 0
+        self.groups = 0
+        self.retries = 0
+        self._file = open(path, "a+", encoding="utf-8")
+        self._recover()
+        self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._thread.start()
+
+    # the journal of this process, or None when JournalFile is unset; replays what a previous run left
+    @staticmethod
+    def configured():
+        with CommandJournal._configured_lock:
+            if CommandJournal._configured is None and os.getenv("JournalFile"):
+                CommandJournal._configured = CommandJournal(os.getenv("JournalFile"))
+                # drained before the connection pools close
+                ConnectionManager.on_shutdown(CommandJournal._configured.close)
+            return CommandJournal._configured
+
+    # Journal command (one of COMMANDS) for username with its parsed arguments; returns the idempotency
+    # key once the intent is on disk
+    def append(self, command, username, args):
+        if command not in CommandJournal.COMMANDS:
+            raise ValueError("Command is not journaled: " + command)
+        entry = {"type": "intent", "id": uuid.uuid4().hex, "command": command, "user": username,
+                 "args": args, "ts": round(time.time(), 3)}
+        with self._cond:
+            self._write(entry, sync=True)
+            self._pending.append(entry)
+            self.appended += 1
+            self._cond.notify_all()
+        return entry["id"]
+
+    # Block until every intent appended so far is applied or failed; returns whether it got there in time
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._applying:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    # Stop the applier once it has drained, waiting up to JournalDrainTimeout seconds; whatever is left
+    # is replayed on the next start
+    def close(self):
+        self.wait(float(os.getenv("JournalDrainTimeout", "5")))
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(1)
+        with self._cond:
+            self._file.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": len(self._pending) + self._applying,
+                "appended": self.appended,
+                "applied": self.applied,
+                "failed": self.failed,
+                "groups": self.groups,
+                "retries": self.retries,
+            }
+
+    # called with _cond held
+    def _write(self, record, sync=False):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    # Queue the intents a previous run left unapplied, rewriting the file to hold just those
+    def _recover(self):
+        self._file.seek(0)
+        intents = {}
+        done = set()
+        for line in self._file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line of a run that crashed mid-write; its command was never acknowledged
+                continue
+            if record.get("type") == "intent":
+                intents[record["id"]] = record
+            elif record.get("type") in ("applied", "failed"):
+                done.update(record["ids"])
+        self._pending = [entry for key, entry in intents.items() if key not in done]
+        self._compact()
+
+    # called with _cond held (or before the applier starts); the file is replaced whole, so a crash
+    # leaves either the old journal or the new one
+    def _compact(self):
+        temp = self.path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as compacted:
+            for entry in self._pending:
+                compacted.write(json.dumps(entry) + "\n")
+            compacted.flush()
+            os.fsync(compacted.fileno())
+        self._file.close()
+        os.replace(temp, self.path)
+        self._file = open(self.path, "a+", encoding="utf-8")
+
+    def _run(self):
+        backoff = 0.0
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            if self.group_delay > 0 and backoff == 0.0:
+                time.sleep(self.group_delay)
+            with self._cond:
+                group = self._pending[:self.group_size]
+                del self._pending[:len(group)]
+                self._applying = len(group)
+
+            applied, failed, retry = self._apply_group(group)
+            with self._cond:
+                self._applying = 0
+                # the intents the database couldn't be reached for go back to the front of the queue
+                self._pending[:0] = retry
+                if applied:
+                    self._write({"type": "applied", "ids": applied})
+                if failed:
+                    self._write({"type": "failed", "ids": [entry["id"] for entry, _ in failed]})
+                self.applied += len(applied)
+                self.failed += len(failed)
+                self.groups += 1 if applied or failed else 0
+                self.retries += 1 if retry else 0
+                if not self._pending:
+                    self._compact()
+                self._cond.notify_all()
+            for entry, error in failed:
+                print("Journal: failed to apply " + json.dumps(entry) + ": " + error, file=sys.stderr)
+            if retry:
+                backoff = min(self.max_backoff, backoff * 2 or 0.1)
+                with self._cond:
+                    self._cond.wait_for(lambda: self._closed, backoff)
+            else:
+                backoff = 0.0
+
+    # Apply group in one transaction, or one intent at a time if the database refuses that, so a bad
+    # intent doesn't hold up the rest. Returns (applied keys, [(failed intent, error)], intents to retry):
+    # from the first intent that fails with a transient error, e.g. while the database can't be reached,
+    # the rest of the group is retried later.
+    def _apply_group(self, group):
+        try:
+            return self._apply(group), [], []
+        except DatabaseError as e:
+            if is_retryable(e):
+                return [], [], group
+        except ValueError:
+            pass
+        applied = []
+        failed = []
+        for i, entry in enumerate(group):
+            try:
+                applied.extend(self._apply([entry]))
+            except DatabaseError as e:
+                if is_retryable(e):
+                    return applied, failed, group[i:]
+                failed.append((entry, str(e)))
+            except ValueError as e:
+                failed.append((entry, str(e)))
+        return applied, failed, []
+
+    # Apply the intents of group that AppliedCommands doesn't hold yet, in one transaction; returns
+    # every key of group, since all of them are applied once it commits
+    def _apply(self, group):
+        with UnitOfWork("journal") as work:
+            cursor = work.cursor()
+            if ConnectionManager.backend().name == "sqlite":
+                work.begin()
+            keys = [entry["id"] for entry in group]
+            done = {row[0] for row in BulkSql.select_in(cursor, "SELECT Id FROM AppliedCommands WHERE Id IN ", keys)}
+            todo = [entry for entry in group if entry["id"] not in done]
+            BulkSql.insert_rows(cursor, "AppliedCommands (Id)", [(entry["id"],) for entry in todo])
+
+            # doses are summed over the group into one upsert per vaccine
+            doses = {}
+            for entry in todo:
+                args = entry["args"]
+                if entry["command"] == "add_doses":
+                    doses[args["vaccine"]] = doses.get(args["vaccine"], 0) + args["doses"]
+                else:
+                    slots = None
+                    if args["slots"] is not None:
+                        slots = [(Util.parse_time(slot), capacity) for slot, capacity in args["slots"]]
+                    Caregiver(entry["user"]).upload_availabilities([Util.parse_date(d) for d in args["dates"]],
+                                                                   slots, work)
+            Vaccine.add_doses_bulk(doses, work)
+            work.commit()
+        return keys
+
+
+def is_retryable(err):
+    return isinstance(err, DatabaseUnavailable) or ConnectionManager.backend().is_transient(err)
@@ -0,0 +1,1063 @@
+from model.Vaccine import Vaccine  
+from model.Caregiver import Caregiver
+from model.Patient import Patient
+from model.Appointment import Appointment
+from service.BatchAllocator import BatchAllocator
+from service.UserProvisioner import UserProvisioner
+from service.DoseForecast import DoseForecast
+from service.CommandJournal import CommandJournal
+from service.SessionTokens import SessionTokens
+from util.Util import Util
+from util.Metrics import Metrics
+from db.UnitOfWork import UnitOfWork
+from db.Backend import DatabaseError
+import datetime
+import csv
+import json
+import os
+import time
+
+
+'''
+Command handlers for the scheduler.
+Every handler takes the Session of the user issuing the command (who is logged in, where output goes)
+and the tokenized command line, so the same handlers serve the command line and concurrent sessions.
+A command runs in one UnitOfWork (session.work, see run_command): the handler passes it to every model
+call, so they share one connection, and commits it once its writes all succeeded.
+Database errors are reported to the session and end the command, never the process: the unit retries
+transient ones within the command's deadline (CommandDeadline), and while the database is down the
+circuit breaker in ConnectionManager makes commands fail fast until it is back.
+'''
+
+
+def create_patient(session, tokens):
+    # create_patient <username> <password>
+    # check 1: the length for tokens need to be exactly 3 to include all information (with the operation name)
+    if len(tokens) != 3:
+        session.print("Failed to create user.")
+        return
+
+    username = tokens[1]
+    password = tokens[2]
+    # check 2: check if the username has been taken already
+    exists = username_exists_patient(session, username)
+    if exists is None:
+        # the database couldn't be asked, and the reason was printed
+        return
+    if exists:
+        session.print("Username taken, try again!")
+        return
+
+    if not check_password(session, password):
+        return
+
+    salt = Util.generate_salt()
+    hash_params = Util.hash_params()
+    with Metrics.phase("hash"):
+        hash = Util.submit_hash(password, salt, hash_params).result()
+
+    # create the patient
+    patient = Patient(username, salt=salt, hash=hash, hash_params=hash_params)
+
+    # save to patient information to our database
+    try:
+        patient.save_to_db(session.work)
+        session.work.commit()
+    except DatabaseError as e:
+        session.print("Failed to create user.")
+        session.print("Db-Error:", e)
+        return
+    except Exception as e:
+        session.print("Failed to create user.")
+        session.print(e)
+        return
+    session.print("Created user ", username)
+
+
+def username_exists_patient(session, username):
+    select_username = "SELECT * FROM Patients WHERE Username = %s"
+    try:
+        cursor = session.work.cursor(as_dict=True)
+        cursor.execute(select_username, username)
+        #  returns false if the cursor is not before the first record or if there are no rows in the ResultSet.
+        for row in cursor:
+            return row['Username'] is not None
+    except DatabaseError as e:
+        session.print("Error occurred when checking username")
+        session.print("Db-Error:", e)
+        return None
+    except Exception as e:
+        session.print("Error occurred when checking username")
+        session.print("Error:", e)
+    return False
+
+
+def create_caregiver(session, tokens):
+    # create_caregiver <username> <password>
+    # check 1: the length for tokens need to be exactly 3 to include all information (with the operation name)
+    if len(tokens) != 3:
+        session.print("Failed to create user.")
+        return
+
+    username = tokens[1]
+    password = tokens[2]
+    # check 2: check if the username has been taken already
+    exists = username_exists_caregiver(session, username)
+    if exists is None:
+        # the database couldn't be asked, and the reason was printed
+        return
+    if exists:
+        session.print("Username taken, try again!")
+        return
+
+    if not check_password(session, password): 
+        return 
+
+    salt = Util.generate_salt()
+    hash_params = Util.hash_params()
+    with Metrics.phase("hash"):
+        hash = Util.submit_hash(password, salt, hash_params).result()
+
+    # create the caregiver
+    caregiver = Caregiver(username, salt=salt, hash=hash, hash_params=hash_params)
+
+    # save to caregiver information to our database
+    try:
+        caregiver.save_to_db(session.work)
+        session.work.commit()
+    except DatabaseError as e:
+        session.print("Failed to create user.")
+        session.print("Db-Error:", e)
+        return
+    except Exception as e:
+        session.print("Failed to create user.")
+        session.print(e)
+        return
+    session.print("Created user ", username)
+
+
+def username_exists_caregiver(session, username):
+    select_username = "SELECT * FROM Caregivers WHERE Username = %s"
+    try:
+        cursor = session.work.cursor(as_dict=True)
+        cursor.execute(select_username, username)
+        #  returns false if the cursor is not before the first record or if there are no rows in the ResultSet.
+        for row in cursor:
+            return row['Username'] is not None
+    except DatabaseError as e:
+        session.print("Error occurred when checking username")
+        session.print("Db-Error:", e)
+        return None
+    except Exception as e:
+        session.print("Error occurred when checking username")
+        session.print("Error:", e)
+    return False
+
+
+def check_password(session, password):
+    # prints what makes the password weak, see Util.password_problems; returns whether it is strong
+    problems = Util.password_problems(password)
+    for problem in problems:
+        session.print(problem)
+    return len(problems) == 0
+
+
+def login_patient(session, tokens):
+    # login_patient <username> <password>
+    # check 1: if someone's already logged-in, they need to log out first
+    if session.current_patient is not None or session.current_caregiver is not None:
+        session.print("User already logged in.")
+        return 
+
+    # check 2: the length for tokens need to be exactly 3 to include all information (with the operation name)
+    if len(tokens) != 3:
+        session.print("Login failed.")
+        return
+
+    username = tokens[1]
+    password = tokens[2]
+
+    patient = None
+    try:
+        patient = Patient(username, password=password).get(session.work)
+        # get() may have upgraded the stored hash
+        session.work.commit()
+    except DatabaseError as e:
+        session.print("Login failed.")
+        session.print("Db-Error:", e)
+        return
+    except Exception as e:
+        session.print("Login failed.")
+        session.print("Error:", e)
+        return
+
+    # check if the login was successful
+    if patient is None:
+        session.print("Login failed.")
+    else:
+        session.print("Logged in as: " + username)
+        session.current_patient = patient 
+        session.print("Session token: " + SessionTokens.configured().issue("patient", username))
+
+def login_caregiver(session, tokens):
+    # login_caregiver <username> <password>
+    # check 1: if someone's already logged-in, they need to log out first
+    if session.current_caregiver is not None or session.current_patient is not None:
+        session.print("User already logged in.")
+        return
+
+    # check 2: the length for tokens need to be exactly 3 to include all information (with the operation name)
+    if len(tokens) != 3:
+        session.print("Login failed.")
+        return
+
+    username = tokens[1]
+    password = tokens[2]
+
+    caregiver = None
+    try:
+        caregiver = Caregiver(username, password=password).get(session.work)
+        # get() may have upgraded the stored hash
+        session.work.commit()
+    except DatabaseError as e:
+        session.print("Login failed.")
+        session.print("Db-Error:", e)
+        return
+    except Exception as e:
+        session.print("Login failed.")
+        session.print("Error:", e)
+        return
+
+    # check if the login was successful
+    if caregiver is None:
+        session.print("Login failed.")
+    else:
+        session.print("Logged in as: " + username)
+        session.current_caregiver = caregiver
+        session.print("Session token: " + SessionTokens.configured().issue("caregiver", username))
+
+
+def login_token(session, tokens):
+    # login_token <session token>
+    # logs in again with the token printed by login_patient / login_caregiver; no password hash is computed
+    # check 1: if someone's already logged-in, they need to log out first
+    if session.current_patient is not None or session.current_caregiver is not None:
+        session.print("User already logged in.")
+        return
+
+    # check 2: the length for tokens need to be exactly 2 to include all information (with the operation name)
+    if len(tokens) != 2:
+        session.print("Login failed.")
+        return
+
+    claims = SessionTokens.configured().validate(tokens[1])
+    if claims is None:
+        session.print("Login failed.")
+        session.print("Session token expired or revoked; log in with your password.")
+        return
+    role, username = claims
+
+    # check 3: the account must still exist; a token outliving its account is dropped
+    exists = username_exists_patient(session, username) if role == "patient" else \
+        username_exists_caregiver(session, username)
+    if not exists:
+        if exists is False:
+            SessionTokens.configured().revoke(tokens[1], claims)
+        session.print("Login failed.")
+        return
+    if role == "patient":
+        session.current_patient = Patient(username)
+    else:
+        session.current_caregiver = Caregiver(username)
+    session.print("Logged in as: " + username)
+
+
+def revoke_token(session, tokens):
+    # revoke_token <session token>
+    # revokes one of the logged-in user's own tokens, e.g. a leaked one
+    # check 1: Check if there's any user logged in
+    if session.current_caregiver is None and session.current_patient is None:
+        session.print("Please login first!")
+        return
+
+    # check 2: the length for tokens need to be exactly 2 to include all information (with the operation name)
+    if len(tokens) != 2:
+        session.print("Please try again!")
+        return
+
+    if session.current_caregiver is not None:
+        owner = ("caregiver", session.current_caregiver.username)
+    else:
+        owner = ("patient", session.current_patient.username)
+    if SessionTokens.configured().revoke(tokens[1], owner):
+        session.print("Session token revoked.")
+    else:
+        session.print("Unknown session token.")
+
+
+def search_caregiver_schedule(session, tokens):  
+    # search_caregiver_schedule <date>
+    # search_caregiver_schedule <start_date> <end_date> [vaccine|*] [page]
+    # check 1: Check if there's any user logged in
+    
+    if session.current_caregiver is None and session.current_patient is None: 
+        session.print("Please login first!")
+        return
+    
+    # check 2: the length for tokens need to be 2 to 5 to include all information (with the operation name)
+    if len(tokens) < 2 or len(tokens) > 5:
+        session.print("Please try again!") 
+        return
+
+    if len(tokens) > 2:
+        search_caregiver_range(session, tokens)
+        return
+
+    date = tokens[1]  
+
+    # both lookups are served from the in-process read cache, see Vaccine.get_all / Caregiver.get_available
+    try:
+        vaccine = Vaccine.get_all(session.work)
+        caregiver = Caregiver.get_available(Util.parse_date(date), session.work)
+
+        session.print("{:<12}".format("Caregiver"), end="")
+        for i in range(0, len(vaccine)):
+            session.print("{:<12}".format(vaccine[i]["Name"]), end="") 
+        session.print("Slots") 
+
+        # each open slot is shown as its time and, when it takes more than one appointment, the places left
+        for username, slots in caregiver:
+            session.print("{:<12}".format(username), end="") 
+            for i in range(0, len(vaccine)):
+                session.print("{:<12}".format(vaccine[i]["Doses"]), end="")
+            session.print(" ".join(Util.format_slot(slot) + ("" if capacity == 1 else "x" + str(capacity))
+                                   for slot, capacity in slots))
+            
+    except DatabaseError as e:
+        session.print("Error occurred when getting details from Caregivers or Vaccines") 
+        session.print("Db-Error:", e)
+        return
+    except ValueError as e:
+        session.print("Invalid statement; try again")
+        session.print("Error:", e)
+        return
+    except Exception as e:
+        session.print("Error occurred when getting details from Caregivers or Vaccines")  
+        session.print("Error:", e)
+        
+
+def search_caregiver_range(session, tokens):
+    # search_caregiver_schedule <start_date> <end_date> [vaccine|*] [page]
+    try:
+        start = Util.parse_date(tokens[1])
+        end = Util.parse_date(tokens[2])
+        vaccine_name = tokens[3] if len(tokens) > 3 and tokens[3] != "*" else None
+        page = int(tokens[4]) if len(tokens) > 4 else 1
+        vaccine, dates, has_more = Caregiver.search_availability(start, end, vaccine_name, page, work=session.work)
+
+        if len(vaccine) == 0:
+            session.print("Not enough available doses!")
+            return
+        session.print("Vaccines: " + ", ".join(str(row["Name"]) + " (" + str(row["Doses"]) + ")" for row in vaccine))
+        if len(dates) == 0:
+            session.print("No Caregiver is available!")
+            return
+
+        session.print("{:<12}{:<11}{:<12}{}".format("Date", "Available", "First slot", "Caregivers"))
+        for row in dates:
+            session.print("{:<12}{:<11}{:<12}{}".format(row["Time"].strftime("%m-%d-%Y"), row["Available"],
+                                                        Util.format_slot(row["FirstSlot"]),
+                                                        row["Caregivers"].replace(",", " ")))
+        if has_more:
+            session.print("More dates available: search_caregiver_schedule " + tokens[1] + " " + tokens[2] + " "
+                          + (vaccine_name or "*") + " " + str(page + 1))
+    except DatabaseError as e:
+        session.print("Error occurred when getting details from Caregivers or Vaccines") 
+        session.print("Db-Error:", e)
+        return
+    except ValueError as e:
+        session.print("Invalid statement; try again")
+        session.print("Error:", e)
+        return
+    except Exception as e:
+        session.print("Error occurred when getting details from Caregivers or Vaccines")  
+        session.print("Error:", e)
+
+
+def reserve(session, tokens):     
+    # reserve <date> <vaccine> [<HH:MM>]
+    # check 1: Check if there's any user logged in 
+    if session.current_caregiver is None and session.current_patient is None: 
+        session.print("Please login first!")
+        return
+    # check 2: check if the current logged-in user is a patient
+    if session.current_patient is None:
+        session.print("Please login as a patient!") 
+        return
+    # check 3: the length for tokens need to be 3 or 4 to include all information (with the operation name)
+    if len(tokens) != 3 and len(tokens) != 4: 
+        session.print("Please try again!")  
+        return
+
+    # check 4: the caregiver slot, the dose and the appointment are claimed together in one transaction
+    date = tokens[1]
+    vaccine_name = tokens[2] 
+
+    try:
+        date_tokens = date.split("-")
+        month = int(date_tokens[0])
+        day = int(date_tokens[1])
+        year = int(date_tokens[2])
+        d = datetime.datetime(year, month, day) 
+
+        slot_time = Util.parse_time(tokens[3]) if len(tokens) == 4 else None
+
+        appointment = Appointment(d, vaccine_name, session.current_patient.username, slot_time=slot_time)
+        result = appointment.reserve(session.work)
+        if result == Appointment.RESERVED:
+            session.work.commit()
+        if result == Appointment.NO_CAREGIVER:
+            session.print("No Caregiver is available!")  
+            return
+        if result == Appointment.NO_DOSES:
+            session.print("Not enough available doses!")  
+            return
+        booked = "Appointment ID: " + str(appointment.get_id()) + ", Caregiver username: " + str(appointment.get_caregiver_username())
+        if Util.format_slot(appointment.get_slot_time()) != Util.format_slot(Util.ALL_DAY):
+            booked += ", Time: " + Util.format_slot(appointment.get_slot_time())
+        session.print(booked)    
+            
+    except DatabaseError as e:
+        session.print("Error occurred when making reservation")
+        session.print("Db-Error:", e)
+        return
+    except ValueError as e:
+        session.print("Invalid statement; try again")
+        session.print("Error:", e)
+        return
+    except Exception as e:
+        session.print("Error occurred when making reservation") 
+        session.print("Error:", e)
+    return False
+
+
+def upload_availability(session, tokens):
+    #  upload_availability <date> [<slots>]
+    #  upload_availability <date>,<date>,... [<slots>]
+    #  upload_availability <start> <end> [daily|weekdays|weekends|every<N>|mon,wed,...] [<slots>]
+    #  slots are HH:MM or HH:MM-HH:MM/<minutes>, optionally x<capacity>, comma-separated; the whole day by default
+    #  check 1: check if the current logged-in user is a caregiver
+    if session.current_caregiver is None:
+        session.print("Please login as a caregiver first!")
+        return
+
+    # check 2: the length for tokens need to be 2 to 5 to include all information (with the operation name)
+    try:
+        tokens, slots = availability_slots(tokens)
+    except ValueError as e:
+        session.print("Please enter a valid statement")
+        session.print("Error:", e)
+        return
+    if len(tokens) < 2 or len(tokens) > 4: 
+        session.print("Please try again!")
+        return
+
+    # single dates, lists and ranges all skip the slots that are already uploaded
+    try:
+        dates = availability_dates(tokens)
+        if CommandJournal.configured() is not None:
+            journal_availability(session, dates, slots)
+            return
+        inserted = session.current_caregiver.upload_availabilities(dates, slots, session.work)
+        session.work.commit()
+        if len(inserted) < len(set(dates)):
+            session.print("Availability uploaded for " + str(len(inserted)) + " of " + str(len(set(dates))) + " dates ("
+                  + str(len(set(dates)) - len(inserted)) + " already uploaded)")
+            return
+    except DatabaseError as e:
+        session.print("Upload Availability Failed")
+        session.print("Db-Error:", e)
+        return
+    except ValueError as e:
+        session.print("Please enter a valid statement")
+        session.print("Error:", e)
+        return
+    except Exception as e:
+        session.print("Error occurred when uploading availability")
+        session.print("Error:", e)
+        return
+    session.print("Availability uploaded!")
+
+
+def journal_availability(session, dates, slots):
+    # acknowledges an upload once it is in the command journal, which applies it to the database later;
+    # slots already uploaded are skipped then, as by upload_availabilities
+    args = {"dates": [d.strftime("%m-%d-%Y") for d in sorted(set(dates))],
+            "slots": [[Util.format_time(slot), capacity] for slot, capacity in slots] if slots is not None else None}
+    CommandJournal.configured().append("upload_availability", session.current_caregiver.username, args)
+    if len(dates) == 1:
+        session.print("Availability uploaded!")
+    else:
+        session.print("Availability uploaded for " + str(len(set(dates))) + " dates")
+
+
+def availability_dates(tokens):
+    # the dates named by an upload_availability command; dates are hyphenated in the format mm-dd-yyyy
+    if len(tokens) == 2:
+        return [Util.parse_date(date) for date in tokens[1].split(",")]
+    pattern = tokens[3] if len(tokens) == 4 else "daily"
+    return Util.expand_dates(Util.parse_date(tokens[1]), Util.parse_date(tokens[2]), pattern)
+
+
+def availability_slots(tokens):
+    # splits the slot specification (the last token, if it holds a time) off an upload_availability command;
+    # returns the remaining tokens and the (time, capacity) slots, or None for the whole day
+    if len(tokens) > 2 and ":" in tokens[-1]:
+        return tokens[:-1], Util.expand_slots(tokens[-1])
+    return tokens, None
+
+
+def cancel(session, tokens):
+    # cancel <appointment_id>
+    # cancel --date <date> [<end_date>]    cancels all of the logged-in user's appointments in the range
+    # check 1: Check if there's any user logged in
+    if session.current_caregiver is None and session.current_patient is None:
+        session.print("Please login first!")
+        return
+
+    # check 2: the length for tokens need to be exactly 2, or 3 to 4 with --date, to include all information
+    # (with the operation name)
+    if len(tokens) < 2 or (tokens[1] == "--date" and len(tokens) not in (3, 4)) \
+            or (tokens[1] != "--date" and len(tokens) != 2):
+        session.print("Please try again!")
+        return
+
+    if session.current_caregiver is not None:
+        role, username = "caregiver", session.current_caregiver.username
+    else:
+        role, username = "patient", session.current_patient.username
+
+    try:
+        if tokens[1] == "--date":
+            start = Util.parse_date(tokens[2])
+            end = Util.parse_date(tokens[3]) if len(tokens) == 4 else start
+            cancelled = Appointment.cancel_for_user(role, username, start, end, session.work)
+            session.work.commit()
+            if len(cancelled) == 0:
+                session.print("No appointment scheduled.")
+                return
+            for appointment in cancelled:
+                session.print("Cancelled appointment ID: " + str(appointment.get_id()))
+            session.print("Cancelled " + str(len(cancelled)) + " appointments")
+        else:
+            appointment = Appointment.cancel(int(tokens[1]), username, session.work)
+            session.work.commit()
+            if appointment is None:
+                session.print("Appointment not found!")
+                return
+            session.print("Cancelled appointment ID: " + str(appointment.get_id()))
+    except DatabaseError as e:
+        session.print("Error occurred when cancelling appointment")
+        session.print("Db-Error:", e)
+        return
+    except ValueError as e:
+        session.print("Invalid statement; try again")
+        session.print("Error:", e)
+        return
+    except Exception as e:
+        session.print("Error occurred when cancelling appointment")
+        session.print("Error:", e)
+
+
+def reserve_batch(session, tokens):
+    # reserve_batch <csv file>
+    # each line is patient,vaccine,preferred dates separated by ";" (mm-dd-yyyy), e.g. alice,Pfizer,05-01-2022;05-02-2022
+    # check 1: check if the current logged-in user is a caregiver
+    if session.current_caregiver is None:
+        session.print("Please login as a caregiver first!")
+        return
+
+    # check 2: the length for tokens need to be exactly 2 to include all information (with the operation name)
+    if len(tokens) != 2:
+        session.print("Please try again!")
+        return
+
+    try:
+        with open(tokens[1], newline="") as request_file:
+            requests, errors = BatchAllocator.read_requests(request_file)
+        for line_no, message in errors:
+            session.print("line " + str(line_no) + ": " + message)
+
+        start_time = time.perf_counter()
+        assignments, rejected = BatchAllocator(requests).run(session.work)
+        session.work.commit()
+        elapsed = time.perf_counter() - start_time
+
+        for patient, vaccine, reason in rejected:
+            session.print("Rejected " + patient + " (" + vaccine + "): " + reason)
+        session.print("Reserved {} of {} requests in {:.3f}s ({} rejected, {} malformed lines)".format(
+            len(assignments), len(requests), elapsed, len(rejected), len(errors)))
+    except DatabaseError as e:
+        session.print("Error occurred when making reservation")
+        session.print("Db-Error:", e)
+        return
+    except OSError as e:
+        session.print("Could not read request file")
+        session.print("Error:", e)
+    except Exception as e:
+        session.print("Error occurred when making reservation")
+        session.print("Error:", e)
+
+
+def provision_users(session, tokens):
+    # provision_users <patient|caregiver> <csv file>
+    # each line is username,password, e.g. alice,Str0ng#Pass
+    # check 1: check if the current logged-in user is a caregiver
+    if session.current_caregiver is None:
+        session.print("Please login as a caregiver first!")
+        return
+
+    # check 2: the length for tokens need to be exactly 3 to include all information (with the operation name)
+    if len(tokens) != 3 or tokens[1] not in UserProvisioner.TABLES:
+        session.print("Please try again!")
+        return
+
+    try:
+        with open(tokens[2], newline="") as user_file:
+            users, errors = UserProvisioner.read_users(user_file)
+        for line_no, message in errors:
+            session.print("line " + str(line_no) + ": " + message)
+
+        start_time = time.perf_counter()
+        created, rejected = UserProvisioner(tokens[1], users).run(session.work)
+        elapsed = time.perf_counter() - start_time
+
+        for line_no, username, reason in rejected:
+            session.print("line " + str(line_no) + ": " + username + ": " + reason)
+        session.print("Created {} of {} users in {:.3f}s ({} rejected, {} malformed lines)".format(
+            len(created), len(users), elapsed, len(rejected), len(errors)))
+    except DatabaseError as e:
+        session.print("Failed to create users.")
+        session.print("Db-Error:", e)
+        return
+    except OSError as e:
+        session.print("Could not read user file")
+        session.print("Error:", e)
+    except Exception as e:
+        session.print("Failed to create users.")
+        session.print("Error:", e)
+
+
+def add_doses(session, tokens):
+    #  add_doses <vaccine> <number>
+    #  check 1: check if the current logged-in user is a caregiver
+    if session.current_caregiver is None:
+        session.print("Please login as a caregiver first!")
+        return
+
+    #  check 2: the length for tokens need to be exactly 3 to include all information (with the operation name)
+    if len(tokens) != 3:
+        session.print("Please try again!")
+        return
+
+    vaccine_name = tokens[1]
+    try:
+        doses = int(tokens[2])
+    except ValueError:
+        session.print("Please try again!")
+        return
+    if CommandJournal.configured() is not None:
+        if doses <= 0:
+            session.print("Error occurred when adding doses")
+            session.print("Error: Argument cannot be negative!")
+            return
+        try:
+            CommandJournal.configured().append("add_doses", session.current_caregiver.username,
+                                               {"vaccine": vaccine_name, "doses": doses})
+        except OSError as e:
+            session.print("Error occurred when adding doses")
+            session.print("Error:", e)
+            return
+        session.print("Doses updated!")
+        return
+    vaccine = None
+    try:
+        vaccine = Vaccine(vaccine_name, doses).get(session.work)
+    except DatabaseError as e:
+        session.print("Error occurred when adding doses")
+        session.print("Db-Error:", e)
+        return
+    except Exception as e:
+        session.print("Error occurred when adding doses")
+        session.print("Error:", e)
+        return
+
+    # if the vaccine is not found in the database, add a new (vaccine, doses) entry.
+    # else, update the existing entry by adding the new doses
+    if vaccine is None:
+        vaccine = Vaccine(vaccine_name, doses)
+        try:
+            vaccine.save_to_db(session.work)
+            session.work.commit()
+        except DatabaseError as e:
+            session.print("Error occurred when adding doses")
+            session.print("Db-Error:", e)
+            return
+        except Exception as e:
+            session.print("Error occurred when adding doses")
+            session.print("Error:", e)
+            return
+    else:
+        # if the vaccine is not null, meaning that the vaccine already exists in our table
+        try:
+            vaccine.increase_available_doses(doses, session.work)
+            session.work.commit()
+        except DatabaseError as e:
+            session.print("Error occurred when adding doses")
+            session.print("Db-Error:", e)
+            return
+        except Exception as e:
+            session.print("Error occurred when adding doses")
+            session.print("Error:", e)
+            return
+    session.print("Doses updated!")
+
+
+def dose_report(session, tokens):
+    # dose_report [<vaccine>]
+    # check 1: check if the current logged-in user is a caregiver
+    if session.current_caregiver is None:
+        session.print("Please login as a caregiver first!")
+        return
+
+    # check 2: at most one vaccine to show the daily appointments of
+    if len(tokens) > 2:
+        session.print("Please try again!")
+        return
+
+    forecast = DoseForecast()
+    today = datetime.date.today()
+    vaccine_name = tokens[1] if len(tokens) == 2 else None
+    try:
+        rows = forecast.report(today, session.work, vaccine_name)
+        if vaccine_name is not None and not rows:
+            session.print("Vaccine not found!")
+            return
+        session.print("Vaccine Doses Booked PerDay StockOut")
+        for row in rows:
+            stock_out = str(row["StockOut"]) if row["StockOut"] is not None else "none in " + str(forecast.horizon) + " days"
+            session.print(row["Vname"] + " " + str(row["Doses"]) + " " + str(row["Booked"]) + " " +
+                          "{:.2f}".format(row["Rate"]) + " " + stock_out)
+        session.print("Open slots in the next " + str(forecast.horizon) + " days: " +
+                      str(DoseForecast.open_slots(today, today + datetime.timedelta(days=forecast.horizon), session.work)))
+
+        if vaccine_name is not None:
+            first = today - datetime.timedelta(days=forecast.window)
+            days = DoseForecast.daily_usage(first, today + datetime.timedelta(days=forecast.window),
+                                            session.work).get(vaccine_name, {})
+            for i in range(2 * forecast.window):
+                day = first + datetime.timedelta(days=i)
+                session.print(str(day) + " " + str(days.get(day, 0)))
+    except DatabaseError as e:
+        session.print("Error occurred when reporting doses")
+        session.print("Db-Error:", e)
+        return
+    except Exception as e:
+        session.print("Error occurred when reporting doses")
+        session.print("Error:", e)
+        return
+
+
+def show_appointments(session, tokens):
+    # show_appointments [--from <date>] [--to <date>] [--vaccine <vaccine>] [--upcoming] [--csv | --json]
+    # check 1: Check if there's any user logged in
+    
+    
+    if session.current_caregiver is None and session.current_patient is None: 
+        session.print("Please login first!")
+        return
+    
+    # check 2: the options need to be well-formed
+    try:
+        options = parse_show_options(tokens[1:])
+    except (ValueError, IndexError):
+        session.print("Please try again!") 
+        return
+
+    if session.current_caregiver is not None:
+        role, username, other = "caregiver", session.current_caregiver.username, "Pusername"
+    else:
+        role, username, other = "patient", session.current_patient.username, "Cusername"
+
+    # rows are printed as they are streamed from the database, never collected in memory
+    try:
+        rows = Appointment.iter_for_user(role, username, start=options["from"], end=options["to"],
+                                         vaccine=options["vaccine"], upcoming=options["upcoming"], work=session.work)
+        count = 0
+        writer = None
+        for row in rows:
+            if options["format"] == "csv":
+                if writer is None:
+                    writer = csv.writer(session, lineterminator="\n")
+                    writer.writerow(["Id", "Vname", "Time", "SlotTime", other])
+                writer.writerow([row["Id"], row["Vname"], row["Time"], Util.format_slot(row["SlotTime"]), row[other]])
+            elif options["format"] == "json":
+                session.print(json.dumps({"Id": row["Id"], "Vname": row["Vname"], "Time": str(row["Time"]),
+                                          "SlotTime": Util.format_slot(row["SlotTime"]), other: row[other]}))
+            else:
+                session.print(str(row["Id"]) + " " + str(row["Vname"]) + " " + str(row["Time"]) + " " + 
+                              Util.format_slot(row["SlotTime"]) + " " + str(row[other]))
+            count += 1
+        if count == 0 and options["format"] == "text":
+            session.print("No appointment scheduled.")
+                 
+    except DatabaseError as e:
+        session.print("Error occurred when showing appointments")
+        session.print("Db-Error:", e)
+        return
+    except Exception as e:
+        session.print("Error occurred when showing appointments")
+        session.print("Error:", e)
+    return False 
+
+
+def parse_show_options(args):
+    options = {"from": None, "to": None, "vaccine": None, "upcoming": False, "format": "text"}
+    i = 0
+    while i < len(args):
+        if args[i] == "--from":
+            options["from"] = Util.parse_date(args[i + 1])
+            i += 1
+        elif args[i] == "--to":
+            options["to"] = Util.parse_date(args[i + 1])
+            i += 1
+        elif args[i] == "--vaccine":
+            options["vaccine"] = args[i + 1]
+            i += 1
+        elif args[i] == "--upcoming":
+            options["upcoming"] = True
+        elif args[i] in ("--csv", "--json"):
+            options["format"] = args[i][2:]
+        else:
+            raise ValueError("Unknown option " + args[i])
+        i += 1
+    return options
+    
+
+def logout(session, tokens): 
+    # Logout
+    
+    # check 1: the length for tokens need to be exactly 1 to include all information (with the operation name)
+    if len(tokens) != 1:
+        session.print("Please try again!") 
+        return
+
+    # check 2: Check if there's any user logged in
+    try:
+        if session.current_caregiver == session.current_patient:
+            session.print("Please login first.")
+            return 
+        session.current_caregiver = None
+        session.current_patient = None
+        session.print("Successfully logged out!")
+    except Exception as e:
+        session.print("Error occurred when logging out")
+        session.print("Error:", e)
+    return
+    
+
+COMMANDS = {
+    "create_patient": create_patient,
+    "create_caregiver": create_caregiver,
+    "login_patient": login_patient,
+    "login_caregiver": login_caregiver,
+    "login_token": login_token,
+    "revoke_token": revoke_token,
+    "search_caregiver_schedule": search_caregiver_schedule,
+    "reserve": reserve,
+    "reserve_batch": reserve_batch,
+    "provision_users": provision_users,
+    "upload_availability": upload_availability,
+    "cancel": cancel,
+    "add_doses": add_doses,
+    "dose_report": dose_report,
+    "show_appointments": show_appointments,
+    "logout": logout,
+}
+
+
+# seconds a command may spend waiting for connections and retrying transient database errors
+COMMAND_DEADLINE = float(os.getenv("CommandDeadline", "30"))
+
+# commands that only read; they may be served by a read replica, see db/ReplicaRouter.py
+READ_ONLY_COMMANDS = ("search_caregiver_schedule", "show_appointments")
+
+
+def run_command(session, tokens):
+    # dispatches one parsed command; returns True once the user asks to quit
+    operation = tokens[0]
+    if operation == "quit":
+        session.print("Bye!")
+        return True
+    if operation not in COMMANDS:
+        session.print("Invalid operation name!")
+        return False
+    # the unit is labelled with the command, so UnitOfWork.stats() gives the round trips per command;
+    # a read-only one must see at least what the session wrote before
+    read_after = session.last_write if operation in READ_ONLY_COMMANDS else None
+    with Metrics.command(operation, session), \
+            UnitOfWork(operation, deadline=time.monotonic() + COMMAND_DEADLINE, read_after=read_after) as work:
+        session.work = work
+        try:
+            COMMANDS[operation](session, tokens)
+        finally:
+            session.work = None
+            session.note_writes(work)
+    return False
+
+
+# commands whose consecutive runs are folded into one bulk statement in batch mode
+BULK_OPERATIONS = ("upload_availability", "add_doses")
+
+
+def run_batch(session, stream):
+    # batch mode: read every command up front, then run them in order, folding runs of
+    # upload_availability / add_doses into a single bulk write in one unit of work. With the command
+    # journal enabled they are journaled line by line instead, like interactive commands, and the
+    # journal groups them when applying.
+    commands = []
+    for line_no, line in enumerate(stream, start=1):
+        tokens = line.strip().split()
+        if len(tokens) == 0 or tokens[0].startswith("#"):
+            continue
+        commands.append((line_no, tokens))
+
+    bulk_operations = BULK_OPERATIONS if CommandJournal.configured() is None else ()
+    start_time = time.perf_counter()
+    start_stats = UnitOfWork.stats()
+    i = 0
+    while i < len(commands):
+        operation = commands[i][1][0]
+        j = i + 1
+        if operation in bulk_operations:
+            while j < len(commands) and commands[j][1][0] == operation:
+                j += 1
+        group = commands[i:j]
+        if operation == "upload_availability" and operation in bulk_operations:
+            with Metrics.command(operation, session):
+                bulk_upload_availability(session, group)
+        elif operation == "add_doses" and operation in bulk_operations:
+            with Metrics.command(operation, session):
+                bulk_add_doses(session, group)
+        else:
+            line_no, tokens = group[0]
+            session.print("line " + str(line_no) + ": " + " ".join(tokens))
+            if run_command(session, tokens):
+                break
+        i = j
+
+    elapsed = time.perf_counter() - start_time
+    rate = len(commands) / elapsed if elapsed > 0 else float("inf")
+    session.print("Processed {} commands in {:.3f}s ({:.1f} commands/s)".format(len(commands), elapsed, rate))
+    # database round trips per command run in this batch (totals include concurrent sessions, if any)
+    for operation, totals in sorted(UnitOfWork.stats().items()):
+        before = start_stats.get(operation, {"units": 0, "round_trips": 0})
+        units = totals["units"] - before["units"]
+        if units > 0:
+            session.print("  {:<26}{:>6} runs {:>8.1f} round trips each".format(
+                operation, units, (totals["round_trips"] - before["round_trips"]) / units))
+
+
+def bulk_upload_availability(session, group):
+    #  a run of upload_availability lines (single dates, lists or ranges) for the logged-in caregiver
+    if session.current_caregiver is None:
+        for line_no, _ in group:
+            session.print("line " + str(line_no) + ": Please login as a caregiver first!")
+        return
+
+    # lines are bulk inserted together per slot specification, usually just one; the results are
+    # printed in line order
+    lines_by_slots = {}
+    results = []
+    for line_no, tokens in group:
+        try:
+            tokens, slots = availability_slots(tokens)
+            if len(tokens) < 2 or len(tokens) > 4:
+                results.append((line_no, "Please try again!"))
+                continue
+            key = tuple(slots) if slots is not None else None
+            lines_by_slots.setdefault(key, []).append((line_no, availability_dates(tokens)))
+        except (ValueError, IndexError):
+            results.append((line_no, "Please enter a valid statement"))
+
+    with UnitOfWork("upload_availability") as work:
+        for slots, lines in lines_by_slots.items():
+            results.extend(bulk_upload_slots(work, session, lines, list(slots) if slots is not None else None))
+        session.note_writes(work)
+    for line_no, message in sorted(results):
+        session.print("line " + str(line_no) + ": " + message)
+
+
+def bulk_upload_slots(work, session, lines, slots):
+    # uploads the dates of lines with the same slots in one transaction of work; returns (line number, message) pairs
+    try:
+        inserted = session.current_caregiver.upload_availabilities([d for _, dates in lines for d in dates], slots, work)
+        work.commit()
+    except DatabaseError as e:
+        work.rollback()
+        return [(line_no, "Upload Availability Failed\nDb-Error: " + str(e)) for line_no, _ in lines]
+    except ValueError as e:
+        work.rollback()
+        return [(line_no, "Please enter a valid statement\nError: " + str(e)) for line_no, _ in lines]
+
+    # a date is credited to the first line that named it
+    results = []
+    for line_no, dates in lines:
+        new_dates = [d for d in set(dates) if d in inserted]
+        inserted.difference_update(new_dates)
+        if len(new_dates) == len(set(dates)):
+            results.append((line_no, "Availability uploaded!"))
+        else:
+            results.append((line_no, "Availability uploaded for " + str(len(new_dates)) + " of "
+                            + str(len(set(dates))) + " dates"))
+    return results
+
+
+def bulk_add_doses(session, group):
+    #  a run of add_doses <vaccine> <number> lines, summed per vaccine and applied together
+    if session.current_caregiver is None:
+        for line_no, _ in group:
+            session.print("line " + str(line_no) + ": Please login as a caregiver first!")
+        return
+
+    accepted = []
+    totals = {}
+    for line_no, tokens in group:
+        if len(tokens) != 3:
+            session.print("line " + str(line_no) + ": Please try again!")
+            continue
+        try:
+            doses = int(tokens[2])
+        except ValueError:
+            session.print("line " + str(line_no) + ": Please try again!")
+            continue
+        if doses <= 0:
+            session.print("line " + str(line_no) + ": Error occurred when adding doses")
+            session.print("line " + str(line_no) + ": Error: Argument cannot be negative!")
+            continue
+        totals[tokens[1]] = totals.get(tokens[1], 0) + doses
+        accepted.append(line_no)
+
+    try:
+        with UnitOfWork("add_doses") as work:
+            Vaccine.add_doses_bulk(totals, work)
+            work.commit()
+            session.note_writes(work)
+    except DatabaseError as e:
+        for line_no in accepted:
+            session.print("line " + str(line_no) + ": Error occurred when adding doses")
+        session.print("Db-Error:", e)
+        return
+
+    for line_no in accepted:
+        session.print("line " + str(line_no) + ": Doses updated!")
@@ -0,0 +1,142 @@
+from db.ConnectionManager import ConnectionManager
+from db.UnitOfWork import UnitOfWork
+from model.Vaccine import Vaccine
+import datetime
+import os
+
+
+class DoseForecast:
+    '''
+    Projects, for every vaccine, when its doses run out, for the dose_report command.
+    Usage is read from DailyDoseUsage, the appointments per vaccine and day, rather than from
+    Appointment itself. The summary is brought up to date by refresh(), which adds only the
+    appointments booked since the last refresh: DoseUsageWatermark holds the last Appointment Id
+    summarized, and the rows past it are taken to be the new bookings. That holds only while no
+    booking with a lower Id commits after the refresh has read past it. Ids are handed out when a row
+    is inserted, not when it commits, so refresh makes sure of it by locking: on SQLite writers run one
+    at a time, so a row is committed before the next Id is handed out, and on SQL Server the refresh
+    reads Appointment under a shared table lock, which waits for every booking in flight and holds
+    off new ones until the watermark is stored. Cancelling an appointment already summarized takes it
+    out of its day again (see Appointment._cancel_where).
+    Doses are taken from Vaccines.Doses when an appointment is booked, so the stock is what is left
+    for bookings still to come. Those are expected at the daily rate of the ForecastWindow days before
+    today: a day with fewer bookings than that rate is expected to fill up to it, drawing on the stock,
+    and the stock-out date is the first day, within ForecastHorizon days, the stock can't.
+    '''
+
+    def __init__(self, window=None, horizon=None):
+        self.window = window or int(os.getenv("ForecastWindow", "14"))
+        self.horizon = horizon or int(os.getenv("ForecastHorizon", "90"))
+
+    # Add the appointments booked since the last refresh to DailyDoseUsage, committing in work
+    # (or a unit of its own)
+    @staticmethod
+    def refresh(work=None):
+        refresh_batch = """
+            SET NOCOUNT ON;
+            DECLARE @last int, @max int;
+            DECLARE @new TABLE (Vname varchar(255), Time date, Booked int);
+
+            -- the exclusive lock makes cancels wait until the summary and watermark agree again
+            UPDATE DoseUsageWatermark SET @last = LastId, LastId = LastId WHERE Id = 1;
+
+            -- Ids are taken at insert, not at commit: the table lock waits for the bookings in flight
+            -- and holds off new ones until the watermark is stored, so it never passes one
+            SELECT @max = ISNULL(MAX(Id), @last) FROM Appointment WITH (TABLOCK, HOLDLOCK) WHERE Id > @last;
+
+            INSERT INTO @new
+            SELECT Vname, Time, COUNT(*) FROM Appointment
+            WHERE Id > @last AND Id <= @max AND Vname IS NOT NULL AND Time IS NOT NULL
+            GROUP BY Vname, Time;
+
+            UPDATE d SET Booked = d.Booked + n.Booked
+            FROM DailyDoseUsage d JOIN @new n ON d.Vname = n.Vname AND d.Time = n.Time;
+
+            INSERT INTO DailyDoseUsage (Vname, Time, Booked)
+            SELECT n.Vname, n.Time, n.Booked FROM @new n
+            WHERE NOT EXISTS (SELECT 1 FROM DailyDoseUsage WHERE Vname = n.Vname AND Time = n.Time);
+
+            UPDATE DoseUsageWatermark SET LastId = @max WHERE Id = 1;
+        """
+        with UnitOfWork.join(work) as work:
+            cursor = work.cursor()
+            if ConnectionManager.backend().name == "sqlite":
+                # the write lock keeps cancels out until the summary and watermark agree again; since
+                # writers run one at a time, every Id up to MAX(Id) is committed or rolled back
+                work.begin()
+                cursor.execute("SELECT LastId FROM DoseUsageWatermark WHERE Id = 1")
+                last = cursor.fetchone()[0]
+                cursor.execute("SELECT MAX(Id) FROM Appointment WHERE Id > %d", last)
+                newest = cursor.fetchone()[0]
+                if newest is None:
+                    return
+                cursor.execute("INSERT INTO DailyDoseUsage (Vname, Time, Booked) "
+                               "SELECT Vname, Time, COUNT(*) FROM Appointment "
+                               "WHERE Id > %d AND Id <= %d AND Vname IS NOT NULL AND Time IS NOT NULL "
+                               "GROUP BY Vname, Time "
+                               "ON CONFLICT (Vname, Time) DO UPDATE SET Booked = Booked + excluded.Booked",
+                               (last, newest))
+                cursor.execute("UPDATE DoseUsageWatermark SET LastId = %d WHERE Id = 1", newest)
+            else:
+                cursor.execute(refresh_batch)
+
+    # Appointments per vaccine and day from start up to (not including) end, as
+    # {vaccine name: {date: appointments}}; days without any are left out
+    @staticmethod
+    def daily_usage(start, end, work=None):
+        get_usage = "SELECT Vname, Time, Booked FROM DailyDoseUsage WHERE Time >= %s AND Time < %s AND Booked > 0"
+        usage = {}
+        with UnitOfWork.join(work, commit=False) as work:
+            cursor = work.cursor()
+            cursor.execute(get_usage, (start, end))
+            for vaccine_name, day, booked in cursor:
+                usage.setdefault(vaccine_name, {})[day] = booked
+        return usage
+
+    # Open slots from start up to (not including) end, for every vaccine together
+    @staticmethod
+    def open_slots(start, end, work=None):
+        get_open = "SELECT SUM(Capacity) FROM Availabilities WHERE Time >= %s AND Time < %s"
+        with UnitOfWork.join(work, commit=False) as work:
+            cursor = work.cursor()
+            cursor.execute(get_open, (start, end))
+            return cursor.fetchone()[0] or 0
+
+    # The first day from today on, within horizon days, on which doses left over after the bookings
+    # in booked (date -> appointments) can't cover rate appointments, or None
+    @staticmethod
+    def stock_out(doses, booked, rate, today, horizon):
+        left = doses
+        for i in range(horizon):
+            day = today + datetime.timedelta(days=i)
+            left -= max(rate - booked.get(day, 0), 0)
+            if left < 0:
+                return day
+        return None
+
+    # Refresh the summary and project every vaccine, or only vaccine_name, in name order, as dicts of
+    # Vname, Doses (in stock), Booked (in the next horizon days), Rate (a day, over the window days
+    # before today) and StockOut (a date or None)
+    def report(self, today=None, work=None, vaccine_name=None):
+        today = today or datetime.date.today()
+        first = today - datetime.timedelta(days=self.window)
+        with UnitOfWork.join(work, commit=False) as work:
+            DoseForecast.refresh(work)
+            work.commit()
+            usage = DoseForecast.daily_usage(first, today + datetime.timedelta(days=self.horizon), work)
+            rows = []
+            for vaccine in Vaccine.get_all(work):
+                if vaccine_name is not None and vaccine["Name"] != vaccine_name:
+                    continue
+                days = usage.get(vaccine["Name"], {})
+                rate = sum(booked for day, booked in days.items() if day < today) / self.window
+                ahead = {day: booked for day, booked in days.items()
+                         if today <= day < today + datetime.timedelta(days=self.horizon)}
+                rows.append({
+                    "Vname": vaccine["Name"],
+                    "Doses": vaccine["Doses"],
+                    "Booked": sum(ahead.values()),
+                    "Rate": rate,
+                    "StockOut": DoseForecast.stock_out(vaccine["Doses"], ahead, rate, today, self.horizon),
+                })
+            return rows
@@ -0,0 +1,59 @@
+import sys
+import uuid
+import asyncio
+from util.Metrics import Metrics
+
+
+class Session:
+    '''
+    Per-user state for the scheduler commands.
+    Note: it is always true that at most one of current_caregiver and current_patient is not null
+          since only one user can be logged-in per session at a time
+    Output written with print() goes straight to stdout, or is collected when the session was
+    created with an output buffer (e.g. for sessions served over the network).
+    '''
+
+    def __init__(self, out=None):
+        self.session_id = uuid.uuid4().hex
+        self.current_patient = None
+        self.current_caregiver = None
+        self.out = out
+        self.closed = False
+        # the UnitOfWork of the command being run, set by Commands.run_command
+        self.work = None
+        # when (time.time()) the session's last write committed; its reads must see at least that
+        self.last_write = 0.0
+        # serializes the commands of one session when it is driven through AsyncScheduler
+        self.lock = asyncio.Lock()
+
+    def print(self, *args, sep=" ", end="\n"):
+        with Metrics.phase("output"):
+            text = sep.join(str(arg) for arg in args) + end
+            if self.out is None:
+                sys.stdout.write(text)
+            else:
+                self.out.append(text)
+
+    # file-like write, e.g. for csv.writer
+    def write(self, text):
+        self.print(text, end="")
+
+    # returns and clears everything buffered since the last call
+    def drain(self):
+        if self.out is None:
+            return ""
+        text = "".join(self.out)
+        self.out.clear()
+        return text
+
+    # remember when work last committed a write of this session
+    def note_writes(self, work):
+        if work.last_write is not None:
+            self.last_write = max(self.last_write, work.last_write)
+
+    def username(self):
+        if self.current_patient is not None:
+            return self.current_patient.get_username()
+        if self.current_caregiver is not None:
+            return self.current_caregiver.get_username()
+        return None
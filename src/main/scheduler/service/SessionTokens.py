@@ -0,0 +1,121 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionTokens:
+    '''
+    Signed, expiring login tokens, so a user who logs in again doesn't pay for another password hash.
+    A successful password login is given a token naming the role and username; login_token accepts it
+    until it expires (SessionTokenTTL seconds, a shift by default) by checking its HMAC-SHA256 signature
+    and looking it up in memory; only the account's existence is read from the database. Users revoke
+    their own tokens, e.g. one that leaked.
+    Tokens are signed with SessionTokenKey (hex), or a random key per process when unset, in which case
+    they end with the process. Only the SessionTokenMax most recently used tokens are kept: a token that
+    was revoked, or evicted to stay within the bound, is refused even while its signature is valid, and
+    the user logs in with the password again.
+    '''
+
+    _configured = None
+    _configured_lock = threading.Lock()
+
+    def __init__(self, key=None, ttl=None, max_size=None):
+        self.key = key or secrets.token_bytes(32)
+        self.ttl = ttl or float(os.getenv("SessionTokenTTL", "28800"))
+        self.max_size = max_size or int(os.getenv("SessionTokenMax", "10000"))
+        # token id -> (role, username, expires_at); least recently used first
+        self._live = OrderedDict()
+        self._lock = threading.Lock()
+        self.issued = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.evictions = 0
+
+    @staticmethod
+    def configured():
+        with SessionTokens._configured_lock:
+            if SessionTokens._configured is None:
+                key = os.getenv("SessionTokenKey")
+                SessionTokens._configured = SessionTokens(bytes.fromhex(key) if key else None)
+            return SessionTokens._configured
+
+    # A new token for a user who just proved their password; role is "patient" or "caregiver"
+    def issue(self, role, username):
+        token_id = secrets.token_urlsafe(12)
+        expires = int(time.time() + self.ttl)
+        payload = encode(":".join([role, username, str(expires), token_id]))
+        token = payload + "." + encode(self.sign(payload))
+        with self._lock:
+            self._live[token_id] = (role, username, expires)
+            while len(self._live) > self.max_size:
+                self._live.popitem(last=False)
+                self.evictions += 1
+            self.issued += 1
+        return token
+
+    # (role, username) of a valid token, or None if it is malformed, forged, expired or revoked
+    def validate(self, token):
+        claims = self._parse(token)
+        with self._lock:
+            if claims is None:
+                self.rejected += 1
+                return None
+            role, username, expires, token_id = claims
+            if self._live.get(token_id) != (role, username, expires) or expires <= time.time():
+                self._live.pop(token_id, None)
+                self.rejected += 1
+                return None
+            self._live.move_to_end(token_id)
+            self.accepted += 1
+        return role, username
+
+    # Revoke token if it was issued to owner, a (role, username) pair; returns whether it was live
+    def revoke(self, token, owner):
+        claims = self._parse(token)
+        if claims is None or claims[:2] != tuple(owner):
+            return False
+        with self._lock:
+            return self._live.pop(claims[3], None) is not None
+
+    def sign(self, payload):
+        return hmac.new(self.key, payload.encode("ascii"), hashlib.sha256).digest()
+
+    # (role, username, expires, token id) of a correctly signed token, else None
+    def _parse(self, token):
+        payload, _, signature = token.partition(".")
+        try:
+            if not hmac.compare_digest(decode(signature), self.sign(payload)):
+                return None
+            fields = decode(payload).decode("utf-8").split(":")
+            if len(fields) < 4:
+                return None
+            # usernames are whitespace-free but may contain ":"
+            return fields[0], ":".join(fields[1:-2]), int(fields[-2]), fields[-1]
+        except ValueError:
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "live": len(self._live),
+                "issued": self.issued,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "evictions": self.evictions,
+            }
+
+
+def encode(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def decode(text):
+    # raises ValueError (binascii.Error) for text that isn't base64
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
@@ -0,0 +1,99 @@
+from db.UnitOfWork import UnitOfWork
+from db.BulkSql import BulkSql
+from db.Backend import DatabaseError
+from util.Util import Util
+from util.Metrics import Metrics
+import csv
+import os
+
+
+class UserProvisioner:
+    '''
+    Creates many patient or caregiver accounts at once, e.g. when onboarding a clinic.
+    Weak passwords and usernames repeated in the file are rejected up front, and the usernames already
+    taken are found with one set-based query rather than a lookup per user. Every password is then
+    handed to the hash pool (see Util.hash_executor) at once, and the accounts are inserted with
+    multi-row INSERTs in batches of ProvisionBatchSize, each committed on its own while the pool keeps
+    hashing the batches after it. A batch the database refuses is rolled back and its users rejected;
+    the batches before and after it are kept.
+    '''
+
+    TABLES = {"patient": "Patients", "caregiver": "Caregivers"}
+
+    TAKEN = "username taken"
+    DUPLICATE = "username repeated in the file"
+    FAILED = "insert failed: "
+
+    def __init__(self, role, users):
+        self.table = UserProvisioner.TABLES[role]
+        # [(line number, username, password)]
+        self.users = users
+        self.batch_size = int(os.getenv("ProvisionBatchSize", "1000"))
+
+    # Read users from CSV lines "username,password".
+    # Returns (users, errors) where errors are (line number, message) for malformed lines.
+    @staticmethod
+    def read_users(stream):
+        users = []
+        errors = []
+        for line_no, row in enumerate(csv.reader(stream), start=1):
+            if len(row) == 0 or row[0].startswith("#"):
+                continue
+            if len(row) != 2 or not row[0].strip() or " " in row[0].strip():
+                errors.append((line_no, "expected username,password"))
+                continue
+            users.append((line_no, row[0].strip(), row[1]))
+        return users, errors
+
+    # Create the accounts, committing each batch in work (or a unit of its own).
+    # Returns (created, rejected): created as usernames and rejected as (line number, username, reason),
+    # both in line order.
+    def run(self, work=None):
+        rejected = []
+        accepted = []
+        seen = set()
+        for line_no, username, password in self.users:
+            problems = Util.password_problems(password)
+            if problems:
+                rejected.append((line_no, username, " ".join(problems)))
+            elif username in seen:
+                rejected.append((line_no, username, UserProvisioner.DUPLICATE))
+            else:
+                seen.add(username)
+                accepted.append((line_no, username, password))
+        if len(accepted) == 0:
+            return [], sorted(rejected)
+
+        created = []
+        with UnitOfWork.join(work, commit=False) as work:
+            cursor = work.cursor()
+            taken = {row[0] for row in BulkSql.select_in(cursor, "SELECT Username FROM " + self.table + " WHERE Username IN ",
+                                                         [username for _, username, _ in accepted])}
+            work.commit()
+            new_users = []
+            for line_no, username, password in accepted:
+                if username in taken:
+                    rejected.append((line_no, username, UserProvisioner.TAKEN))
+                else:
+                    new_users.append((line_no, username, password))
+
+            # hashing is the slow part, so the pool starts on every password before the first insert
+            params = Util.hash_params()
+            salts = [Util.generate_salt() for _ in new_users]
+            futures = [Util.submit_hash(password, salt, params) for (_, _, password), salt in zip(new_users, salts)]
+            for i in range(0, len(new_users), self.batch_size):
+                batch = new_users[i:i + self.batch_size]
+                with Metrics.phase("hash"):
+                    hashes = [future.result() for future in futures[i:i + self.batch_size]]
+                rows = [(username, salt, hash, params)
+                        for (_, username, _), salt, hash in zip(batch, salts[i:i + self.batch_size], hashes)]
+                try:
+                    BulkSql.insert_rows(cursor, self.table + " (Username, Salt, Hash, HashParams)", rows)
+                    work.commit()
+                except DatabaseError as e:
+                    # e.g. a username created concurrently since the check above
+                    work.rollback()
+                    rejected.extend((line_no, username, UserProvisioner.FAILED + str(e)) for line_no, username, _ in batch)
+                    continue
+                created.extend(username for _, username, _ in batch)
+        return created, sorted(rejected)
@@ -0,0 +1,248 @@
+import atexit
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+
+
+class Metrics:
+    '''
+    Per-command tracing, switched on by setting MetricsFile.
+    Each command run through Metrics.command gets a Trace on its thread. The instrumented calls add the
+    time they take to a phase of it: "connect" (pool checkout, including connection setup), "query"
+    (cursor execute and fetch), "hash" (waiting for password hashing) and "output" (session printing).
+    Whatever is left of the command's time is "other". Rows fetched and database round trips (see
+    UnitOfWork) are counted along the way.
+    Finished commands go to MetricsFile in MetricsFormat: "jsonl" (the default) appends one JSON object
+    per command, "prometheus" rewrites the file with totals per command every MetricsInterval seconds
+    and at exit.
+    ProfileCommands (a comma-separated list of commands, or "all") runs those commands under cProfile
+    and writes one .prof file per run to ProfileDir; it works with or without MetricsFile.
+    '''
+
+    PHASES = ("connect", "query", "hash", "output", "other")
+    # upper bounds of the command latency histogram, in seconds
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    path = os.getenv("MetricsFile")
+    format = os.getenv("MetricsFormat", "jsonl")
+    interval = float(os.getenv("MetricsInterval", "10"))
+    profiled = {name for name in os.getenv("ProfileCommands", "").split(",") if name}
+    profile_dir = os.getenv("ProfileDir", "profiles")
+    enabled = path is not None or len(profiled) > 0
+
+    _local = threading.local()
+    _lock = threading.Lock()
+    # command -> totals, see _add_totals
+    _totals = {}
+    _file = None
+    _last_export = 0.0
+    _profiles = 0
+    # only one cProfile can be active at a time; a profiled command that finds it taken runs unprofiled
+    _profile_lock = threading.Lock()
+
+    @staticmethod
+    def current():
+        return getattr(Metrics._local, "trace", None)
+
+    # Time the block into phase name of the current command; a no-op outside a traced command
+    @staticmethod
+    def phase(name):
+        trace = Metrics.current()
+        if trace is None:
+            return _NO_PHASE
+        return Phase(trace, name)
+
+    @staticmethod
+    def add_rows(count):
+        trace = Metrics.current()
+        if trace is not None:
+            trace.rows += count
+
+    @staticmethod
+    def add_round_trips(count):
+        trace = Metrics.current()
+        if trace is not None:
+            trace.round_trips += count
+
+    # Trace the command run in the block (and profile it, if configured); nested calls join the outer trace
+    @staticmethod
+    @contextlib.contextmanager
+    def command(name, session=None):
+        if not Metrics.enabled or Metrics.current() is not None:
+            yield None
+            return
+        trace = Trace(name, session.session_id if session is not None else None)
+        profiler = None
+        if (name in Metrics.profiled or "all" in Metrics.profiled) and Metrics._profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+        Metrics._local.trace = trace
+        try:
+            if profiler is not None:
+                profiler.enable()
+            yield trace
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            trace.finish()
+            Metrics._local.trace = None
+            if profiler is not None:
+                trace.profile = Metrics._dump_profile(profiler, name)
+                Metrics._profile_lock.release()
+            Metrics.record(trace)
+
+    @staticmethod
+    def _dump_profile(profiler, name):
+        with Metrics._lock:
+            Metrics._profiles += 1
+            number = Metrics._profiles
+        os.makedirs(Metrics.profile_dir, exist_ok=True)
+        path = os.path.join(Metrics.profile_dir, "{}-{}-{}-{}.prof".format(name, os.getpid(), int(time.time()), number))
+        profiler.dump_stats(path)
+        return path
+
+    @staticmethod
+    def record(trace):
+        if Metrics.path is None:
+            return
+        with Metrics._lock:
+            Metrics._add_totals(trace)
+            if Metrics.format == "prometheus":
+                if trace.end - Metrics._last_export >= Metrics.interval:
+                    Metrics._write_prometheus()
+            else:
+                if Metrics._file is None:
+                    Metrics._file = open(Metrics.path, "a", buffering=1)
+                    atexit.register(Metrics._file.close)
+                Metrics._file.write(json.dumps(trace.as_dict()) + "\n")
+
+    @staticmethod
+    def _add_totals(trace):
+        totals = Metrics._totals.get(trace.command)
+        if totals is None:
+            totals = {"count": 0, "seconds": 0.0, "buckets": [0] * len(Metrics.BUCKETS),
+                      "phases": dict.fromkeys(Metrics.PHASES, 0.0), "rows": 0, "round_trips": 0}
+            Metrics._totals[trace.command] = totals
+        totals["count"] += 1
+        totals["seconds"] += trace.seconds
+        for i, bound in enumerate(Metrics.BUCKETS):
+            if trace.seconds <= bound:
+                totals["buckets"][i] += 1
+        for phase, seconds in trace.phases.items():
+            totals["phases"][phase] += seconds
+        totals["rows"] += trace.rows
+        totals["round_trips"] += trace.round_trips
+
+    # per command: count, seconds, buckets (cumulative counts per BUCKETS bound), phases, rows, round_trips
+    @staticmethod
+    def snapshot():
+        with Metrics._lock:
+            return Metrics._copy_totals()
+
+    @staticmethod
+    def _copy_totals():
+        return {command: dict(totals, buckets=list(totals["buckets"]), phases=dict(totals["phases"]))
+                for command, totals in Metrics._totals.items()}
+
+    @staticmethod
+    def prometheus_text(snapshot=None):
+        if snapshot is None:
+            snapshot = Metrics.snapshot()
+        lines = [
+            "# HELP scheduler_command_seconds Time taken by scheduler commands.",
+            "# TYPE scheduler_command_seconds histogram",
+        ]
+        for command, totals in sorted(snapshot.items()):
+            for bound, count in zip(Metrics.BUCKETS, totals["buckets"]):
+                lines.append('scheduler_command_seconds_bucket{{command="{}",le="{}"}} {}'.format(command, bound, count))
+            lines.append('scheduler_command_seconds_bucket{{command="{}",le="+Inf"}} {}'.format(command, totals["count"]))
+            lines.append('scheduler_command_seconds_sum{{command="{}"}} {}'.format(command, totals["seconds"]))
+            lines.append('scheduler_command_seconds_count{{command="{}"}} {}'.format(command, totals["count"]))
+        lines.append("# HELP scheduler_command_phase_seconds_total Time taken by scheduler commands, by phase.")
+        lines.append("# TYPE scheduler_command_phase_seconds_total counter")
+        for command, totals in sorted(snapshot.items()):
+            for phase in Metrics.PHASES:
+                lines.append('scheduler_command_phase_seconds_total{{command="{}",phase="{}"}} {}'.format(
+                    command, phase, totals["phases"][phase]))
+        lines.append("# HELP scheduler_command_rows_total Rows fetched from the database by scheduler commands.")
+        lines.append("# TYPE scheduler_command_rows_total counter")
+        for command, totals in sorted(snapshot.items()):
+            lines.append('scheduler_command_rows_total{{command="{}"}} {}'.format(command, totals["rows"]))
+        lines.append("# HELP scheduler_command_round_trips_total Database round trips made by scheduler commands.")
+        lines.append("# TYPE scheduler_command_round_trips_total counter")
+        for command, totals in sorted(snapshot.items()):
+            lines.append('scheduler_command_round_trips_total{{command="{}"}} {}'.format(command, totals["round_trips"]))
+        return "\n".join(lines) + "\n"
+
+    # called with _lock held; the file is replaced whole, so a scraper never reads half of it
+    @staticmethod
+    def _write_prometheus():
+        if Metrics._last_export == 0.0:
+            atexit.register(Metrics.export)
+        Metrics._last_export = time.perf_counter()
+        temp = Metrics.path + ".tmp"
+        with open(temp, "w") as metrics_file:
+            metrics_file.write(Metrics.prometheus_text(Metrics._copy_totals()))
+        os.replace(temp, Metrics.path)
+
+    # write the Prometheus file now, e.g. at exit
+    @staticmethod
+    def export():
+        if Metrics.path is None or Metrics.format != "prometheus":
+            return
+        with Metrics._lock:
+            Metrics._write_prometheus()
+
+
+class Trace:
+    # the timings of one command
+
+    def __init__(self, command, session_id=None):
+        self.command = command
+        self.session_id = session_id
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.seconds = None
+        self.phases = dict.fromkeys(Metrics.PHASES, 0.0)
+        self.rows = 0
+        self.round_trips = 0
+        self.profile = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    def finish(self):
+        self.end = time.perf_counter()
+        self.seconds = self.end - self.start
+        self.phases["other"] = max(0.0, self.seconds - sum(seconds for phase, seconds in self.phases.items()
+                                                             if phase != "other"))
+
+    def as_dict(self):
+        record = {"ts": round(self.timestamp, 6), "command": self.command, "session": self.session_id,
+                  "seconds": round(self.seconds, 6),
+                  "phases": {phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+                  "rows": self.rows, "round_trips": self.round_trips}
+        if self.profile is not None:
+            record["profile"] = self.profile
+        return record
+
+
+class Phase:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+_NO_PHASE = contextlib.nullcontext()
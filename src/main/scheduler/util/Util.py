@@ -1,17 +1,200 @@
 import hashlib
+import hmac
 import os
+import re
+import datetime
+import threading
+import concurrent.futures
+from util.Metrics import Metrics
 
 
 class Util:
+
+    WEEKDAY_NAMES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+    # The slot a caregiver offers when no time of day is given: the whole day, for one appointment.
+    # Availability uploaded before slots existed is stored this way.
+    ALL_DAY = datetime.time(0, 0)
+    DEFAULT_SLOTS = [(ALL_DAY, 1)]
+
     def generate_salt():
         return os.urandom(16)
 
-    def generate_hash(password, salt):
-        key = hashlib.pbkdf2_hmac(
-            'sha256',
-            password.encode('utf-8'),
-            salt,
-            100000,
-            dklen=16
-        )
-        return key
+    # Hashes are stored with the parameters that produced them, e.g. "pbkdf2_sha256$100000" or
+    # "scrypt$16384$8$1", so the work factor can be raised later and old records upgraded on login.
+    # Records without parameters were created with LEGACY_HASH_PARAMS.
+    LEGACY_HASH_PARAMS = "pbkdf2_sha256$100000"
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    # the parameters new hashes are created with, from HashAlgorithm / HashIterations / HashScrypt{N,R,P}
+    def hash_params():
+        algorithm = os.getenv("HashAlgorithm", "pbkdf2_sha256")
+        if algorithm == "pbkdf2_sha256":
+            return "pbkdf2_sha256$" + str(int(os.getenv("HashIterations", "100000")))
+        if algorithm == "scrypt":
+            return "scrypt${}${}${}".format(int(os.getenv("HashScryptN", "16384")),
+                                             int(os.getenv("HashScryptR", "8")),
+                                             int(os.getenv("HashScryptP", "1")))
+        raise ValueError("Unsupported hash algorithm: " + algorithm)
+
+    def generate_hash(password, salt, params=None):
+        if params is None:
+            params = Util.hash_params()
+        fields = params.split("$")
+        if fields[0] == "pbkdf2_sha256" and len(fields) == 2:
+            return hashlib.pbkdf2_hmac(
+                'sha256',
+                password.encode('utf-8'),
+                salt,
+                int(fields[1]),
+                dklen=16
+            )
+        if fields[0] == "scrypt" and len(fields) == 4:
+            n, r, p = int(fields[1]), int(fields[2]), int(fields[3])
+            return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                                  maxmem=256 * n * r + (1 << 20), dklen=16)
+        raise ValueError("Unsupported hash parameters: " + params)
+
+    # Constant-time check of a password against a stored hash; params None means a legacy record
+    def verify_hash(password, salt, stored_hash, params=None):
+        with Metrics.phase("hash"):
+            calculated_hash = Util.submit_hash(password, salt, params or Util.LEGACY_HASH_PARAMS).result()
+        return hmac.compare_digest(calculated_hash, stored_hash)
+
+    # The rules password fails to meet for a strong password, as messages; empty if it is strong
+    def password_problems(password):
+        problems = []
+        if len(password) < 8:
+            problems.append("At least 8 characters for a strong password.")
+        if not any(char.isalpha() for char in password):
+            problems.append("At least 1 letter for a strong password.")
+        if not any(char.isupper() for char in password):
+            problems.append("At least 1 uppercase letter for a strong password.")
+        if re.search("[a-z]+", password) is None:
+            problems.append("At least 1 lowercase letter for a strong password.")
+        if not any(char.isdigit() for char in password):
+            problems.append("At least 1 number for a strong password.")
+        if re.search(r"[!@#?]+", password) is None:
+            problems.append("Password must have at least 1 special character from (!, @, #, ?)")
+        return problems
+
+    # True if a record hashed with params should be re-hashed with the current configuration
+    def needs_rehash(params):
+        return (params or Util.LEGACY_HASH_PARAMS) != Util.hash_params()
+
+    # The shared pool key derivations run on. hashlib releases the GIL while deriving, so threads use
+    # every core; HashExecutor=process switches to a process pool. HashWorkers sets the pool size.
+    def hash_executor():
+        with Util._executor_lock:
+            if Util._executor is None:
+                workers = int(os.getenv("HashWorkers", str(os.cpu_count() or 1)))
+                if os.getenv("HashExecutor", "thread") == "process":
+                    Util._executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+                else:
+                    Util._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                                           thread_name_prefix="hash")
+            return Util._executor
+
+    # Run generate_hash on the hash pool; returns a Future
+    def submit_hash(password, salt, params=None):
+        if params is None:
+            params = Util.hash_params()
+        return Util.hash_executor().submit(Util.generate_hash, password, salt, params)
+
+    # Hash many (password, salt) pairs in parallel, in order
+    def hash_many(pairs, params=None):
+        with Metrics.phase("hash"):
+            futures = [Util.submit_hash(password, salt, params) for password, salt in pairs]
+            return [future.result() for future in futures]
+
+    # parse a hyphenated mm-dd-yyyy date
+    def parse_date(text):
+        date_tokens = text.split("-")
+        if len(date_tokens) != 3:
+            raise ValueError("Dates must be in the format mm-dd-yyyy")
+        return datetime.date(int(date_tokens[2]), int(date_tokens[0]), int(date_tokens[1]))
+
+    # Expand a recurrence between two dates (both inclusive) into a list of dates.
+    # pattern is one of: daily, weekdays, weekends, every<N> (every Nth day from start),
+    # or a comma-separated list of day names such as mon,wed,fri
+    def expand_dates(start, end, pattern="daily"):
+        if end < start:
+            raise ValueError("End date is before start date")
+        pattern = pattern.lower()
+        step = 1
+        days = None
+        if pattern == "daily":
+            pass
+        elif pattern == "weekdays":
+            days = {0, 1, 2, 3, 4}
+        elif pattern == "weekends":
+            days = {5, 6}
+        elif pattern.startswith("every") and pattern[5:].isdigit() and int(pattern[5:]) > 0:
+            step = int(pattern[5:])
+        elif all(name in Util.WEEKDAY_NAMES for name in pattern.split(",")):
+            days = {Util.WEEKDAY_NAMES.index(name) for name in pattern.split(",")}
+        else:
+            raise ValueError("Unknown recurrence pattern: " + pattern)
+
+        dates = []
+        d = start
+        while d <= end:
+            if days is None or d.weekday() in days:
+                dates.append(d)
+            d += datetime.timedelta(days=step)
+        return dates
+
+    # parse a 24-hour HH:MM time of day
+    def parse_time(text):
+        time_tokens = text.split(":")
+        if len(time_tokens) != 2 or not all(t.isdigit() for t in time_tokens):
+            raise ValueError("Times must be in the format HH:MM")
+        return datetime.time(int(time_tokens[0]), int(time_tokens[1]))
+
+    # Expand a slot specification into a sorted list of (time, capacity) pairs.
+    # spec is a comma-separated list of HH:MM (a single slot) or HH:MM-HH:MM/<minutes> (slots every
+    # <minutes> from the first time up to, not including, the second), each optionally followed by
+    # x<capacity>, the number of appointments the slot takes; e.g. 09:00-12:00/30x2,14:00. 00:00 is the
+    # whole day, so it stands alone.
+    def expand_slots(spec):
+        slots = {}
+        for part in spec.split(","):
+            capacity = 1
+            if "x" in part:
+                part, count = part.split("x", 1)
+                if not count.isdigit() or not 0 < int(count) <= 32767:
+                    raise ValueError("Slot capacity must be a number from 1 to 32767")
+                capacity = int(count)
+            if "-" in part:
+                window, _, step = part.partition("/")
+                first, last = window.split("-", 1)
+                first, last = Util.parse_time(first), Util.parse_time(last)
+                if not step.isdigit() or int(step) <= 0:
+                    raise ValueError("Slot windows need a length in minutes, e.g. 09:00-12:00/30")
+                if last <= first:
+                    raise ValueError("Slot window ends before it starts")
+                minutes = first.hour * 60 + first.minute
+                while minutes < last.hour * 60 + last.minute:
+                    slots[datetime.time(minutes // 60, minutes % 60)] = capacity
+                    minutes += int(step)
+            else:
+                slots[Util.parse_time(part)] = capacity
+        if Util.ALL_DAY in slots and len(slots) > 1:
+            raise ValueError("The whole day (00:00) cannot be combined with other slots")
+        return sorted(slots.items())
+
+    # HH:MM for a slot time; the database driver may hand back time columns as strings
+    def format_time(t):
+        if t is None:
+            return ""
+        if isinstance(t, str):
+            return t[:5]
+        return t.strftime("%H:%M")
+
+    # how a slot is shown to users: HH:MM, or "all day" for the whole-day slot (and appointments booked
+    # before slots existed, which have none)
+    def format_slot(t):
+        text = Util.format_time(t)
+        return "all day" if text in ("", Util.format_time(Util.ALL_DAY)) else text
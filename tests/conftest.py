@@ -0,0 +1,70 @@
+import datetime
+import itertools
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# The scheduler imports its modules relative to src/main/scheduler and reads its settings from the
+# environment once, so both are set up before any test imports it: every test shares one SQLite
+# database in a scratch directory, and keeps apart from the others by naming its rows uniquely.
+SCHEDULER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "main", "scheduler")
+sys.path.insert(0, os.path.abspath(SCHEDULER))
+
+os.environ.update({
+    "DBBackend": "sqlite",
+    "DBPath": os.path.join(tempfile.mkdtemp(prefix="scheduler-tests-"), "scheduler.db"),
+    "HashIterations": "1000",
+    "PoolMaxSize": "16",
+})
+for name in ("JournalFile", "DBReplicas"):
+    os.environ.pop(name, None)
+
+
+_days = itertools.count()
+
+
+@pytest.fixture
+def prefix():
+    return "t" + uuid.uuid4().hex[:8]
+
+
+# a date no other test uses, nor the 30 days after it, since reservations take any caregiver free that day
+@pytest.fixture
+def day():
+    return datetime.date(2100, 1, 1) + datetime.timedelta(days=30 * next(_days))
+
+
+@pytest.fixture
+def run():
+    from service.Commands import run_command
+
+    # runs one command line for session and returns what it printed
+    def run(session, line):
+        run_command(session, line.split())
+        return session.drain()
+    return run
+
+
+@pytest.fixture
+def new_session():
+    from service.Session import Session
+    return lambda: Session(out=[])
+
+
+@pytest.fixture
+def query():
+    from db.ConnectionManager import ConnectionManager
+
+    # the rows of one statement, read outside of any command
+    def query(sql, params=None):
+        cm = ConnectionManager()
+        try:
+            cursor = cm.create_connection().cursor()
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cm.close_connection()
+    return query
@@ -0,0 +1,43 @@
+import datetime
+
+import pytest
+
+PASSWORD = "Passw0rd!x"
+
+
+@pytest.fixture
+def caregiver(prefix, run, new_session):
+    session = new_session()
+    run(session, "create_caregiver " + prefix + "_c " + PASSWORD)
+    run(session, "login_caregiver " + prefix + "_c " + PASSWORD)
+    return session
+
+
+def dates(*days):
+    return ",".join(d.strftime("%m-%d-%Y") for d in days)
+
+
+def test_a_single_date_uploaded_twice_is_skipped(prefix, day, caregiver, run, query):
+    assert run(caregiver, "upload_availability " + dates(day)) == "Availability uploaded!\n"
+    assert run(caregiver, "upload_availability " + dates(day)) == \
+        "Availability uploaded for 0 of 1 dates (1 already uploaded)\n"
+    assert query("SELECT COUNT(*) FROM Availabilities WHERE Username = %s", prefix + "_c") == [(1,)]
+
+
+def test_every_form_skips_the_dates_already_uploaded(prefix, day, caregiver, run, query):
+    later = day + datetime.timedelta(days=1)
+    run(caregiver, "upload_availability " + dates(day))
+    assert run(caregiver, "upload_availability " + dates(day, later)) == \
+        "Availability uploaded for 1 of 2 dates (1 already uploaded)\n"
+    assert run(caregiver, "upload_availability " + dates(day) + " " + dates(later)) == \
+        "Availability uploaded for 0 of 2 dates (2 already uploaded)\n"
+    assert query("SELECT COUNT(*) FROM Availabilities WHERE Username = %s", prefix + "_c") == [(2,)]
+
+
+def test_a_range_uploads_the_dates_of_its_pattern(prefix, day, caregiver, run, query):
+    # 14 days, every third one: days 0, 3, 6, 9 and 12
+    end = day + datetime.timedelta(days=13)
+    assert run(caregiver, "upload_availability " + dates(day) + " " + dates(end) + " every3") == \
+        "Availability uploaded!\n"
+    assert query("SELECT Time FROM Availabilities WHERE Username = %s ORDER BY Time", prefix + "_c") == \
+        [(day + datetime.timedelta(days=i),) for i in range(0, 14, 3)]
@@ -0,0 +1,41 @@
+import io
+
+import pytest
+
+from service.Commands import run_batch
+
+PASSWORD = "Passw0rd!x"
+
+
+@pytest.fixture
+def caregiver(prefix, run, new_session):
+    session = new_session()
+    run(session, "create_caregiver " + prefix + "_c " + PASSWORD)
+    run(session, "login_caregiver " + prefix + "_c " + PASSWORD)
+    return session
+
+
+def test_batch_errors_name_their_line(prefix, caregiver, query):
+    run_batch(caregiver, io.StringIO("add_doses " + prefix + "_vax 4\n"
+                                     "add_doses " + prefix + "_vax abc\n"
+                                     "# a comment\n"
+                                     "add_doses " + prefix + "_vax -1\n"
+                                     "add_doses " + prefix + "_vax 2\n"))
+    lines = caregiver.drain().splitlines()
+    assert lines[:5] == ["line 2: Please try again!",
+                         "line 4: Error occurred when adding doses",
+                         "line 4: Error: Argument cannot be negative!",
+                         "line 1: Doses updated!",
+                         "line 5: Doses updated!"]
+    assert query("SELECT Doses FROM Vaccines WHERE Name = %s", prefix + "_vax") == [(6,)]
+
+
+def test_batch_stops_at_quit(prefix, caregiver, query):
+    run_batch(caregiver, io.StringIO("\n# nothing to do\n"
+                                     "add_doses " + prefix + "_vax 1\n"
+                                     "quit\n"
+                                     "add_doses " + prefix + "_vax 2\n"))
+    output = caregiver.drain()
+    assert "line 4: quit" in output
+    assert "Processed 3 commands" in output
+    assert query("SELECT Doses FROM Vaccines WHERE Name = %s", prefix + "_vax") == [(1,)]
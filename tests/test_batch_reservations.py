@@ -0,0 +1,69 @@
+import datetime
+import threading
+from collections import Counter
+
+from model.Appointment import Appointment
+from service.BatchAllocator import BatchAllocator
+
+PASSWORD = "Passw0rd!x"
+
+
+def test_batch_and_online_reservations_never_overbook(prefix, day, run, new_session, query):
+    caregiver = new_session()
+    for i in range(20):
+        run(caregiver, "create_caregiver " + prefix + "_c" + str(i) + " " + PASSWORD)
+        run(caregiver, "login_caregiver " + prefix + "_c" + str(i) + " " + PASSWORD)
+        run(caregiver, "upload_availability " + day.strftime("%m-%d-%Y"))
+        run(caregiver, "logout")
+    run(caregiver, "login_caregiver " + prefix + "_c0 " + PASSWORD)
+    run(caregiver, "add_doses " + prefix + "_vax 1000")
+    patients = []
+    for i in range(60):
+        patients.append(prefix + "_p" + str(i))
+        run(new_session(), "create_patient " + patients[-1] + " " + PASSWORD)
+
+    # 30 patients booked in one batch while the other 30 reserve online, all for 20 slots
+    results = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(31)
+
+    def batch():
+        barrier.wait()
+        assignments, _ = BatchAllocator([(p, prefix + "_vax", [day]) for p in patients[:30]]).run()
+        with lock:
+            results[Appointment.RESERVED] += len(assignments)
+
+    def online(username):
+        barrier.wait()
+        outcome = Appointment(day, prefix + "_vax", username).reserve()
+        with lock:
+            results[outcome] += 1
+
+    threads = [threading.Thread(target=batch)] + [threading.Thread(target=online, args=(p,)) for p in patients[30:]]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    booked = [row[0] for row in query("SELECT Cusername FROM Appointment WHERE Vname = %s", prefix + "_vax")]
+    assert len(booked) == 20 == results[Appointment.RESERVED]
+    assert len(set(booked)) == 20
+    assert query("SELECT Doses FROM Vaccines WHERE Name = %s", prefix + "_vax") == [(980,)]
+    assert query("SELECT COUNT(*) FROM Availabilities WHERE Username LIKE %s", prefix + "_c%") == [(0,)]
+
+
+def test_allocate_balances_caregivers_and_falls_back_to_later_dates():
+    d1, d2 = datetime.date(2100, 1, 1), datetime.date(2100, 1, 2)
+    availability = {d1: [("a", datetime.time(9), 2), ("b", datetime.time(10), 1)],
+                    d2: [("a", datetime.time(9), 1)]}
+    requests = [("p1", "vax", [d1]), ("p2", "vax", [d1]), ("p3", "vax", [d1, d2]),
+                ("p4", "vax", [d1, d2]), ("p5", "vax", [d1]), ("p6", "other", [d1]), ("ghost", "vax", [d1])]
+    assignments, rejected = BatchAllocator.allocate(requests, availability, {"vax": 10, "other": 0},
+                                                    known_patients={"p1", "p2", "p3", "p4", "p5", "p6"})
+    assert assignments == [("p1", "vax", d1, "a", datetime.time(9)),
+                           ("p2", "vax", d1, "b", datetime.time(10)),
+                           ("p3", "vax", d1, "a", datetime.time(9)),
+                           ("p4", "vax", d2, "a", datetime.time(9))]
+    assert rejected == [("p5", "vax", BatchAllocator.NO_CAREGIVER),
+                        ("p6", "other", BatchAllocator.NO_DOSES),
+                        ("ghost", "vax", BatchAllocator.NO_PATIENT)]
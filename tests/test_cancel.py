@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+
+PASSWORD = "Passw0rd!x"
+
+
+def mdy(d):
+    return d.strftime("%m-%d-%Y")
+
+
+@pytest.fixture
+def clinic(prefix, day, run, new_session):
+    # a caregiver with two slots of two on the test's date and one the day after, and three doses
+    caregiver = new_session()
+    run(caregiver, "create_caregiver " + prefix + "_c " + PASSWORD)
+    run(caregiver, "login_caregiver " + prefix + "_c " + PASSWORD)
+    run(caregiver, "upload_availability " + mdy(day) + " 09:00x2,10:00x2")
+    run(caregiver, "upload_availability " + mdy(day + datetime.timedelta(days=1)) + " 09:00")
+    run(caregiver, "add_doses " + prefix + "_vax 3")
+    return caregiver
+
+
+@pytest.fixture
+def patient(prefix, run, new_session):
+    session = new_session()
+    run(session, "create_patient " + prefix + "_p " + PASSWORD)
+    run(session, "login_patient " + prefix + "_p " + PASSWORD)
+    return session
+
+
+def test_cancel_gives_back_the_slot_and_the_dose(prefix, day, clinic, patient, run, query):
+    run(patient, "reserve " + mdy(day) + " " + prefix + "_vax 09:00")
+    run(patient, "reserve " + mdy(day) + " " + prefix + "_vax 09:00")
+    appointment_id = query("SELECT MIN(Id) FROM Appointment WHERE Vname = %s", prefix + "_vax")[0][0]
+    # the slot ran out, so it was deleted
+    assert query("SELECT COUNT(*) FROM Availabilities WHERE Username = %s AND Time = %s AND SlotTime = %s",
+                 (prefix + "_c", day, "09:00")) == [(0,)]
+
+    assert run(patient, "cancel " + str(appointment_id)) == "Cancelled appointment ID: " + str(appointment_id) + "\n"
+    assert query("SELECT Doses FROM Vaccines WHERE Name = %s", prefix + "_vax") == [(2,)]
+    assert query("SELECT Capacity FROM Availabilities WHERE Username = %s AND Time = %s AND SlotTime = %s",
+                 (prefix + "_c", day, "09:00")) == [(1,)]
+    assert run(patient, "cancel " + str(appointment_id)) == "Appointment not found!\n"
+
+
+def test_cancel_by_date_range(prefix, day, clinic, patient, run, query):
+    second_day = day + datetime.timedelta(days=1)
+    run(patient, "reserve " + mdy(day) + " " + prefix + "_vax 10:00")
+    run(patient, "reserve " + mdy(second_day) + " " + prefix + "_vax 09:00")
+    assert run(patient, "cancel --date " + mdy(second_day)).endswith("Cancelled 1 appointments\n")
+    assert query("SELECT Time FROM Appointment WHERE Vname = %s", prefix + "_vax") == [(day,)]
+    assert run(patient, "cancel --date " + mdy(day) + " " + mdy(second_day)).endswith("Cancelled 1 appointments\n")
+    assert run(patient, "cancel --date " + mdy(day) + " " + mdy(second_day)) == "No appointment scheduled.\n"
+    assert query("SELECT Doses FROM Vaccines WHERE Name = %s", prefix + "_vax") == [(3,)]
+
+
+@pytest.mark.parametrize("line", ["cancel", "cancel --date", "cancel 1 2", "cancel --date 01-01-2100 01-02-2100 x"])
+def test_cancel_needs_an_id_or_dates(line, patient, run):
+    assert run(patient, line) == "Please try again!\n"
+
+
+def test_only_the_owner_can_cancel(prefix, day, clinic, patient, run, new_session, query):
+    run(patient, "reserve " + mdy(day) + " " + prefix + "_vax")
+    appointment_id = query("SELECT Id FROM Appointment WHERE Vname = %s", prefix + "_vax")[0][0]
+    other = new_session()
+    run(other, "create_patient " + prefix + "_q " + PASSWORD)
+    run(other, "login_patient " + prefix + "_q " + PASSWORD)
+    assert run(other, "cancel " + str(appointment_id)) == "Appointment not found!\n"
+    assert run(clinic, "cancel " + str(appointment_id)) == "Cancelled appointment ID: " + str(appointment_id) + "\n"
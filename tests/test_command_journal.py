@@ -0,0 +1,108 @@
+import json
+import uuid
+
+import pytest
+
+from service.CommandJournal import CommandJournal
+
+PASSWORD = "Passw0rd!x"
+
+
+def intent(command, user, args):
+    return {"type": "intent", "id": uuid.uuid4().hex, "command": command, "user": user, "args": args, "ts": 0}
+
+
+def write_journal(path, records, torn=False):
+    with open(path, "w") as journal:
+        for record in records:
+            journal.write(json.dumps(record) + "\n")
+        if torn:
+            # a run that crashed while writing its last line
+            journal.write('{"type": "intent", "id": "')
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal")
+
+
+@pytest.fixture
+def replay(journal_path):
+    # starts a journal on journal_path, which replays what the file holds, and waits until it is applied
+    def replay():
+        journal = CommandJournal(journal_path, group_delay=0)
+        try:
+            assert journal.wait(10)
+            return journal.stats()
+        finally:
+            journal.close()
+    return replay
+
+
+@pytest.fixture
+def caregiver(prefix, run, new_session):
+    session = new_session()
+    run(session, "create_caregiver " + prefix + "_c " + PASSWORD)
+    return prefix + "_c"
+
+
+def test_unapplied_intents_are_replayed_once(prefix, day, caregiver, journal_path, replay, query):
+    done = intent("add_doses", caregiver, {"vaccine": prefix + "_vax", "doses": 100})
+    write_journal(journal_path, [
+        intent("add_doses", caregiver, {"vaccine": prefix + "_vax", "doses": 2}),
+        done,
+        intent("upload_availability", caregiver, {"dates": [day.strftime("%m-%d-%Y")], "slots": [["09:00", 2]]}),
+        intent("add_doses", caregiver, {"vaccine": prefix + "_vax", "doses": 3}),
+        {"type": "applied", "ids": [done["id"]]},
+    ], torn=True)
+
+    assert replay()["applied"] == 3
+    assert query("SELECT Doses FROM Vaccines WHERE Name = %s", prefix + "_vax") == [(5,)]
+    assert query("SELECT Capacity FROM Availabilities WHERE Username = %s", caregiver) == [(2,)]
+    # everything was applied, so the journal is compacted away
+    with open(journal_path) as journal:
+        assert journal.read() == ""
+
+    assert replay()["applied"] == 0
+    assert query("SELECT Doses FROM Vaccines WHERE Name = %s", prefix + "_vax") == [(5,)]
+
+
+def test_an_intent_applied_before_a_crash_is_not_applied_again(prefix, caregiver, journal_path, replay, query):
+    entry = intent("add_doses", caregiver, {"vaccine": prefix + "_vax", "doses": 4})
+    write_journal(journal_path, [entry])
+    replay()
+    # the process died after committing, before marking the intent applied in the file
+    write_journal(journal_path, [entry])
+
+    assert replay()["applied"] == 1
+    assert query("SELECT Doses FROM Vaccines WHERE Name = %s", prefix + "_vax") == [(4,)]
+    assert query("SELECT COUNT(*) FROM AppliedCommands WHERE Id = %s", entry["id"]) == [(1,)]
+
+
+def test_a_refused_intent_fails_alone(prefix, day, caregiver, journal_path, replay, query, capsys):
+    refused = intent("upload_availability", prefix + "_nobody", {"dates": [day.strftime("%m-%d-%Y")], "slots": None})
+    write_journal(journal_path, [
+        intent("add_doses", caregiver, {"vaccine": prefix + "_vax", "doses": 1}),
+        refused,
+        intent("add_doses", caregiver, {"vaccine": prefix + "_vax", "doses": 1}),
+    ])
+
+    stats = replay()
+    assert (stats["applied"], stats["failed"]) == (2, 1)
+    assert query("SELECT Doses FROM Vaccines WHERE Name = %s", prefix + "_vax") == [(2,)]
+    assert refused["id"] in capsys.readouterr().err
+    assert replay()["failed"] == 0
+
+
+def test_journaled_commands_are_acknowledged_then_applied(prefix, caregiver, journal_path, run, new_session, query,
+                                                          monkeypatch):
+    journal = CommandJournal(journal_path, group_delay=0)
+    monkeypatch.setattr(CommandJournal, "_configured", journal)
+    try:
+        session = new_session()
+        run(session, "login_caregiver " + caregiver + " " + PASSWORD)
+        assert run(session, "add_doses " + prefix + "_vax 6") == "Doses updated!\n"
+        assert journal.wait(10)
+    finally:
+        journal.close()
+    assert query("SELECT Doses FROM Vaccines WHERE Name = %s", prefix + "_vax") == [(6,)]
@@ -0,0 +1,31 @@
+import pytest
+
+PASSWORD = "Passw0rd!x"
+
+
+@pytest.fixture
+def caregiver(prefix, run, new_session):
+    session = new_session()
+    run(session, "create_caregiver " + prefix + "_c " + PASSWORD)
+    run(session, "login_caregiver " + prefix + "_c " + PASSWORD)
+    return session
+
+
+def test_unknown_command(run, new_session):
+    assert run(new_session(), "frobnicate") == "Invalid operation name!\n"
+
+
+@pytest.mark.parametrize("line", ["add_doses Pfizer", "add_doses Pfizer abc", "add_doses Pfizer 1 2"])
+def test_add_doses_rejects_malformed_counts(line, caregiver, run):
+    assert run(caregiver, line) == "Please try again!\n"
+
+
+def test_add_doses_rejects_negative_counts(caregiver, run):
+    assert run(caregiver, "add_doses Pfizer -3") == "Error occurred when adding doses\nError: Argument cannot be negative!\n"
+
+
+def test_commands_require_the_right_login(prefix, run, new_session):
+    session = new_session()
+    assert run(session, "add_doses Pfizer 3") == "Please login as a caregiver first!\n"
+    assert run(session, "reserve 05-01-2030 Pfizer") == "Please login first!\n"
+    assert run(session, "dose_report") == "Please login as a caregiver first!\n"
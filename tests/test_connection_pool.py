@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+
+from db.ConnectionManager import ConnectionManager
+from db.ConnectionPool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.closed = False
+
+    def cursor(self):
+        if not self.healthy:
+            raise OSError("connection reset")
+        return self
+
+    def execute(self, sql):
+        pass
+
+    def fetchall(self):
+        return [(1,)]
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections():
+    # every connection the pool under test opened, oldest first
+    return []
+
+
+@pytest.fixture
+def new_pool(connections):
+    def new_pool(**settings):
+        def connect():
+            connections.append(FakeConnection())
+            return connections[-1]
+        return ConnectionPool(connect, **settings)
+    return new_pool
+
+
+def test_a_checked_in_connection_is_reused(new_pool, connections):
+    pool = new_pool()
+    conn = pool.checkout()
+    pool.checkin(conn)
+    assert pool.checkout() is conn
+    assert len(connections) == 1
+    assert pool.stats()["reused"] == 1
+
+
+def test_a_discarded_connection_is_closed_and_replaced(new_pool, connections):
+    pool = new_pool(max_size=1)
+    broken = pool.checkout()
+    pool.checkin(broken, discard=True)
+    assert broken.closed
+
+    conn = pool.checkout()
+    assert conn is not broken
+    assert connections == [broken, conn]
+    assert pool.stats()["created"] == 2
+
+
+def test_an_idle_connection_is_evicted(new_pool, connections):
+    pool = new_pool(max_idle=0.05)
+    stale = pool.checkout()
+    pool.checkin(stale)
+    time.sleep(0.1)
+
+    conn = pool.checkout()
+    assert stale.closed
+    assert conn is not stale
+    assert pool.stats()["evicted"] == 1
+
+
+def test_an_unhealthy_connection_is_replaced(new_pool, connections):
+    pool = new_pool(health_check_after=0)
+    dead = pool.checkout()
+    pool.checkin(dead)
+    dead.healthy = False
+
+    conn = pool.checkout()
+    assert dead.closed
+    assert conn is not dead
+    assert pool.stats()["failed_health_checks"] == 1
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted(new_pool):
+    pool = new_pool(max_size=2)
+    pool.checkout()
+    pool.checkout()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.checkout(timeout=0.1)
+    assert time.monotonic() - started >= 0.1
+    assert pool.stats()["timeouts"] == 1
+    assert pool.stats()["in_use"] == 2
+
+
+def test_checkout_waits_for_a_checkin(new_pool):
+    pool = new_pool(max_size=1)
+    conn = pool.checkout()
+    threading.Timer(0.05, pool.checkin, (conn,)).start()
+    assert pool.checkout(timeout=5) is conn
+    assert pool.stats()["waits"] >= 1
+
+
+def test_connection_manager_hands_back_its_connection():
+    before = ConnectionManager.pool_stats()
+    cm = ConnectionManager()
+    cm.create_connection()
+    assert ConnectionManager.pool_stats()["in_use"] == before.get("in_use", 0) + 1
+    cm.close_connection()
+    cm.close_connection()
+    assert ConnectionManager.pool_stats()["in_use"] == before.get("in_use", 0)
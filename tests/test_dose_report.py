@@ -0,0 +1,93 @@
+import datetime
+
+import pytest
+
+from service.DoseForecast import DoseForecast
+
+PASSWORD = "Passw0rd!x"
+
+
+def mdy(d):
+    return d.strftime("%m-%d-%Y")
+
+
+@pytest.fixture
+def clinic(prefix, day, run, new_session):
+    # a caregiver with a slot of five on the test's day and the ten after it, and ten doses of the
+    # prefix's vaccine
+    session = new_session()
+    run(session, "create_caregiver " + prefix + "_c " + PASSWORD)
+    run(session, "login_caregiver " + prefix + "_c " + PASSWORD)
+    run(session, "upload_availability " + mdy(day) + " " + mdy(day + datetime.timedelta(days=10)) + " 09:00x5")
+    run(session, "add_doses " + prefix + "_vax 10")
+    return session
+
+
+@pytest.fixture
+def patient(prefix, run, new_session):
+    session = new_session()
+    run(session, "create_patient " + prefix + "_p " + PASSWORD)
+    run(session, "login_patient " + prefix + "_p " + PASSWORD)
+    return session
+
+
+def reserve(prefix, patient, run, d):
+    output = run(patient, "reserve " + mdy(d) + " " + prefix + "_vax")
+    return int(output.split(",")[0].split(": ")[1])
+
+
+def test_stock_out_is_the_first_day_the_stock_cannot_meet_the_rate():
+    today = datetime.date(2100, 1, 1)
+    # 2 + 3 + 3 expected on top of the booked, then the fourth day needs 3 more than the 2 left
+    assert DoseForecast.stock_out(10, {today: 1}, 3, today, 5) == today + datetime.timedelta(days=3)
+    # a fully booked day draws nothing more
+    assert DoseForecast.stock_out(6, {today: 4}, 3, today, 3) is None
+    assert DoseForecast.stock_out(5, {}, 0, today, 90) is None
+
+
+def test_the_rate_comes_from_the_days_before_today(prefix, day, clinic, patient, run):
+    for offset in (0, 0, 1, 7, 8, 8, 8):
+        reserve(prefix, patient, run, day + datetime.timedelta(days=offset))
+
+    today = day + datetime.timedelta(days=5)
+    rows = DoseForecast(window=4, horizon=10).report(today, vaccine_name=prefix + "_vax")
+    # only the window's days before today count towards the rate: day 1 lies in it, day 0 doesn't, and
+    # the bookings from today on are what is booked ahead
+    assert rows == [{"Vname": prefix + "_vax", "Doses": 3, "Booked": 4, "Rate": 0.25, "StockOut": None}]
+
+    # 0.5 a day on the days not booked as much runs the 3 doses out on the eighth day
+    rows = DoseForecast(window=6, horizon=10).report(today, vaccine_name=prefix + "_vax")
+    assert rows[0]["Rate"] == 0.5
+    assert rows[0]["StockOut"] == today + datetime.timedelta(days=8)
+
+
+def test_refresh_and_cancel_keep_the_daily_usage(prefix, day, clinic, patient, run, query):
+    def booked():
+        return query("SELECT Booked FROM DailyDoseUsage WHERE Vname = %s AND Time = %s", (prefix + "_vax", day))
+
+    first = reserve(prefix, patient, run, day)
+    DoseForecast.refresh()
+    assert booked() == [(1,)]
+
+    # a booking cancelled before it is summarized is never counted, one summarized is taken out again
+    second = reserve(prefix, patient, run, day)
+    run(patient, "cancel " + str(second))
+    reserve(prefix, patient, run, day)
+    DoseForecast.refresh()
+    assert booked() == [(2,)]
+    run(patient, "cancel " + str(first))
+    assert booked() == [(1,)]
+    DoseForecast.refresh()
+    assert booked() == [(1,)]
+
+
+def test_dose_report_for_one_vaccine(prefix, clinic, run):
+    run(clinic, "add_doses " + prefix + "_other 5")
+    lines = run(clinic, "dose_report " + prefix + "_vax").splitlines()
+    assert lines[0] == "Vaccine Doses Booked PerDay StockOut"
+    assert lines[1].startswith(prefix + "_vax 10 0 0.00 ")
+    assert lines[2].startswith("Open slots in the next ")
+    assert len(lines) == 3 + 2 * DoseForecast().window
+    assert prefix + "_other" not in "".join(lines)
+
+    assert run(clinic, "dose_report " + prefix + "_none") == "Vaccine not found!\n"
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from util.Metrics import Metrics, Trace
+
+PASSWORD = "Passw0rd!x"
+
+
+@pytest.fixture
+def metrics(monkeypatch, tmp_path):
+    # traces every command into a fresh file; returns a function that switches the format
+    monkeypatch.setattr(Metrics, "path", str(tmp_path / "metrics"))
+    monkeypatch.setattr(Metrics, "enabled", True)
+    monkeypatch.setattr(Metrics, "format", "jsonl")
+    monkeypatch.setattr(Metrics, "_totals", {})
+    monkeypatch.setattr(Metrics, "_file", None)
+    monkeypatch.setattr(Metrics, "_last_export", 0.0)
+    yield lambda format: monkeypatch.setattr(Metrics, "format", format)
+    if Metrics._file is not None:
+        Metrics._file.close()
+
+
+@pytest.fixture
+def caregiver(prefix, run, new_session):
+    session = new_session()
+    run(session, "create_caregiver " + prefix + "_c " + PASSWORD)
+    run(session, "login_caregiver " + prefix + "_c " + PASSWORD)
+    return session
+
+
+def test_each_command_is_a_json_line(metrics, prefix, caregiver, run):
+    run(caregiver, "add_doses " + prefix + "_vax 3")
+    run(caregiver, "search_caregiver_schedule 01-01-2100")
+    Metrics._file.flush()
+    with open(Metrics.path) as lines:
+        records = [json.loads(line) for line in lines]
+
+    assert [record["command"] for record in records] == ["create_caregiver", "login_caregiver", "add_doses",
+                                                         "search_caregiver_schedule"]
+    assert records[1]["phases"]["hash"] > 0
+    for record in records:
+        assert record["session"] == caregiver.session_id
+        assert set(record["phases"]) == set(Metrics.PHASES)
+        assert sum(record["phases"].values()) == pytest.approx(record["seconds"], abs=1e-5)
+        assert record["round_trips"] >= 1
+    assert records[3]["rows"] >= 1
+
+
+def test_totals_are_exported_for_prometheus(metrics, prefix, caregiver, run):
+    metrics("prometheus")
+    for i in range(3):
+        run(caregiver, "add_doses " + prefix + "_vax 1")
+    Metrics.export()
+    with open(Metrics.path) as exported:
+        text = exported.read()
+
+    totals = Metrics.snapshot()["add_doses"]
+    assert totals["count"] == 3
+    assert totals["buckets"] == sorted(totals["buckets"])
+    assert 'scheduler_command_seconds_count{command="add_doses"} 3' in text
+    assert 'scheduler_command_seconds_bucket{command="add_doses",le="+Inf"} 3' in text
+    assert 'scheduler_command_round_trips_total{command="add_doses"} ' + str(totals["round_trips"]) in text
+    assert text.count('scheduler_command_phase_seconds_total{command="add_doses"') == len(Metrics.PHASES)
+
+
+def test_a_nested_command_joins_the_outer_trace(metrics):
+    with Metrics.command("outer") as outer:
+        with Metrics.command("inner") as inner:
+            Metrics.add_round_trips(2)
+        Metrics.add_rows(5)
+    assert inner is None
+    assert (outer.round_trips, outer.rows) == (2, 5)
+    assert list(Metrics.snapshot()) == ["outer"]
+
+
+def test_other_is_what_the_phases_leave_of_the_command():
+    trace = Trace("test")
+    trace.add("query", 0.0)
+    trace.finish()
+    assert trace.phases["other"] == trace.seconds
+
+    trace = Trace("test")
+    trace.add("hash", 60.0)
+    trace.finish()
+    assert trace.phases["other"] == 0.0
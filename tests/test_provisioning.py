@@ -0,0 +1,67 @@
+import io
+
+import pytest
+
+from service.UserProvisioner import UserProvisioner
+
+PASSWORD = "Passw0rd!x"
+
+
+@pytest.fixture
+def caregiver(prefix, run, new_session):
+    session = new_session()
+    run(session, "create_caregiver " + prefix + "_c " + PASSWORD)
+    run(session, "login_caregiver " + prefix + "_c " + PASSWORD)
+    return session
+
+
+def test_malformed_lines_are_rejected_when_read():
+    users, errors = UserProvisioner.read_users(io.StringIO("alice,Passw0rd!x\n"
+                                                           "# a comment\n"
+                                                           "bob\n"
+                                                           "carol dan,Passw0rd!x\n"
+                                                           ",Passw0rd!x\n"
+                                                           "erin,Pass,word\n"))
+    assert users == [(1, "alice", "Passw0rd!x")]
+    assert [line_no for line_no, _ in errors] == [3, 4, 5, 6]
+
+
+def test_provisioning_rejects_weak_repeated_and_taken_users(prefix, caregiver, run, new_session, tmp_path):
+    run(new_session(), "create_patient " + prefix + "_taken " + PASSWORD)
+    users = tmp_path / "users.csv"
+    users.write_text(prefix + "_a," + PASSWORD + "\n"
+                     + prefix + "_weak,password\n"
+                     + prefix + "_a,Other0ne!x\n"
+                     + prefix + "_taken," + PASSWORD + "\n"
+                     + "malformed\n"
+                     + prefix + "_b," + PASSWORD + "\n")
+
+    lines = run(caregiver, "provision_users patient " + str(users)).splitlines()
+    assert lines[0] == "line 5: expected username,password"
+    assert lines[1].startswith("line 2: " + prefix + "_weak: ")
+    assert lines[2:4] == ["line 3: " + prefix + "_a: " + UserProvisioner.DUPLICATE,
+                          "line 4: " + prefix + "_taken: " + UserProvisioner.TAKEN]
+    assert lines[4].startswith("Created 2 of 5 users in ")
+    assert lines[4].endswith("(3 rejected, 1 malformed lines)")
+
+    for username in (prefix + "_a", prefix + "_b"):
+        session = new_session()
+        assert run(session, "login_patient " + username + " " + PASSWORD).startswith("Logged in as: " + username)
+    assert run(new_session(), "login_patient " + prefix + "_a Other0ne!x") == "Login failed.\n"
+
+
+def test_provisioning_in_batches_creates_every_user(prefix, caregiver, run, query, monkeypatch, tmp_path):
+    monkeypatch.setenv("ProvisionBatchSize", "3")
+    users = tmp_path / "users.csv"
+    users.write_text("".join(prefix + "_u" + str(i) + "," + PASSWORD + "\n" for i in range(8)))
+    assert run(caregiver, "provision_users caregiver " + str(users)).startswith("Created 8 of 8 users in ")
+    assert query("SELECT COUNT(*) FROM Caregivers WHERE Username LIKE %s", prefix + "_u%") == [(8,)]
+
+
+@pytest.mark.parametrize("line", ["provision_users patient", "provision_users admin users.csv"])
+def test_provision_users_usage(line, caregiver, run):
+    assert run(caregiver, line) == "Please try again!\n"
+
+
+def test_provision_users_needs_a_caregiver(run, new_session):
+    assert run(new_session(), "provision_users patient users.csv") == "Please login as a caregiver first!\n"
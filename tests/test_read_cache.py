@@ -0,0 +1,87 @@
+import datetime
+import threading
+import time
+
+from db.ReadCache import ReadCache
+from model.Caregiver import Caregiver
+from model.Vaccine import Vaccine
+
+PASSWORD = "Passw0rd!x"
+
+
+class Loader:
+    # load functions that count their calls
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, value):
+        def load():
+            self.calls += 1
+            return value
+        return load
+
+
+def test_a_cached_value_is_served_until_it_expires():
+    cache, loader = ReadCache(ttl=0.05), Loader()
+    assert cache.get("k", loader(1)) == 1
+    assert cache.get("k", loader(2)) == 1
+    assert (cache.hits, cache.misses, loader.calls) == (1, 1, 1)
+    time.sleep(0.1)
+    assert cache.get("k", loader(3)) == 3
+    assert loader.calls == 2
+
+
+def test_the_least_recently_used_entry_is_evicted():
+    cache, loader = ReadCache(max_size=2), Loader()
+    cache.get("a", loader("a"))
+    cache.get("b", loader("b"))
+    cache.get("a", loader("a"))
+    cache.get("c", loader("c"))
+    assert cache.stats()["size"] == 2
+    assert cache.evictions == 1
+    assert cache.get("a", loader("a2")) == "a"
+    assert cache.get("b", loader("b2")) == "b2"
+
+
+def test_invalidate_and_clear_drop_entries():
+    cache, loader = ReadCache(), Loader()
+    cache.get("a", loader(1))
+    cache.get("b", loader(2))
+    cache.invalidate("a")
+    assert cache.get("a", loader(3)) == 3
+    assert cache.get("b", loader(4)) == 2
+    cache.clear()
+    assert cache.get("b", loader(5)) == 5
+    assert cache.invalidations == 2
+
+
+def test_a_load_overtaken_by_an_invalidation_is_not_cached():
+    cache = ReadCache()
+    loading, invalidated = threading.Event(), threading.Event()
+
+    def slow_load():
+        loading.set()
+        invalidated.wait(5)
+        return "stale"
+
+    reader = threading.Thread(target=cache.get, args=("k", slow_load))
+    reader.start()
+    loading.wait(5)
+    cache.invalidate("k")
+    invalidated.set()
+    reader.join()
+    assert cache.get("k", lambda: "fresh") == "fresh"
+
+
+def test_writes_invalidate_the_model_caches(prefix, day, run, new_session):
+    caregiver = new_session()
+    run(caregiver, "create_caregiver " + prefix + "_c " + PASSWORD)
+    run(caregiver, "login_caregiver " + prefix + "_c " + PASSWORD)
+    assert Caregiver.get_available(day) == ()
+    run(caregiver, "upload_availability " + day.strftime("%m-%d-%Y") + " 09:00x2")
+    assert Caregiver.get_available(day) == ((prefix + "_c", ((datetime.time(9, 0), 2),)),)
+
+    run(caregiver, "add_doses " + prefix + "_vax 2")
+    assert {"Name": prefix + "_vax", "Doses": 2} in Vaccine.get_all()
+    run(caregiver, "add_doses " + prefix + "_vax 3")
+    assert {"Name": prefix + "_vax", "Doses": 5} in Vaccine.get_all()
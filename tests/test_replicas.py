@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from db.ConnectionManager import ConnectionManager
+from db.ReplicaRouter import ReplicaRouter
+from db.RetryPolicy import RetryPolicy
+
+PASSWORD = "Passw0rd!x"
+
+
+@pytest.fixture
+def replica(tmp_path):
+    # a replica file, and a function that brings it up to date with the primary
+    path = str(tmp_path / "replica.db")
+
+    def catch_up():
+        primary = sqlite3.connect(os.environ["DBPath"])
+        copy = sqlite3.connect(path)
+        try:
+            primary.backup(copy)
+        finally:
+            copy.close()
+            primary.close()
+    return path, catch_up
+
+
+@pytest.fixture
+def router(replica, monkeypatch):
+    # a router whose heartbeats the test sends itself
+    monkeypatch.setattr(ReplicaRouter, "_run", lambda self: None)
+    router = ReplicaRouter([replica[0]], max_staleness=5)
+    monkeypatch.setattr(ReplicaRouter, "_configured", router)
+    return router
+
+
+def sync(router, replica):
+    # one heartbeat, replicated
+    router.beat()
+    replica[1]()
+    router.poll(replica[0])
+
+
+def test_reads_go_to_the_primary_until_the_first_poll(router, replica):
+    assert router.choose() is None
+    sync(router, replica)
+    assert router.choose() == replica[0]
+
+
+def test_a_lagging_replica_is_passed_over(router, replica, monkeypatch):
+    sync(router, replica)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 6)
+    assert router.choose() is None
+    # the next heartbeat it receives brings it back
+    sync(router, replica)
+    assert router.choose() == replica[0]
+    assert (router.replica_reads, router.primary_reads) == (1, 1)
+
+
+def test_a_session_reads_its_writes(router, replica):
+    sync(router, replica)
+    wrote = time.time()
+    assert router.choose(read_after=wrote) is None
+    sync(router, replica)
+    assert router.choose(read_after=wrote) == replica[0]
+
+
+def test_an_unreachable_replica_is_left_out_until_it_answers(router, replica, monkeypatch):
+    monkeypatch.setattr(RetryPolicy, "_configured", RetryPolicy(attempts=1, base_delay=0.001, max_delay=0.01))
+    monkeypatch.setattr(ConnectionManager, "_breakers", dict(ConnectionManager._breakers))
+    # the replica file isn't there yet
+    router.beat()
+    router.poll(replica[0])
+    assert router.choose() is None
+    assert router.stats()["lag"] == {replica[0]: None}
+    replica[1]()
+    router.poll(replica[0])
+    assert router.choose() == replica[0]
+
+
+def test_show_appointments_reads_the_replica_unless_the_session_just_wrote(prefix, day, router, replica, run,
+                                                                           new_session):
+    date = day.strftime("%m-%d-%Y")
+    caregiver = new_session()
+    run(caregiver, "create_caregiver " + prefix + "_c " + PASSWORD)
+    run(caregiver, "login_caregiver " + prefix + "_c " + PASSWORD)
+    run(caregiver, "upload_availability " + date)
+    run(caregiver, "add_doses " + prefix + "_vax 1")
+    sync(router, replica)
+
+    patient = new_session()
+    run(patient, "create_patient " + prefix + "_p " + PASSWORD)
+    run(patient, "login_patient " + prefix + "_p " + PASSWORD)
+    assert run(patient, "reserve " + date + " " + prefix + "_vax").startswith("Appointment ID:")
+    # the replica hasn't seen the reservation: the patient reads it from the primary, while the
+    # caregiver, who wrote nothing since, reads the replica without it
+    assert prefix + "_vax" in run(patient, "show_appointments")
+    assert prefix + "_vax" not in run(caregiver, "show_appointments")
+    assert (router.replica_reads, router.primary_reads) == (1, 1)
+
+    sync(router, replica)
+    assert prefix + "_vax" in run(patient, "show_appointments")
+    assert router.replica_reads == 2
@@ -0,0 +1,95 @@
+import datetime
+import threading
+from collections import Counter
+
+import pytest
+
+from bench import ReserveStress
+from model.Appointment import Appointment
+
+PASSWORD = "Passw0rd!x"
+
+
+@pytest.fixture
+def date(day):
+    return day.strftime("%m-%d-%Y")
+
+
+@pytest.fixture
+def clinic(prefix, date, run, new_session):
+    # a caregiver with two slots of two on the test's date, and three doses of the prefix's vaccine
+    caregiver = new_session()
+    run(caregiver, "create_caregiver " + prefix + "_c " + PASSWORD)
+    run(caregiver, "login_caregiver " + prefix + "_c " + PASSWORD)
+    assert "Availability uploaded!" in run(caregiver, "upload_availability " + date + " 09:00x2,10:00x2")
+    assert "Doses updated!" in run(caregiver, "add_doses " + prefix + "_vax 3")
+    return caregiver
+
+
+def patient(prefix, n, run, new_session):
+    session = new_session()
+    run(session, "create_patient " + prefix + "_p" + str(n) + " " + PASSWORD)
+    run(session, "login_patient " + prefix + "_p" + str(n) + " " + PASSWORD)
+    return session
+
+
+def test_reserve_takes_a_slot_and_a_dose(prefix, date, clinic, run, new_session, query):
+    output = run(patient(prefix, 1, run, new_session), "reserve " + date + " " + prefix + "_vax 10:00")
+    assert output.startswith("Appointment ID:")
+    assert query("SELECT Doses FROM Vaccines WHERE Name = %s", prefix + "_vax") == [(2,)]
+    assert query("SELECT SlotTime, Capacity FROM Availabilities WHERE Username = %s ORDER BY SlotTime",
+                 prefix + "_c") == [(datetime.time(9, 0), 2), (datetime.time(10, 0), 1)]
+
+
+def test_reserve_reports_what_ran_out(prefix, date, clinic, run, new_session):
+    session = patient(prefix, 1, run, new_session)
+    assert run(session, "reserve " + date + " " + prefix + "_vax 11:00") == "No Caregiver is available!\n"
+    for _ in range(3):
+        assert run(session, "reserve " + date + " " + prefix + "_vax").startswith("Appointment ID:")
+    assert run(session, "reserve " + date + " " + prefix + "_vax") == "Not enough available doses!\n"
+
+
+# 30 patients reserve at once for the same day: either the caregivers or the doses run out first
+@pytest.mark.parametrize("caregivers, doses", [(12, 50), (25, 9)])
+def test_concurrent_reserves_never_oversell_or_double_book(caregivers, doses, prefix, day, run, new_session, query):
+    session = new_session()
+    for i in range(caregivers):
+        run(session, "create_caregiver " + prefix + "_c" + str(i) + " " + PASSWORD)
+        run(session, "login_caregiver " + prefix + "_c" + str(i) + " " + PASSWORD)
+        run(session, "upload_availability " + day.strftime("%m-%d-%Y"))
+        run(session, "logout")
+    run(session, "login_caregiver " + prefix + "_c0 " + PASSWORD)
+    run(session, "add_doses " + prefix + "_vax " + str(doses))
+    patients = [prefix + "_p" + str(i) for i in range(30)]
+    for username in patients:
+        run(new_session(), "create_patient " + username + " " + PASSWORD)
+
+    results = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(patients))
+
+    def reserve(username):
+        barrier.wait()
+        outcome = Appointment(day, prefix + "_vax", username).reserve()
+        with lock:
+            results[outcome] += 1
+
+    threads = [threading.Thread(target=reserve, args=(username,)) for username in patients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    expected = min(caregivers, doses)
+    booked = [row[0] for row in query("SELECT Cusername FROM Appointment WHERE Vname = %s", prefix + "_vax")]
+    assert len(booked) == expected == results[Appointment.RESERVED]
+    assert len(set(booked)) == expected
+    assert results[Appointment.NO_DOSES if doses < caregivers else Appointment.NO_CAREGIVER] == len(patients) - expected
+    assert query("SELECT Doses FROM Vaccines WHERE Name = %s", prefix + "_vax") == [(doses - expected,)]
+    assert query("SELECT COUNT(*) FROM Availabilities WHERE Username LIKE %s",
+                 prefix + "_c%") == [(caregivers - expected,)]
+
+
+@pytest.mark.parametrize("reservers, slots, doses", [(150, 150, 1000), (120, 80, 60)])
+def test_reserve_stress_run_holds_its_invariants(reservers, slots, doses, capsys):
+    assert ReserveStress.run(reservers, slots, doses), capsys.readouterr().out
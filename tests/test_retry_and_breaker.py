@@ -0,0 +1,121 @@
+import sqlite3
+import time
+
+import pytest
+
+from db.Backend import DatabaseError, DatabaseUnavailable
+from db.CircuitBreaker import CircuitBreaker
+from db.ConnectionManager import ConnectionManager
+from db.RetryPolicy import RetryPolicy
+from db.UnitOfWork import UnitOfWork
+
+BUSY = DatabaseError(sqlite3.SQLITE_BUSY, "database is locked")
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(RetryPolicy, "_configured", RetryPolicy(attempts=3, base_delay=0.001, max_delay=0.01))
+
+
+def test_backoff_grows_up_to_its_cap_and_stops_after_the_last_attempt():
+    policy = RetryPolicy(attempts=4, base_delay=0.1, max_delay=0.3)
+    for attempt, bound in [(1, 0.2), (2, 0.3), (3, 0.3)]:
+        delays = [policy.backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= bound for delay in delays)
+        assert max(delays) > bound / 2
+    assert policy.backoff(4) is None
+
+
+def test_backoff_never_sleeps_past_the_deadline():
+    policy = RetryPolicy(attempts=10, base_delay=1, max_delay=1)
+    assert policy.backoff(1, time.monotonic() + 60) is not None
+    assert policy.backoff(1, time.monotonic()) is None
+
+
+def test_the_breaker_opens_after_its_threshold_and_half_opens_after_the_cooldown():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    breaker.check()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(DatabaseUnavailable):
+        breaker.check()
+
+    time.sleep(0.06)
+    breaker.check()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # one trial at a time
+    with pytest.raises(DatabaseUnavailable):
+        breaker.check()
+    breaker.success()
+    assert breaker.stats() == {"state": CircuitBreaker.CLOSED, "failures": 0, "opened": 1, "rejected": 2}
+
+
+def test_a_failed_trial_opens_the_breaker_again():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    breaker.check()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened == 2
+    with pytest.raises(DatabaseUnavailable):
+        breaker.check()
+
+
+def test_a_released_trial_lets_the_next_one_through():
+    breaker = CircuitBreaker(threshold=1, cooldown=0)
+    breaker.failure()
+    breaker.check()
+    breaker.release()
+    breaker.check()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_a_unit_of_work_is_retried_on_transient_errors(fast_retries):
+    calls = []
+
+    def flaky(work):
+        calls.append(work)
+        if len(calls) < 3:
+            raise BUSY
+        return "done"
+
+    retries = []
+    assert UnitOfWork.retry(flaky, on_retry=lambda: retries.append(1)) == "done"
+    assert (len(calls), len(retries)) == (3, 2)
+
+
+def test_a_unit_of_work_gives_up(fast_retries):
+    def busy(work):
+        raise BUSY
+
+    def broken(work):
+        raise DatabaseError(sqlite3.SQLITE_CONSTRAINT, "constraint failed")
+
+    with pytest.raises(DatabaseError):
+        UnitOfWork.retry(busy)
+    calls = []
+    with pytest.raises(DatabaseError, match="constraint"):
+        UnitOfWork.retry(lambda work: calls.append(1) or broken(work))
+    assert calls == [1]
+
+
+def test_connecting_fails_fast_once_the_breaker_opens(monkeypatch, tmp_path, fast_retries):
+    monkeypatch.setenv("BreakerThreshold", "2")
+    monkeypatch.setattr(ConnectionManager, "_breakers", dict(ConnectionManager._breakers))
+    monkeypatch.setattr(ConnectionManager, "_pools", dict(ConnectionManager._pools))
+    # a replica file that doesn't exist can't be opened
+    target = str(tmp_path / "missing.db")
+
+    for _ in range(2):
+        with pytest.raises(DatabaseUnavailable, match="Could not connect"):
+            ConnectionManager().create_connection(target=target)
+    with pytest.raises(DatabaseUnavailable, match="retrying in"):
+        ConnectionManager().create_connection(target=target)
+    assert ConnectionManager.breaker_stats(target)["state"] == CircuitBreaker.OPEN
+    # the primary has a breaker of its own
+    cm = ConnectionManager()
+    cm.create_connection()
+    cm.close_connection()
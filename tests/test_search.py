@@ -0,0 +1,61 @@
+import datetime
+
+import pytest
+
+from model.Caregiver import Caregiver
+
+PASSWORD = "Passw0rd!x"
+
+
+def mdy(d):
+    return d.strftime("%m-%d-%Y")
+
+
+@pytest.fixture
+def schedule(prefix, day, run, new_session):
+    # c0 works the test's first two days, c1 the second and c2 the fourth; 5 doses of the prefix's vaccine
+    session = new_session()
+    uploads = {"_c0": mdy(day) + "," + mdy(day + datetime.timedelta(days=1)) + " 09:00x2,10:00",
+               "_c1": mdy(day + datetime.timedelta(days=1)) + " 08:30",
+               "_c2": mdy(day + datetime.timedelta(days=3)) + " 13:00"}
+    for name, upload in uploads.items():
+        run(session, "create_caregiver " + prefix + name + " " + PASSWORD)
+        run(session, "login_caregiver " + prefix + name + " " + PASSWORD)
+        run(session, "upload_availability " + upload)
+        run(session, "logout")
+    run(session, "login_caregiver " + prefix + "_c0 " + PASSWORD)
+    run(session, "add_doses " + prefix + "_vax 5")
+    return session
+
+
+def test_a_range_search_sums_every_date(prefix, day, schedule, run):
+    output = run(schedule, "search_caregiver_schedule " + mdy(day) + " "
+                 + mdy(day + datetime.timedelta(days=4)) + " " + prefix + "_vax")
+    assert output.splitlines() == [
+        "Vaccines: " + prefix + "_vax (5)",
+        "{:<12}{:<11}{:<12}{}".format("Date", "Available", "First slot", "Caregivers"),
+        "{:<12}{:<11}{:<12}{}".format(mdy(day), 3, "09:00", prefix + "_c0"),
+        "{:<12}{:<11}{:<12}{}".format(mdy(day + datetime.timedelta(days=1)), 4, "08:30",
+                                      prefix + "_c0 " + prefix + "_c1"),
+        "{:<12}{:<11}{:<12}{}".format(mdy(day + datetime.timedelta(days=3)), 1, "13:00", prefix + "_c2"),
+    ]
+
+
+def test_a_range_search_pages_its_dates(prefix, day, schedule):
+    end = day + datetime.timedelta(days=4)
+    _, dates, has_more = Caregiver.search_availability(day, end, prefix + "_vax", page=1, page_size=2)
+    assert [row["Time"] for row in dates] == [day, day + datetime.timedelta(days=1)]
+    assert has_more
+    _, dates, has_more = Caregiver.search_availability(day, end, prefix + "_vax", page=2, page_size=2)
+    assert [row["Time"] for row in dates] == [day + datetime.timedelta(days=3)]
+    assert not has_more
+
+
+def test_a_range_search_needs_the_vaccine_in_stock(prefix, day, schedule, run):
+    assert run(schedule, "search_caregiver_schedule " + mdy(day) + " " + mdy(day) + " " + prefix + "_none") == \
+        "Not enough available doses!\n"
+
+
+def test_a_range_search_rejects_a_backwards_range(day, schedule, run):
+    assert run(schedule, "search_caregiver_schedule " + mdy(day + datetime.timedelta(days=1)) + " " + mdy(day)) == \
+        "Invalid statement; try again\nError: End date is before start date\n"
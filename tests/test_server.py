@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+import Scheduler
+from server.SchedulerClient import SchedulerClient
+from server.SchedulerServer import SchedulerServer
+from service import Commands
+from service.Session import Session
+
+PASSWORD = "Passw0rd!x"
+
+
+@pytest.fixture
+def failing_command(monkeypatch):
+    # a command that prints, then raises, as a handler with a bug would
+    def fail(session, tokens):
+        session.print("half of the output")
+        raise RuntimeError("handler bug")
+    monkeypatch.setitem(Commands.COMMANDS, "fail", fail)
+
+
+async def serving(scenario):
+    # runs scenario(port) against a server listening on a free local port
+    server = SchedulerServer()
+    listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+    try:
+        return await scenario(listener.sockets[0].getsockname()[1])
+    finally:
+        # let the server's handler see the connection close before the listener goes
+        await asyncio.sleep(0.05)
+        listener.close()
+        await listener.wait_closed()
+
+
+def test_server_answers_a_failing_command_with_an_error(prefix, failing_command):
+    async def scenario():
+        server = SchedulerServer()
+        opened = await server.dispatch({"session": None, "command": "create_caregiver " + prefix + "_c " + PASSWORD})
+        token = opened["session"]
+        failed = await server.dispatch({"session": token, "command": "fail"})
+        after = await server.dispatch({"session": token, "command": "frobnicate"})
+        return opened, failed, after
+
+    opened, failed, after = asyncio.run(scenario())
+    assert opened["output"] == "Created user  " + prefix + "_c\n"
+    assert failed == {"session": opened["session"], "error": "command failed: handler bug"}
+    # the session survives, without the failed command's output
+    assert after["output"] == "Invalid operation name!\n"
+
+
+def test_server_rejects_bad_requests():
+    server = SchedulerServer()
+    assert asyncio.run(server.dispatch({"session": None})) == {"error": "missing command"}
+    assert asyncio.run(server.dispatch({"session": "nope", "command": "logout"})) == {"error": "unknown or expired session"}
+
+
+def test_server_connection_survives_a_failing_command(failing_command):
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        responses = []
+        for line in (b"not json\n", b'{"session": null, "command": "fail"}\n', b'{"session": null, "command": "logout"}\n'):
+            writer.write(line)
+            await writer.drain()
+            responses.append(await reader.readline())
+        writer.close()
+        await writer.wait_closed()
+        return responses
+
+    bad, failed, logout = asyncio.run(serving(scenario))
+    assert b'"error": "bad request' in bad
+    assert b'"error": "command failed: handler bug"' in failed
+    assert b'"output": "Please login first.\\n"' in logout
+
+
+def test_client_keeps_the_session_a_failing_command_opened(prefix, failing_command):
+    async def scenario(port):
+        client = SchedulerClient("127.0.0.1", port)
+        await client.connect()
+        try:
+            with pytest.raises(RuntimeError, match="handler bug"):
+                await client.request("fail")
+            opened = client.token
+            await client.request("create_caregiver " + prefix + "_c " + PASSWORD)
+            output = await client.request("login_caregiver " + prefix + "_c " + PASSWORD)
+            return opened, client.token, output
+        finally:
+            await client.close()
+
+    opened, token, output = asyncio.run(serving(scenario))
+    assert opened is not None
+    assert token == opened
+    assert output.startswith("Logged in as: " + prefix + "_c\n")
+
+
+def test_repl_keeps_reading_after_a_failing_command(failing_command, monkeypatch, capsys):
+    lines = iter(["fail", "frobnicate", "quit"])
+    monkeypatch.setattr("builtins.input", lambda: next(lines))
+    session = Session()
+    asyncio.run(Scheduler.repl(Scheduler.AsyncScheduler(), session))
+    out = capsys.readouterr().out
+    assert "Error: handler bug" in out
+    assert "Invalid operation name!" in out
+    assert session.closed
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from db.ConnectionManager import ConnectionManager
+from service.SessionTokens import SessionTokens
+
+PASSWORD = "Passw0rd!x"
+
+
+@pytest.fixture
+def tokens():
+    return SessionTokens(ttl=60, max_size=3)
+
+
+def token_of(output):
+    return output.split("Session token: ")[1].strip()
+
+
+@pytest.fixture
+def patient(prefix, run, new_session):
+    # a logged-out patient session and the token its login was given
+    session = new_session()
+    run(session, "create_patient " + prefix + "_p " + PASSWORD)
+    token = token_of(run(session, "login_patient " + prefix + "_p " + PASSWORD))
+    run(session, "logout")
+    return session, token
+
+
+def test_a_token_names_its_user_until_it_expires(tokens, monkeypatch):
+    token = tokens.issue("patient", "alice:smith")
+    assert tokens.validate(token) == ("patient", "alice:smith")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert tokens.validate(token) is None
+    assert tokens.stats()["rejected"] == 1
+    # an expired token is forgotten, so it stays refused
+    monkeypatch.setattr(time, "time", lambda: now)
+    assert tokens.validate(token) is None
+
+
+def test_a_token_must_carry_its_signature(tokens):
+    token = tokens.issue("caregiver", "bob")
+    payload, _, signature = token.partition(".")
+    assert tokens.validate(payload + "." + signature[:-2] + "AA") is None
+    assert tokens.validate(tokens.issue("patient", "bob").partition(".")[0] + "." + signature) is None
+    assert SessionTokens(ttl=60).validate(token) is None
+    assert tokens.validate("not a token") is None
+
+
+def test_only_the_owner_revokes_a_token(tokens):
+    token = tokens.issue("patient", "alice")
+    assert not tokens.revoke(token, ("patient", "bob"))
+    assert not tokens.revoke(token, ("caregiver", "alice"))
+    assert tokens.validate(token) == ("patient", "alice")
+    assert tokens.revoke(token, ("patient", "alice"))
+    assert not tokens.revoke(token, ("patient", "alice"))
+    assert tokens.validate(token) is None
+
+
+def test_the_least_recently_used_token_is_evicted(tokens):
+    issued = [tokens.issue("patient", "u" + str(i)) for i in range(3)]
+    tokens.validate(issued[0])
+    tokens.issue("patient", "u3")
+    assert tokens.validate(issued[1]) is None
+    assert tokens.validate(issued[0]) == ("patient", "u0")
+    assert tokens.stats()["evictions"] == 1
+
+
+def test_login_token_logs_in_without_the_password(prefix, patient, run):
+    session, token = patient
+    assert run(session, "login_token " + token) == "Logged in as: " + prefix + "_p\n"
+    assert session.current_patient.username == prefix + "_p"
+
+
+def test_login_token_needs_the_account(prefix, patient, run):
+    session, token = patient
+    cm = ConnectionManager()
+    try:
+        conn = cm.create_connection()
+        conn.cursor().execute("DELETE FROM Patients WHERE Username = %s", prefix + "_p")
+        conn.commit()
+    finally:
+        cm.close_connection()
+    assert run(session, "login_token " + token) == "Login failed.\n"
+    assert session.current_patient is None
+    assert SessionTokens.configured().validate(token) is None
+
+
+def test_revoke_token_needs_the_tokens_owner(prefix, patient, run, new_session):
+    session, token = patient
+    assert run(session, "revoke_token " + token) == "Please login first!\n"
+
+    other = new_session()
+    run(other, "create_patient " + prefix + "_q " + PASSWORD)
+    run(other, "login_patient " + prefix + "_q " + PASSWORD)
+    assert run(other, "revoke_token " + token) == "Unknown session token.\n"
+    assert run(session, "login_token " + token) == "Logged in as: " + prefix + "_p\n"
+
+    assert run(session, "revoke_token " + token) == "Session token revoked.\n"
+    run(session, "logout")
+    assert run(session, "login_token " + token).startswith("Login failed.\n")
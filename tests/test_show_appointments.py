@@ -0,0 +1,76 @@
+import datetime
+import json
+
+import pytest
+
+from model.Appointment import Appointment
+
+PASSWORD = "Passw0rd!x"
+
+
+def mdy(d):
+    return d.strftime("%m-%d-%Y")
+
+
+@pytest.fixture
+def booked(prefix, day, run, new_session):
+    # a patient with five appointments with one caregiver over two days, three of vaccine a and two of b;
+    # returns the patient's session
+    caregiver = new_session()
+    run(caregiver, "create_caregiver " + prefix + "_c " + PASSWORD)
+    run(caregiver, "login_caregiver " + prefix + "_c " + PASSWORD)
+    run(caregiver, "upload_availability " + mdy(day) + "," + mdy(day + datetime.timedelta(days=1)) + " 09:00-11:30/30")
+    run(caregiver, "add_doses " + prefix + "_a 5")
+    run(caregiver, "add_doses " + prefix + "_b 5")
+    patient = new_session()
+    run(patient, "create_patient " + prefix + "_p " + PASSWORD)
+    run(patient, "login_patient " + prefix + "_p " + PASSWORD)
+    for d, vaccine, slot in [(day, "_a", "09:00"), (day, "_b", "09:30"), (day, "_a", "10:00"),
+                             (day + datetime.timedelta(days=1), "_a", "09:00"),
+                             (day + datetime.timedelta(days=1), "_b", "09:30")]:
+        assert run(patient, "reserve " + mdy(d) + " " + prefix + vaccine + " " + slot).startswith("Appointment ID:")
+    return patient
+
+
+def test_pages_are_read_in_id_order(prefix, booked):
+    rows = list(Appointment.iter_for_user("patient", prefix + "_p", page_size=2))
+    assert [(row["Vname"], row["SlotTime"]) for row in rows] == [
+        (prefix + "_a", datetime.time(9, 0)), (prefix + "_b", datetime.time(9, 30)),
+        (prefix + "_a", datetime.time(10, 0)), (prefix + "_a", datetime.time(9, 0)),
+        (prefix + "_b", datetime.time(9, 30))]
+    assert [row["Id"] for row in rows] == sorted(row["Id"] for row in rows)
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 5, 500])
+def test_filters_apply_on_every_page(prefix, day, booked, page_size):
+    second_day = day + datetime.timedelta(days=1)
+    assert len(list(Appointment.iter_for_user("patient", prefix + "_p", vaccine=prefix + "_a",
+                                              page_size=page_size))) == 3
+    assert len(list(Appointment.iter_for_user("patient", prefix + "_p", start=second_day,
+                                              page_size=page_size))) == 2
+    assert len(list(Appointment.iter_for_user("caregiver", prefix + "_c", end=day, vaccine=prefix + "_b",
+                                              page_size=page_size))) == 1
+
+
+def test_show_appointments_as_csv(prefix, day, booked, run):
+    lines = run(booked, "show_appointments --vaccine " + prefix + "_b --csv").splitlines()
+    assert lines[0] == "Id,Vname,Time,SlotTime,Cusername"
+    assert [line.split(",", 1)[1] for line in lines[1:]] == [
+        prefix + "_b," + str(day) + ",09:30," + prefix + "_c",
+        prefix + "_b," + str(day + datetime.timedelta(days=1)) + ",09:30," + prefix + "_c"]
+
+
+def test_show_appointments_as_json(prefix, day, booked, run):
+    second_day = day + datetime.timedelta(days=1)
+    rows = [json.loads(line) for line in
+            run(booked, "show_appointments --from " + mdy(second_day) + " --json").splitlines()]
+    assert [{key: value for key, value in row.items() if key != "Id"} for row in rows] == [
+        {"Vname": prefix + "_a", "Time": str(second_day), "SlotTime": "09:00", "Cusername": prefix + "_c"},
+        {"Vname": prefix + "_b", "Time": str(second_day), "SlotTime": "09:30", "Cusername": prefix + "_c"}]
+
+
+def test_show_appointments_with_nothing_to_show(prefix, booked, run):
+    assert run(booked, "show_appointments --vaccine " + prefix + "_none") == "No appointment scheduled.\n"
+    assert run(booked, "show_appointments --vaccine " + prefix + "_none --json") == ""
+    assert run(booked, "show_appointments --from") == "Please try again!\n"
+    assert run(booked, "show_appointments --sideways") == "Please try again!\n"
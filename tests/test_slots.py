@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from db.Backend import DatabaseError
+from db.ConnectionManager import ConnectionManager
+from util.Util import Util
+
+PASSWORD = "Passw0rd!x"
+
+
+def mdy(d):
+    return d.strftime("%m-%d-%Y")
+
+
+@pytest.fixture
+def caregiver(prefix, run, new_session):
+    session = new_session()
+    run(session, "create_caregiver " + prefix + "_c " + PASSWORD)
+    run(session, "login_caregiver " + prefix + "_c " + PASSWORD)
+    run(session, "add_doses " + prefix + "_vax 5")
+    return session
+
+
+def test_slot_windows_expand_with_their_capacity():
+    assert [(Util.format_time(t), c) for t, c in Util.expand_slots("09:00-10:30/30x2,14:00")] == \
+        [("09:00", 2), ("09:30", 2), ("10:00", 2), ("14:00", 1)]
+    for spec in ("10:00-09:00/30", "09:00-10:00", "09:00x0", "00:00,09:00"):
+        with pytest.raises(ValueError):
+            Util.expand_slots(spec)
+
+
+def test_a_whole_day_is_not_mixed_with_slots(prefix, day, caregiver, run, query):
+    assert run(caregiver, "upload_availability " + mdy(day)) == "Availability uploaded!\n"
+    assert run(caregiver, "upload_availability " + mdy(day) + " 09:00") == \
+        "Please enter a valid statement\nError: The whole day is already offered on " + mdy(day) + "\n"
+    assert query("SELECT SlotTime FROM Availabilities WHERE Username = %s", prefix + "_c") == [(Util.ALL_DAY,)]
+
+
+def test_slots_are_not_mixed_with_a_booked_whole_day(prefix, day, caregiver, run, new_session):
+    patient = new_session()
+    run(patient, "create_patient " + prefix + "_p " + PASSWORD)
+    run(patient, "login_patient " + prefix + "_p " + PASSWORD)
+    run(caregiver, "upload_availability " + mdy(day))
+    assert run(patient, "reserve " + mdy(day) + " " + prefix + "_vax").startswith("Appointment ID:")
+    # the whole day is booked, so its slot is gone, but the caregiver is still taken that day
+    assert "Error: The whole day is already offered on" in run(caregiver, "upload_availability " + mdy(day) + " 09:00")
+
+
+def test_a_whole_day_is_not_added_to_slots(prefix, day, caregiver, run):
+    run(caregiver, "upload_availability " + mdy(day) + " 09:00,10:00")
+    assert run(caregiver, "upload_availability " + mdy(day)) == \
+        "Please enter a valid statement\nError: Time-of-day slots are already offered on " + mdy(day) + "\n"
+
+
+def test_the_schema_rejects_mixed_slots(prefix, day, caregiver, run):
+    run(caregiver, "upload_availability " + mdy(day) + " 09:00")
+    cm = ConnectionManager()
+    try:
+        cursor = cm.create_connection().cursor()
+        with pytest.raises(DatabaseError, match="cannot be mixed"):
+            cursor.execute("INSERT INTO Availabilities (Time, Username) VALUES (%s, %s)", (day, prefix + "_c"))
+    finally:
+        cm.close_connection(discard=True)
+
+
+def test_every_output_format_shows_the_whole_day_the_same_way(prefix, day, caregiver, run, new_session):
+    patient = new_session()
+    run(patient, "create_patient " + prefix + "_p " + PASSWORD)
+    run(patient, "login_patient " + prefix + "_p " + PASSWORD)
+    run(caregiver, "upload_availability " + mdy(day))
+    assert run(patient, "search_caregiver_schedule " + mdy(day)).splitlines()[-1].endswith("all day")
+    run(patient, "reserve " + mdy(day) + " " + prefix + "_vax")
+
+    assert run(patient, "show_appointments").split()[3:5] == ["all", "day"]
+    assert run(patient, "show_appointments --csv").splitlines()[1].split(",")[3] == "all day"
+    assert json.loads(run(patient, "show_appointments --json"))["SlotTime"] == "all day"